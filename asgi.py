@@ -0,0 +1,30 @@
+"""
+ASGI config for mail project.
+
+It exposes the ASGI callable as a module-level variable named ``application``, e.g.
+
+	uvicorn asgi:application --workers 4
+
+The hot quote endpoints (see urls.async_urlpatterns) are served by their async views, everything else by the same
+Django (sync) app as wsgi.py, run in the thread pool.
+"""
+
+import os
+
+import django
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'settings')
+django.setup(set_prefix=False)
+
+from labs import asgi  # noqa: E402 (needs the apps loaded)
+from urls import async_urlpatterns  # noqa: E402
+
+try:
+	from django.core.asgi import get_asgi_application
+	django_application = get_asgi_application()
+except ImportError:
+	# Django < 3.0 has no ASGI handler of its own
+	from django.core.wsgi import get_wsgi_application
+	django_application = asgi.wsgi_to_asgi(get_wsgi_application())
+
+application = asgi.AsyncRouter(async_urlpatterns, fallback=django_application)
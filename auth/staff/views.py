@@ -1,4 +1,5 @@
 from labs.views import RetrieveUpdateAPIView, ListCreateAPIView, IdListAPIView, RetrieveAPIView
+from labs.views.batch import BatchAPIView
 from .permissions import StaffViewMixin, ManagerViewMixin
 from .serializers import StaffSerializer
 from ..staff.models import Staff
@@ -18,6 +19,11 @@ class StaffDetailView(StaffViewMixin, RetrieveAPIView):
 	serializer_class = StaffSerializer
 
 
+# Many API calls in one round trip, for any staff (each call checks its own permissions)
+class StaffBatchView(StaffViewMixin, BatchAPIView):
+	pass
+
+
 # --- Manager Only ----
 #
 class StaffListViewMixin(ManagerViewMixin):
@@ -0,0 +1,122 @@
+import re
+
+from django.db.models import Aggregate, Avg, Count, DateTimeField, Func, Max, Min, Sum
+from django.db.models.functions import Trunc
+
+from currency.texts import get_app_text as _t
+from labs.exceptions import ValidationError
+
+__author__ = 'chandanojha'
+
+# bucket unit vs. (date_trunc kind, seconds)
+BUCKET_UNITS = {
+	'm': ('minute', 60),
+	'h': ('hour', 60 * 60),
+	'd': ('day', 24 * 60 * 60),
+	'w': ('week', 7 * 24 * 60 * 60),
+}
+
+AGGREGATE_FIELDS = ('exchange_rate', 'bid_price', 'ask_price')
+
+_bucket_re = re.compile(r'^(\d+)([mhdw])$')
+
+
+class TimeBucket(Func):
+	"""
+	Floors the timestamp to a multiple of given seconds (since epoch), for widths that date_trunc can't do, like 15m
+	The value is cast to local 'timestamp' first (we run with USE_TZ=False) so that buckets align to the wall clock of
+	the connection timezone, same as date_trunc does
+	"""
+	output_field = DateTimeField()
+	template = "('epoch'::timestamp + floor(extract(epoch from %(expressions)s::timestamp) / %(seconds)s) * " \
+	           "%(seconds)s * interval '1 second')"
+
+	def __init__(self, expression, seconds, **extra):
+		super().__init__(expression, seconds=int(seconds), **extra)
+
+
+class _OrderedPick(Aggregate):
+	"""
+	Picks the value of the first row in the group as per given ordering, Postgres only
+	"""
+	template = '(ARRAY_AGG(%(expressions)s ORDER BY %(ordering)s))[1]'
+	ordering = None
+
+	def __init__(self, expression, order_by='last_refreshed', **extra):
+		super().__init__(expression, ordering=self.ordering.format(order_by), **extra)
+
+
+class First(_OrderedPick):
+	function = 'FIRST'
+	name = 'First'
+	ordering = '{0} ASC'
+
+
+class Last(_OrderedPick):
+	function = 'LAST'
+	name = 'Last'
+	ordering = '{0} DESC'
+
+
+AGGREGATES = {
+	'avg': Avg,
+	'min': Min,
+	'max': Max,
+	'sum': Sum,
+	'first': First,
+	'last': Last,
+	'count': Count,
+}
+
+
+def parse_duration(value):
+	"""
+	:param value: Duration as <n><unit> where unit is one of m(inute), h(our), d(ay) and w(eek), e.g. 15m or 1d
+	:return: (count, unit) e.g. (15, 'm'), None if invalid
+	"""
+	match = _bucket_re.match(value or '')
+	count = match and int(match.group(1))
+	return (count, match.group(2)) if count else None
+
+
+def duration_seconds(value):
+	""" :return: Seconds of a parse_duration() duration, None if invalid """
+	duration = parse_duration(value)
+	return duration and duration[0] * BUCKET_UNITS[duration[1]][1]
+
+
+def bucket_expression(bucket, field_name='last_refreshed'):
+	"""
+	:param bucket: Bucket width, see parse_duration()
+	:return: DB expression that maps 'field_name' to the start of its bucket
+	"""
+	duration = parse_duration(bucket)
+	if duration is None:
+		raise ValidationError(_t('invalid_bucket_{0}', bucket))
+
+	count, unit = duration
+	kind, seconds = BUCKET_UNITS[unit]
+	if count == 1:
+		return Trunc(field_name, kind, output_field=DateTimeField())
+	return TimeBucket(field_name, seconds * count)
+
+
+def aggregate_quotes(queryset, bucket, aggs, field_name='exchange_rate'):
+	"""
+	Groups the quotes per pair and time bucket inside the database
+
+	:param queryset: Filtered Currency queryset
+	:param bucket: Bucket width, see bucket_expression()
+	:param aggs: List of AGGREGATES keys to be computed on 'field_name'
+	:return: values() queryset with one row per pair and bucket, ordered by pair and bucket
+	"""
+	if field_name not in AGGREGATE_FIELDS:
+		raise ValidationError(_t('invalid_aggregate_field_{0}', field_name))
+
+	invalid = [a for a in aggs if a not in AGGREGATES]
+	if invalid or not aggs:
+		raise ValidationError(_t('invalid_aggregates_{0}', ', '.join(invalid)))
+
+	group_by = ('from_currency_code', 'to_currency_code', 'bucket')
+	return queryset.order_by().annotate(bucket=bucket_expression(bucket)).values(*group_by).annotate(
+		**{a: AGGREGATES[a]('id' if a == 'count' else field_name) for a in aggs}).order_by(*group_by)
@@ -0,0 +1,201 @@
+import bisect
+import logging
+import threading
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.mail import send_mass_mail
+from django.db import transaction
+from django.utils import timezone
+
+from currency.celery import app
+from currency.models import Currency, PriceAlert
+from currency.texts import get_app_text as _t
+from labs.batching import BatchQueue
+from labs.versions import bump_versions
+
+__author__ = 'chandanojha'
+
+logger = logging.getLogger(__name__)
+
+# ---
+# Price alerts: the active thresholds of each pair are kept sorted in memory (per process, built lazily per pair and
+# rebuilt when its alerts change, see version_key()) so that a new quote finds the alerts it crossed with two binary
+# searches between the pair's previous rate and the new one, whatever the number of alerts. The crossed ones are
+# queued to a BatchQueue that hands them to the send_alert_notifications task in batches
+#
+
+BATCH_SIZE = 500  # notifications per task
+FLUSH_INTERVAL = 1.0  # seconds a notification may wait for its batch to fill up
+
+
+def version_key(pair):
+	return 'currency:alerts:version:{0}/{1}'.format(*pair)
+
+
+class PairThresholds:
+	"""
+	Active alerts of a pair sorted by threshold (ties by id), as parallel lists
+	"""
+	def __init__(self, pair, version):
+		self.pair, self.version = pair, version
+		alerts = PriceAlert.objects.filter(
+			from_currency_code=pair[0], to_currency_code=pair[1], is_active=True).order_by('threshold', 'id')
+		rows = list(alerts.values_list('threshold', 'id', 'direction', 'repeat', 'user_id'))
+		self.thresholds = [r[0] for r in rows]
+		self.alerts = [r[1:] for r in rows]  # (id, direction, repeat, user_id)
+
+	def crossed(self, previous, rate):
+		"""
+		:return: (alert, direction) of the alerts crossed going from the 'previous' rate to 'rate', i.e. upwards with
+			previous < threshold <= rate, downwards with rate <= threshold < previous
+		"""
+		if rate > previous:
+			start, end = bisect.bisect_right(self.thresholds, previous), bisect.bisect_right(self.thresholds, rate)
+			direction = PriceAlert.ABOVE
+		elif rate < previous:
+			start, end = bisect.bisect_left(self.thresholds, rate), bisect.bisect_left(self.thresholds, previous)
+			direction = PriceAlert.BELOW
+		else:
+			return []
+		return [(i, direction) for i in range(start, end) if self.alerts[i][1] in (direction, PriceAlert.ANY)]
+
+	def remove(self, positions):
+		if positions:
+			dropped = set(positions)
+			self.thresholds = [t for i, t in enumerate(self.thresholds) if i not in dropped]
+			self.alerts = [a for i, a in enumerate(self.alerts) if i not in dropped]
+
+
+class AlertIndex:
+	"""
+	PairThresholds of the pairs quoted so far in the process
+	"""
+	def __init__(self):
+		self.pairs = {}
+		self._lock = threading.Lock()
+
+	def _thresholds(self, pair):
+		cache.add(version_key(pair), 0, timeout=None)
+		version = cache.get(version_key(pair))
+		thresholds = self.pairs.get(pair)
+		if thresholds is None or thresholds.version != version:
+			thresholds = self.pairs[pair] = PairThresholds(pair, version)
+		return thresholds
+
+	def crossed(self, quote):
+		"""
+		:return: Notifications (see notification()) of the alerts the quote crossed since the pair's previous quote,
+			none if it is not the pair's latest (back-filled). The one-off alerts stay in the index, see drop()
+		"""
+		pair = (quote.from_currency_code, quote.to_currency_code)
+		with self._lock:
+			if not self._thresholds(pair).thresholds:
+				return []  # most pairs have no alerts, spare them the query of the previous rate
+
+		latest = list(Currency.objects.filter(from_currency_code=pair[0], to_currency_code=pair[1]).order_by(
+			'-last_refreshed', '-id').values_list('id', 'exchange_rate')[:2])
+		if len(latest) < 2 or latest[0][0] != quote.pk:
+			return []
+
+		with self._lock:
+			thresholds = self._thresholds(pair)
+			crossed = thresholds.crossed(latest[1][1], quote.exchange_rate)
+			return [notification(quote, thresholds.thresholds[i], thresholds.alerts[i], direction)
+			        for i, direction in crossed]
+
+	def drop(self, pair, alert_ids):
+		"""
+		Drops the (one-off, triggered) alerts from the pair's thresholds, until the pair is rebuilt
+		"""
+		with self._lock:
+			thresholds = self.pairs.get(pair)
+			if thresholds is not None:
+				alert_ids = set(alert_ids)
+				thresholds.remove([i for i, alert in enumerate(thresholds.alerts) if alert[0] in alert_ids])
+
+
+def notification(quote, threshold, alert, direction):
+	alert_id, _, repeat, user_id = alert
+	return {
+		'alert_id': alert_id,
+		'user_id': user_id,
+		'pair': '{0}/{1}'.format(quote.from_currency_code, quote.to_currency_code),
+		'threshold': str(threshold),
+		'direction': direction,
+		'repeat': repeat,
+		'rate': str(quote.exchange_rate),
+		'quote_id': quote.pk,
+		'last_refreshed': quote.last_refreshed.isoformat(),
+	}
+
+
+alert_index = AlertIndex()
+
+
+@app.task
+def send_alert_notifications(notifications):
+	"""
+	Marks a batch of crossed alerts triggered (one-off ones inactive) and mails their users, over one connection.
+	Alerts deactivated meanwhile (triggered already, or by the user) are skipped
+	"""
+	now = timezone.now()
+	with transaction.atomic():
+		alerts = PriceAlert.objects.select_for_update().select_related('user').filter(
+			pk__in={n['alert_id'] for n in notifications}, is_active=True)
+		alerts = {alert.pk: alert for alert in alerts}
+		sent = []
+		for n in notifications:
+			alert = alerts.get(n['alert_id'])
+			if alert is None or not alert.is_active:
+				continue
+			alert.triggered_at, alert.triggered_rate = now, n['rate']
+			alert.is_active = alert.repeat
+			sent.append((alert, n))
+		# no signals, so no index rebuilds: the other processes may still find the deactivated ones, to be skipped here
+		PriceAlert.objects.bulk_update([a for a, _ in sent], ('triggered_at', 'triggered_rate', 'is_active'))
+
+	messages = [(_t('alert_subject_{0}_{1}_{2}', n['pair'], n['direction'], n['threshold']),
+	             _t('alert_message_{0}_{1}_{2}_{3}_{4}', n['pair'], n['direction'], n['threshold'], n['rate'],
+	                n['last_refreshed']),
+	             settings.DEFAULT_FROM_EMAIL, [alert.user.email]) for alert, n in sent if alert.user.email]
+	if messages:
+		send_mass_mail(messages, fail_silently=True)
+	return len(sent)
+
+
+dispatcher = BatchQueue(lambda batch: send_alert_notifications.delay(batch), max_batch=BATCH_SIZE,
+                        interval=FLUSH_INTERVAL, name='currency-alerts')
+
+
+def bump_pair_versions(pairs):
+	bump_versions(*map(version_key, pairs))
+
+
+def alert_changed(sender, instance, **kwargs):
+	"""
+	post_save/post_delete receiver of PriceAlert, the processes rebuild the pair's thresholds once committed
+	"""
+	pair = (instance.from_currency_code, instance.to_currency_code)
+	transaction.on_commit(lambda: bump_pair_versions([pair]))
+
+
+def dispatch(pair, notifications):
+	alert_index.drop(pair, [n['alert_id'] for n in notifications if not n['repeat']])
+	for n in notifications:
+		dispatcher.put(n)
+
+
+def check_alerts(sender, quote, **kwargs):
+	"""
+	quote_ingested receiver, the crossed alerts are notified (and the one-off ones dropped) once the quote is committed
+	"""
+	try:
+		notifications = alert_index.crossed(quote)
+	except Exception as e:
+		# Never fail the ingestion for it
+		logger.warning("Could not check the alerts of quote {0}: {1}".format(quote.pk, e))
+		return
+	if notifications:
+		pair = (quote.from_currency_code, quote.to_currency_code)
+		transaction.on_commit(lambda: dispatch(pair, notifications))
@@ -6,3 +6,24 @@ class CurrencyConfig(AppConfig):
 	
 	def ready(self):
 		import currency.celery
+		from django.db.models.signals import post_delete, post_save
+		from currency import alerts, arbitrage, asof, correlation, cross, snapshot, stats, stream, webhooks
+		from currency.models import PriceAlert, WebhookSubscription
+		from currency.signals import quote_ingested
+		
+		quote_ingested.connect(stream.publish_quote, dispatch_uid='currency.stream.publish_quote')
+		quote_ingested.connect(snapshot.refresh_snapshot, dispatch_uid='currency.snapshot.refresh_snapshot')
+		quote_ingested.connect(cross.invalidate_pivot_rates, dispatch_uid='currency.cross.invalidate_pivot_rates')
+		quote_ingested.connect(arbitrage.check_ingested_quote, dispatch_uid='currency.arbitrage.check_ingested_quote')
+		quote_ingested.connect(asof.bump_pair_version, dispatch_uid='currency.asof.bump_pair_version')
+		quote_ingested.connect(stats.bump_version, dispatch_uid='currency.stats.bump_version')
+		quote_ingested.connect(correlation.invalidate_correlation, dispatch_uid='currency.correlation.invalidate_correlation')
+		quote_ingested.connect(alerts.check_alerts, dispatch_uid='currency.alerts.check_alerts')
+		quote_ingested.connect(webhooks.queue_quote, dispatch_uid='currency.webhooks.queue_quote')
+		
+		post_save.connect(alerts.alert_changed, sender=PriceAlert, dispatch_uid='currency.alerts.alert_saved')
+		post_delete.connect(alerts.alert_changed, sender=PriceAlert, dispatch_uid='currency.alerts.alert_deleted')
+		post_save.connect(webhooks.subscription_changed, sender=WebhookSubscription,
+		                  dispatch_uid='currency.webhooks.subscription_saved')
+		post_delete.connect(webhooks.subscription_changed, sender=WebhookSubscription,
+		                    dispatch_uid='currency.webhooks.subscription_deleted')
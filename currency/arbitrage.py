@@ -0,0 +1,306 @@
+import logging
+import math
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+
+from currency.celery import app
+from currency.models import Currency, latest_quotes
+from labs.locks import CacheLock
+
+__author__ = 'chandanojha'
+
+try:
+	import numpy as np
+except ImportError:
+	np = None
+
+logger = logging.getLogger(__name__)
+
+# ---
+# Inconsistent (arbitrage) cycles among the latest quotes, e.g. EUR/USD x USD/JPY x JPY/EUR noticeably off 1, which
+# mostly means a stale or bad quote. Rates are edges of a graph weighted by their log, so a cycle whose rates multiply
+# to more than 1 is one of positive total weight, searched with a bounded Bellman-Ford (max, +) over the dense weight
+# matrix. On ingest only the cycles through the new quote's pair are searched (check_new_quote task, once committed),
+# a full scan is done on a cold start
+#
+
+MIN_PROFIT = getattr(settings, 'QUOTE_INCONSISTENCY_THRESHOLD', 0.001)  # relative, rates off by less are just noise
+MAX_CYCLE_LENGTH = 4  # edges, i.e. currencies in a cycle
+
+STATE_KEY = 'currency:arbitrage:state'  # latest rate of every pair and the cycles found among them
+LOCK_KEY = 'currency:arbitrage:lock'
+LOCK_TIMEOUT = 30  # seconds
+LOCK_WAIT = 1  # seconds an ingest check waits for its turn, before retrying later
+RETRY_DELAY = 1  # seconds
+
+
+class RateGraph:
+	"""
+	Currencies as nodes and the latest mid rates as edges weighted by log(rate), a quote of A/B giving both A->B
+	(log rate) and B->A (-log rate). If a pair is quoted both ways, each direction takes the larger of the two
+
+	Cycles are reported per edge: for each edge and cycle length (2 to max_length) the best cycle taking that edge, if
+	over the threshold. So a bad quote shows up in (at least) the worst cycle it makes
+	"""
+	def __init__(self, quotes, max_length=MAX_CYCLE_LENGTH):
+		"""
+		:param quotes: {(from_currency_code, to_currency_code): (exchange_rate, quote_id, last_refreshed)}
+		"""
+		self.max_length = max_length
+		pairs = [pair for pair, (rate, _, _) in quotes.items() if pair[0] != pair[1] and rate > 0]
+		self.codes = sorted({code for pair in pairs for code in pair})
+		self.index = {code: i for i, code in enumerate(self.codes)}
+
+		rows = [self.index[a] for a, _ in pairs]
+		columns = [self.index[b] for _, b in pairs]
+		weights = [math.log(quotes[pair][0]) for pair in pairs]
+		quote_ids = [quotes[pair][1] for pair in pairs]
+		if np is not None:
+			self._init_matrix(rows, columns, weights, quote_ids)
+		else:
+			self._init_adjacency(rows, columns, weights, quote_ids)
+
+	def _init_matrix(self, rows, columns, weights, quote_ids):
+		n = len(self.codes)
+		rows, columns = np.array(rows + columns, dtype=np.int64), np.array(columns + rows, dtype=np.int64)
+		weights = np.array(weights + [-w for w in weights])
+		self.weights = np.full((n, n), -np.inf)
+		np.maximum.at(self.weights, (rows, columns), weights)
+		self.quote_ids = np.zeros((n, n), dtype=np.int64)
+		larger = weights == self.weights[rows, columns]
+		self.quote_ids[rows[larger], columns[larger]] = np.array(quote_ids * 2, dtype=np.int64)[larger]
+		self.weights_into = np.ascontiguousarray(self.weights.T)
+
+	def _init_adjacency(self, rows, columns, weights, quote_ids):
+		self.edges = {}  # (i, j): (weight, quote_id)
+		for i, j, weight, quote_id in zip(rows, columns, weights, quote_ids):
+			for edge, w in (((i, j), weight), ((j, i), -weight)):
+				if edge not in self.edges or w > self.edges[edge][0]:
+					self.edges[edge] = (w, quote_id)
+		self.adjacency = [[] for _ in self.codes]
+		for (i, j), (w, _) in self.edges.items():
+			self.adjacency[i].append((j, w))
+
+	def has_edge(self, i, j):
+		return self.weights[i, j] > -np.inf if np is not None else (i, j) in self.edges
+
+	def weight(self, cycle):
+		if np is not None:
+			return float(self.weights[cycle[:-1], cycle[1:]].sum())
+		return sum(self.edges[edge][0] for edge in zip(cycle, cycle[1:]))
+
+	def edge_quote_ids(self, cycle):
+		if np is not None:
+			return self.quote_ids[cycle[:-1], cycle[1:]].tolist()
+		return [self.edges[edge][1] for edge in zip(cycle, cycle[1:])]
+
+	def _step(self, values):
+		"""
+		One Bellman-Ford round in (max, +): best value of reaching each node with one more edge, and where from
+		"""
+		if np is not None:
+			candidates = values + self.weights_into  # row per node, of the values of reaching it from each node
+			came_from = candidates.argmax(axis=1)
+			return candidates[np.arange(len(came_from)), came_from], came_from
+
+		best, came_from = [-math.inf] * len(values), [0] * len(values)
+		for i, value in enumerate(values):
+			if value == -math.inf:
+				continue
+			for j, w in self.adjacency[i]:
+				if value + w > best[j]:
+					best[j], came_from[j] = value + w, i
+		return best, came_from
+
+	def edge_walks(self, start, first, min_weight=0.0):
+		"""
+		Best closed walk taking the edge start->first back to 'start', of each length up to max_length
+
+		:return: List of the walks weighing over 'min_weight', each a list of nodes starting and ending with 'start'
+		"""
+		values = np.full(len(self.codes), -np.inf) if np is not None else [-math.inf] * len(self.codes)
+		values[first] = self.weight([start, first])
+
+		walks, history = [], []
+		for _ in range(self.max_length - 1):
+			values, came_from = self._step(values)
+			history.append(came_from)
+			if values[start] > min_weight:
+				walk, node = [start], start
+				for came_from in reversed(history):
+					node = int(came_from[node])
+					walk.append(node)
+				walks.append([start] + walk[::-1])
+		return walks
+
+	def all_edge_walks(self, min_weight=0.0):
+		"""
+		edge_walks() of every edge at once: best walks b->a of k edges for all (a, b) by (max, +) matrix products of
+		the weights, closed by the edge a->b
+
+		:return: List of the walks weighing over 'min_weight'
+		"""
+		n = len(self.codes)
+		paths, vias = [self.weights], [None]  # k+1 edges: best weight of a->b, and the node before b
+		for _ in range(self.max_length - 2):
+			best, via = np.full((n, n), -np.inf), np.zeros((n, n), dtype=np.int64)
+			for m in range(n):
+				candidates = paths[-1][:, m, None] + self.weights[m]  # a->m->b
+				better = candidates > best
+				best[better], via[better] = candidates[better], m
+			paths.append(best)
+			vias.append(via)
+
+		walks = []
+		for k, path in enumerate(paths):
+			for a, b in np.argwhere(self.weights + path.T > min_weight).tolist():
+				walk, node = [a], a
+				for via in reversed(vias[1:k + 1]):
+					node = int(via[b, node])
+					walk.append(node)
+				walks.append([a, b] + walk[:0:-1] + [a])
+		return walks
+
+	def cycles(self, walk, min_weight=0.0):
+		"""
+		:return: Simple cycles the closed 'walk' is made of (a best walk may go round a profitable cycle that does not
+			pass through its start), the ones weighing over 'min_weight' as lists of nodes
+		"""
+		ret, stack = [], []
+		for node in walk:
+			if node in stack:
+				i = stack.index(node)
+				cycle = stack[i:] + [node]
+				del stack[i + 1:]
+				if self.weight(cycle) > min_weight:
+					ret.append(cycle)
+			else:
+				stack.append(node)
+		return ret
+
+	def describe(self, cycle):
+		"""
+		:return: The cycle as {"currencies": [...], "profit": ..., "quote_ids": [...]} rotated to start with its
+			smallest currency code (so that each cycle has one key), 'profit' being the relative excess of the product
+			of its rates over 1 and 'quote_ids' the quotes of its edges
+		"""
+		nodes = cycle[:-1]
+		first = nodes.index(min(nodes))
+		nodes = nodes[first:] + nodes[:first]
+		cycle = nodes + nodes[:1]
+		return {
+			'currencies': [self.codes[i] for i in cycle],
+			'profit': round(math.expm1(self.weight(cycle)), 10),
+			'quote_ids': self.edge_quote_ids(cycle),
+		}
+
+	def find(self, pairs=None, min_profit=MIN_PROFIT):
+		"""
+		:param pairs: Find only the cycles through these (from, to) pairs (either direction), all if None
+		:return: {key: describe()'d cycle} of the cycles found, the key being its currencies as a tuple
+		"""
+		min_weight = math.log1p(min_profit)
+		if pairs is None and np is not None:
+			walks = self.all_edge_walks(min_weight)
+		else:
+			if pairs is None:
+				edges = list(self.edges)
+			else:
+				edges = [(self.index[a], self.index[b]) for pair in pairs for a, b in (pair, pair[::-1])
+				         if a in self.index and b in self.index]
+			walks = [w for i, j in edges if self.has_edge(i, j) for w in self.edge_walks(i, j, min_weight)]
+
+		found = {}
+		for walk in walks:
+			for cycle in self.cycles(walk, min_weight):
+				cycle = self.describe(cycle)
+				found[tuple(cycle['currencies'])] = cycle
+		return found
+
+
+def _quote_state(quote):
+	return float(quote.exchange_rate), quote.pk, quote.last_refreshed
+
+
+def scan(min_profit=MIN_PROFIT):
+	"""
+	Full scan of the latest quotes (one query), stores and returns the state (see STATE_KEY). Updates take turns on a
+	cache lock, if it can't be had the state is returned without being stored
+	"""
+	with CacheLock(LOCK_KEY, LOCK_TIMEOUT, wait=LOCK_TIMEOUT) as acquired:
+		return _scan(min_profit, store=acquired)
+
+
+def _scan(min_profit=MIN_PROFIT, store=True):
+	quotes = {(q.from_currency_code, q.to_currency_code): _quote_state(q) for q in latest_quotes()}
+	state = {'quotes': quotes, 'cycles': RateGraph(quotes).find(min_profit=min_profit), 'checked_at': timezone.now()}
+	if store:
+		cache.set(STATE_KEY, state, timeout=None)
+	return state
+
+
+def get_state():
+	return cache.get(STATE_KEY) or scan()
+
+
+def check_quote(quote, wait=LOCK_WAIT):
+	"""
+	Updates the graph with a new quote and searches the cycles through its pair only, the ones found earlier on
+	the pair's previous quote are dropped (they are found again if still there)
+
+	:return: The state (see STATE_KEY), None if the lock was not had within 'wait'
+	"""
+	with CacheLock(LOCK_KEY, LOCK_TIMEOUT, wait) as acquired:
+		if not acquired:
+			return None
+		state = cache.get(STATE_KEY)
+		if state is None:
+			return _scan()  # reads the new quote anyway
+
+		pair = (quote.from_currency_code, quote.to_currency_code)
+		previous = state['quotes'].get(pair)
+		if previous is not None and (previous[2], previous[1]) >= (quote.last_refreshed, quote.pk):
+			return state  # an older quote, the latest one stands
+
+		state['quotes'][pair] = _quote_state(quote)
+		if previous is not None:
+			state['cycles'] = {k: c for k, c in state['cycles'].items() if previous[1] not in c['quote_ids']}
+		state['cycles'].update(RateGraph(state['quotes']).find([pair]))
+		state['checked_at'] = timezone.now()
+		cache.set(STATE_KEY, state, timeout=None)
+		return state
+
+
+@app.task(bind=True, max_retries=LOCK_TIMEOUT // RETRY_DELAY)
+def check_new_quote(self, quote_id):
+	"""
+	check_quote() of an ingested quote, retried later while another update holds the lock. Logs the inconsistent
+	cycles the quote is in
+	"""
+	quote = Currency.objects.filter(pk=quote_id).first()
+	if quote is None:
+		return 0
+	state = check_quote(quote)
+	if state is None:
+		raise self.retry(countdown=RETRY_DELAY)
+
+	cycles = [c for c in state['cycles'].values() if quote.pk in c['quote_ids']]
+	for cycle in cycles:
+		logger.warning("Inconsistent rates {0}, off by {1:.4%}".format('/'.join(cycle['currencies']), cycle['profit']))
+	return len(cycles)
+
+
+def check_ingested_quote(sender, quote, **kwargs):
+	"""
+	quote_ingested receiver, the check is queued once committed so the ingest never waits on it
+	"""
+	def check():
+		try:
+			check_new_quote.delay(quote.pk)
+		except Exception as e:
+			# Never fail the ingestion for it, the next ingest (or scan) catches up
+			logger.warning("Could not queue the check of quote {0} for inconsistent rates: {1}".format(quote.pk, e))
+	transaction.on_commit(check)
@@ -0,0 +1,165 @@
+import bisect
+import datetime
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from currency.models import Currency, quote_changes
+from labs.versions import bump_versions
+
+__author__ = 'chandanojha'
+
+try:
+	import numpy as np
+except ImportError:
+	np = None
+
+# ---
+# Point-in-time ("as of") rates: the quote of a pair in effect at a given time is the latest one refreshed at or
+# before it. Each pair's history is loaded once (lazily) into time sorted arrays and kept in memory per process, LRU
+# evicted by rows, then a lookup is a binary search. Ingests bump a per-pair version in the shared cache so that the
+# processes fetch only the new quotes of that pair, on their next lookup of it
+#
+
+MAX_ROWS = getattr(settings, 'QUOTE_ASOF_CACHE_ROWS', 1000000)  # quotes kept in memory per process, of all pairs
+MAX_PAIRS = 10000  # histories kept, empty ones (of unknown pairs) included
+
+FIELDS = ('id', 'last_refreshed', 'exchange_rate', 'bid_price', 'ask_price')
+
+
+def version_key(pair):
+	return 'currency:asof:version:{0}/{1}'.format(*pair)
+
+
+class PairHistory:
+	"""
+	Quotes of a pair ordered by (last_refreshed, id) as 'rows' (FIELDS tuples) and their times as a sorted array
+	"""
+	def __init__(self, pair):
+		self.pair = pair
+		self.rows, self.times = [], _time_array([])
+		self.cursor = 0  # quotes up to this id are all in
+		self.version = None  # of the pair, see version_key(), as of the last fetch
+		self.lock = threading.Lock()  # held over a fetch (which may re-sort the history) and the lookups
+
+	def fetch(self, version):
+		"""
+		Fetches the quotes of the pair added since the last fetch, only the settled ones (see quote_changes()) so that
+		the cursor never skips a quote committed late. If some are held back the version is not taken as seen, for
+		the next lookup to fetch again
+		"""
+		queryset = Currency.objects.filter(from_currency_code=self.pair[0], to_currency_code=self.pair[1])
+		rows = quote_changes(self.cursor, limit=None, queryset=queryset.values_list(*FIELDS))
+		if rows:
+			self.cursor = rows[-1][0]
+			rows.sort(key=lambda r: (r[1], r[0]))
+			if self.rows and (rows[0][1], rows[0][0]) < (self.rows[-1][1], self.rows[-1][0]):
+				self.rows = sorted(self.rows + rows, key=lambda r: (r[1], r[0]))  # back-filled, older than the last
+				self.times = _time_array([r[1] for r in self.rows])
+			else:
+				self.rows += rows
+				self.times = _concat(self.times, _time_array([r[1] for r in rows]))
+
+		held_back = queryset.filter(pk__gt=self.cursor).exists()
+		self.version = None if held_back else version
+		return len(rows)
+
+	def lookup(self, times):
+		"""
+		:param times: List of (naive) datetimes
+		:return: Row in effect at each time, None if before the first quote
+		"""
+		if np is not None:
+			positions = np.searchsorted(self.times, _time_array(times), side='right').tolist()
+		else:
+			positions = [bisect.bisect_right(self.times, t) for t in times]
+		return [self.rows[p - 1] if p else None for p in positions]
+
+
+def _time_array(times):
+	if np is None:
+		return list(times)
+	# numpy parses ISO strings several times faster than it converts datetime objects
+	return np.array(list(map(datetime.datetime.isoformat, times)), dtype='datetime64[us]')
+
+
+def _concat(a, b):
+	return np.concatenate((a, b)) if np is not None else a + b
+
+
+class AsOfRates:
+	"""
+	PairHistory of the pairs looked up, least recently used ones are evicted once over 'max_rows' (or 'max_pairs')
+
+	The process-wide lock guards the LRU bookkeeping only, a fetch holds just its pair's lock so that a cold (or
+	large) pair does not hold up the lookups of the others
+	"""
+	def __init__(self, max_rows=MAX_ROWS, max_pairs=MAX_PAIRS):
+		self.max_rows, self.max_pairs = max_rows, max_pairs
+		self.histories = OrderedDict()
+		self.rows = 0
+		self._lock = threading.Lock()
+
+	def lookup(self, pairs, times):
+		"""
+		:param pairs: (from_currency_code, to_currency_code) of each query
+		:param times: Datetime of each query
+		:return: Row (FIELDS) of the quote in effect for each query, None if there is none
+		"""
+		queries = {}
+		for i, pair in enumerate(pairs):
+			queries.setdefault(pair, []).append(i)
+
+		keys = [version_key(pair) for pair in queries]
+		versions = cache.get_many(keys)
+		for key in keys:
+			if key not in versions:
+				cache.add(key, 0, timeout=None)
+				versions[key] = cache.get(key)
+
+		results = [None] * len(pairs)
+		for pair, items in queries.items():
+			history, version, added = self._history(pair), versions[version_key(pair)], 0
+			with history.lock:
+				if history.version is None or history.version != version:
+					added = history.fetch(version)
+				rows = history.lookup([times[i] for i in items])
+			if added:
+				self._added(history, added)
+			for i, row in zip(items, rows):
+				results[i] = row
+		return results
+
+	def _history(self, pair):
+		"""
+		:return: PairHistory of the pair, made the most recently used
+		"""
+		with self._lock:
+			history = self.histories.get(pair)
+			if history is None:
+				history = self.histories[pair] = PairHistory(pair)
+			self.histories.move_to_end(pair)
+			return history
+
+	def _added(self, history, rows):
+		""" Counts the rows fetched into the history (unless evicted meanwhile) and evicts the least recently used """
+		with self._lock:
+			if self.histories.get(history.pair) is history:
+				self.rows += rows
+			while (self.rows > self.max_rows or len(self.histories) > self.max_pairs) and len(self.histories) > 1:
+				_, evicted = self.histories.popitem(last=False)
+				self.rows -= len(evicted.rows)
+
+
+asof_rates = AsOfRates()
+
+
+def bump_pair_version(sender, quote, **kwargs):
+	"""
+	quote_ingested receiver, once committed so that the fetches see the quote
+	"""
+	key = version_key((quote.from_currency_code, quote.to_currency_code))
+	transaction.on_commit(lambda: bump_versions(key))
@@ -0,0 +1,68 @@
+from asgiref.sync import sync_to_async
+from rest_framework.response import Response
+
+from auth.staff.permissions import StaffViewMixin
+from currency.main import get_price_async
+from currency.models import Currency
+from currency.serializers import CurrencySerializer
+from currency.stream import quote_events_async
+from currency.views import (CurrencyFilter, CurrencyLatestView, STREAM_HEADERS, is_async_request, queue_quote_job,
+                            requested_latest_quotes, stream_params)
+from labs.asgi import AsyncAPIView, database_sync_to_async
+from labs.exceptions import ValidationError
+
+__author__ = 'chandanojha'
+
+
+# ---
+# Async versions of the hot quote endpoints, served by asgi.py (see currency.urls.async_urlpatterns). Same
+# parameters, permissions and responses as their sync views in currency.views, which remain in place for WSGI
+#
+
+class AsyncCurrencyView(StaffViewMixin, AsyncAPIView):
+	"""
+	POST of CurrencyView, the upstream call is awaited instead of holding a worker thread. The list (GET) stays on
+	the sync view
+	"""
+	model_class = Currency
+
+	async def post(self, request, **kwargs):
+		serializer = CurrencySerializer(data=request.data)
+		await database_sync_to_async(serializer.is_valid)(raise_exception=True)
+		from_currency = serializer.validated_data['from_currency_code']
+		to_currency = serializer.validated_data['to_currency_code']
+
+		if is_async_request(request):
+			return await sync_to_async(queue_quote_job, thread_sensitive=False)(from_currency, to_currency, request)
+
+		quote = await get_price_async(from_currency, to_currency)
+		return Response(data=CurrencySerializer(quote).data)
+
+
+class AsyncCurrencyLatestView(StaffViewMixin, AsyncAPIView):
+	""" CurrencyLatestView """
+	model_class = Currency
+	max_pairs = CurrencyLatestView.max_pairs
+
+	async def get(self, request, **kwargs):
+		return Response(await database_sync_to_async(self.latest_quotes)(request))
+
+	def latest_quotes(self, request):
+		filterset = CurrencyFilter(request.query_params, queryset=Currency.objects.all())
+		if not filterset.is_valid():
+			raise ValidationError(detail=filterset.errors)
+
+		quotes = requested_latest_quotes(request, filterset.qs, self.max_pairs)
+		return CurrencySerializer(quotes, many=True).data
+
+
+class AsyncCurrencyStreamView(StaffViewMixin, AsyncAPIView):
+	"""
+	CurrencyStreamView, each stream is a coroutine waiting on the pub/sub fan-out instead of a thread, so a process
+	can hold thousands of them
+	"""
+	model_class = Currency
+
+	async def get(self, request, **kwargs):
+		events = quote_events_async(*stream_params(request))
+		await self.stream(events, content_type='text/event-stream', headers=STREAM_HEADERS)
@@ -0,0 +1,284 @@
+from decimal import ROUND_DOWN, ROUND_HALF_EVEN, ROUND_HALF_UP, ROUND_UP, Decimal, InvalidOperation
+
+from django.utils.dateparse import parse_datetime
+
+from currency.models import latest_quotes, rate_history
+from currency.texts import get_app_text as _t
+from currency.utils import naive_time
+from labs.exceptions import ValidationError
+
+__author__ = 'chandanojha'
+
+try:
+	import numpy as np
+except ImportError:
+	np = None
+
+ROUNDING = {
+	'half_even': ROUND_HALF_EVEN,
+	'half_up': ROUND_HALF_UP,
+	'down': ROUND_DOWN,  # towards zero
+	'up': ROUND_UP,  # away from zero
+}
+MAX_PLACES = 10  # as stored, see Currency.exchange_rate
+MAX_ITEMS = 1000000
+
+# float64 error bound of amount * rate * 10^places, relative (4 roundings of at most 2^-53 each, with a margin)
+_FLOAT_TOLERANCE = 1e-15
+_FLOAT_EXACT_LIMIT = 2 ** 52  # above it floats are not even exact integers
+
+
+# ---
+# Batch conversion: rates are resolved once per pair (and as-of time) and the amounts converted with array math,
+# rounding is exact i.e. same as Decimal's quantize() of amount * rate
+#
+
+class ConversionResult:
+	"""
+	Converted amounts (formatted with exactly 'places' decimals) and rates used, per item in the given order, None
+	for the items without a rate in 'errors' as (index, message)
+	"""
+	def __init__(self, converted, rates, errors):
+		self.converted = converted
+		self.rates = rates
+		self.errors = errors
+
+
+ITEM_FIELDS = ('amount', 'from', 'to', 'as_of')
+
+
+def item_columns(data):
+	"""
+	:param data: Items as a list of objects (or {"items": [...]}), or column-wise as {"data": {"amount": [...], ...}}
+		like the columnar renderer or the CSV parser give
+	:return: (amounts, from_codes, to_codes, as_of) lists, as_of being None if not given at all
+	"""
+	if isinstance(data, dict) and isinstance(data.get('data'), dict):
+		columns = data['data']
+	else:
+		items = data.get('items') if isinstance(data, dict) else data
+		if not isinstance(items, list) or not all(isinstance(item, dict) for item in items):
+			raise ValidationError(_t('invalid_conversion_items'))
+		columns = {f: [item.get(f) for item in items] for f in ITEM_FIELDS if any(f in item for item in items)}
+
+	for field in ITEM_FIELDS[:3]:
+		if not isinstance(columns.get(field), list):
+			raise ValidationError(_t('missing_column_{0}', field))
+	return columns['amount'], columns['from'], columns['to'], columns.get('as_of')
+
+
+def _parse_amount(amount, index):
+	try:
+		value = Decimal(str(amount))
+	except InvalidOperation:
+		value = None
+	if value is None or not value.is_finite():
+		raise ValidationError(_t('invalid_amount_{0}_{1}', index, amount))
+	return value
+
+
+def _parse_as_of(as_of, index):
+	value = parse_datetime(as_of) if isinstance(as_of, str) else None
+	if value is None:
+		raise ValidationError(_t('invalid_as_of_{0}_{1}', index, as_of))
+	return naive_time(value)
+
+
+class _Interned(dict):
+	""" Sequence number of each distinct key, in the order first seen """
+	def __missing__(self, key):
+		value = self[key] = len(self)
+		return value
+
+
+class CurrencyCodes(dict):
+	""" Normalized (upper-cased) code of each distinct raw code, so that a batch normalizes only a few strings """
+	def __missing__(self, key):
+		value = self[key] = str(key).strip().upper()
+		return value
+
+
+def resolve_rates(from_codes, to_codes, as_of=None):
+	"""
+	Rate for each item: the latest one, or the one in effect at its 'as_of' time. Same currency converts at 1
+
+	:param as_of: List of datetime (or None for latest) per item, None for all latest
+	:return: (rates, index) where 'rates' are the distinct Decimal rates found and 'index' is the position of each
+		item's rate in it, -1 if there is none
+	"""
+	pair_ids = _Interned()
+	item_pairs = list(map(pair_ids.__getitem__, zip(from_codes, to_codes)))
+	pairs = list(pair_ids)
+
+	rates = [Decimal(1)]
+	pair_rates = [0 if from_code == to_code else -1 for from_code, to_code in pairs]
+	if as_of is None:
+		latest = [pair for pair, r in zip(pairs, pair_rates) if r < 0]
+	else:
+		latest = {pairs[p] for p, t in zip(item_pairs, as_of) if t is None and pair_rates[p] < 0}
+	for quote in latest_quotes(list(latest)):
+		rates.append(quote.exchange_rate)
+		pair_rates[pair_ids[(quote.from_currency_code, quote.to_currency_code)]] = len(rates) - 1
+	index = list(map(pair_rates.__getitem__, item_pairs))
+	if as_of is None:
+		return rates, index
+
+	timed = {}
+	for i, (p, t) in enumerate(zip(item_pairs, as_of)):
+		if t is not None and pair_rates[p] != 0:
+			timed.setdefault(pairs[p], []).append(i)
+			index[i] = -1
+
+	for pair, items in timed.items():
+		times = [as_of[i] for i in items]
+		history = list(rate_history(*pair, start=min(times), end=max(times)))
+		if not history:
+			continue
+		offset = len(rates)
+		rates.extend(rate for _, rate in history)
+		refreshed = [t for t, _ in history]
+		for i, position in zip(items, _bisect_right(refreshed, times)):
+			if position:
+				index[i] = offset + position - 1
+	return rates, index
+
+
+def _bisect_right(sorted_values, values):
+	if np is not None:
+		return np.searchsorted(np.array(sorted_values, dtype='datetime64[us]'),
+		                       np.array(values, dtype='datetime64[us]'), side='right').tolist()
+	import bisect
+	return [bisect.bisect_right(sorted_values, v) for v in values]
+
+
+def convert_batch(amounts, from_codes, to_codes, as_of=None, places=2, rounding='half_even'):
+	"""
+	:param amounts: List of amounts (str, int or float, as in the request), strings are taken as exact decimals
+	:param from_codes: List of currency codes, one per amount
+	:param to_codes: List of currency codes, one per amount
+	:param as_of: Optional list of ISO datetime strings (None/empty for latest) per amount
+	:param places: Decimal places of the converted amounts
+	:param rounding: One of ROUNDING keys
+	:return: ConversionResult
+	"""
+	count = len(amounts)
+	if count > MAX_ITEMS:
+		raise ValidationError(_t('too_many_items_{0}', MAX_ITEMS))
+	if len(from_codes) != count or len(to_codes) != count or (as_of is not None and len(as_of) != count):
+		raise ValidationError(_t('conversion_columns_mismatch'))
+	check_rounding(places, rounding)
+
+	codes = CurrencyCodes()
+	try:
+		from_codes, to_codes = list(map(codes.__getitem__, from_codes)), list(map(codes.__getitem__, to_codes))
+	except TypeError:
+		raise ValidationError(_t('invalid_conversion_items'))
+	if as_of is not None:
+		as_of = [_parse_as_of(t, i) if t else None for i, t in enumerate(as_of)]
+	rates, index = resolve_rates(from_codes, to_codes, as_of)
+
+	converted = convert_amounts(amounts, rates, index, places, rounding)
+
+	rate_strings = [str(r) for r in rates]
+	errors = [(i, _t('no_rate_{0}_{1}', from_codes[i], to_codes[i])) for i, r in enumerate(index) if r < 0]
+	return ConversionResult(converted, [rate_strings[r] if r >= 0 else None for r in index], errors)
+
+
+def parse_places(places):
+	"""
+	:return: The places option (an int, or a string of one e.g. as a query param) as an int, 2.7 or '2.7' are rejected
+	"""
+	if isinstance(places, str) and places.strip().lstrip('-').isdigit():
+		return int(places)
+	if isinstance(places, int) and not isinstance(places, bool):
+		return places
+	raise ValidationError(_t('invalid_places_{0}', places))
+
+
+def check_rounding(places, rounding):
+	if not isinstance(rounding, str) or rounding not in ROUNDING:
+		raise ValidationError(_t('invalid_rounding_{0}', rounding))
+	if not isinstance(places, int) or not 0 <= places <= MAX_PLACES:
+		raise ValidationError(_t('invalid_places_{0}', places))
+
+
+def convert_amounts(amounts, rates, index, places=2, rounding='half_even'):
+	"""
+	:param amounts: List of amounts, see convert_batch()
+	:param rates: List of Decimal rates
+	:param index: Position in 'rates' of each amount's rate, -1 if it has none
+	:return: List of the converted amounts as strings with exactly 'places' decimals, None for the ones without a rate
+	"""
+	convert = _convert_arrays if np is not None else _convert_decimals
+	return convert(amounts, rates, index, places, rounding)
+
+
+def _exact(amount, rate, exponent, rounding):
+	value = (amount * rate).quantize(exponent, rounding=rounding)
+	return str(value if value else abs(value))  # no '-0.00'
+
+
+def _convert_decimals(amounts, rates, index, places, rounding):
+	exponent, rounding = Decimal(1).scaleb(-places), ROUNDING[rounding]
+	return [_exact(_parse_amount(a, i), rates[r], exponent, rounding) if r >= 0 else None
+	        for i, (a, r) in enumerate(zip(amounts, index))]
+
+
+_FRACTION_TABLE_PLACES = 4
+
+
+def _format_units(units, places):
+	""" Integer units (amount * 10^places) as decimal strings, the hot loop is a str() and a concatenation per item """
+	if not places:
+		return [str(u) for u in units.tolist()]
+
+	whole, fraction = np.divmod(np.abs(units), 10 ** places)
+	if places <= _FRACTION_TABLE_PLACES:
+		table = ['.{0:0{1}d}'.format(f, places) for f in range(10 ** places)]
+		fractions = map(table.__getitem__, fraction.tolist())
+	else:
+		fractions = ('.{0:0{1}d}'.format(f, places) for f in fraction.tolist())
+	converted = list(map(str.__add__, map(str, whole.tolist()), fractions))
+
+	for i in np.flatnonzero(units < 0).tolist():
+		converted[i] = '-' + converted[i]
+	return converted
+
+
+def _convert_arrays(amounts, rates, index, places, rounding):
+	"""
+	amount * rate * 10^places in float64 and rounded to integer units, for all the items but those which fall too
+	close to a rounding boundary (e.g. a tie, or just off one) for the float error to be ruled out, or are too large;
+	those few are done in Decimal
+	"""
+	try:
+		amount_f = np.array(amounts, dtype=np.float64)
+	except (TypeError, ValueError):
+		amount_f = np.array([float(_parse_amount(a, i)) for i, a in enumerate(amounts)])
+	if not np.isfinite(amount_f).all():
+		i = int(np.argmin(np.isfinite(amount_f)))
+		raise ValidationError(_t('invalid_amount_{0}_{1}', i, amounts[i]))
+
+	index = np.array(index, dtype=np.int64)
+	has_rate = index >= 0
+	rate_f = np.array([float(r) for r in rates])[np.where(has_rate, index, 0)]
+
+	x = amount_f * rate_f * (10.0 ** places)
+	magnitude = np.abs(x)
+	if rounding in ('half_even', 'half_up'):
+		units = np.rint(x)
+		boundary_distance = np.abs(np.abs(x - np.floor(x)) - 0.5)
+	else:
+		units = np.trunc(x) if rounding == 'down' else np.sign(x) * np.ceil(magnitude)
+		fraction = magnitude - np.floor(magnitude)
+		boundary_distance = np.minimum(fraction, 1 - fraction)
+	exact = has_rate & ((boundary_distance <= magnitude * _FLOAT_TOLERANCE) | (magnitude >= _FLOAT_EXACT_LIMIT))
+
+	converted = _format_units(np.where(exact | ~has_rate, 0, units).astype(np.int64), places)
+
+	exponent, decimal_rounding = Decimal(1).scaleb(-places), ROUNDING[rounding]
+	for i in np.flatnonzero(exact).tolist():
+		converted[i] = _exact(_parse_amount(amounts[i], i), rates[index[i]], exponent, decimal_rounding)
+	for i in np.flatnonzero(~has_rate).tolist():
+		converted[i] = None
+	return converted
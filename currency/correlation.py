@@ -0,0 +1,161 @@
+import datetime
+import hashlib
+import math
+from functools import reduce
+from operator import or_
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from currency.aggregates import aggregate_quotes, duration_seconds
+from currency.models import Currency
+from currency.texts import get_app_text as _t
+from labs.exceptions import ValidationError
+from labs.versions import bump_versions
+
+__author__ = 'chandanojha'
+
+try:
+	import numpy as np
+except ImportError:
+	np = None
+
+# ---
+# Correlation matrix of the pairs' returns over a rolling window: the last rate of every pair per time bucket is read
+# in one grouped query (see currency.aggregates), carried forward over the buckets a pair was not quoted in, and the
+# log returns between consecutive buckets are correlated all pairs at once with a few matrix products. Results are
+# cached in the shared cache till the next ingest of one of their pairs (see versions())
+#
+
+MAX_BUCKETS = 20000  # per pair, i.e. window / bucket
+MIN_OBSERVATIONS = 3  # returns both pairs have, less and their correlation is null
+VERSION_KEY = 'currency:correlation:version'  # of all the pairs, bumped on every ingest
+
+
+def version_key(pair):
+	return 'currency:correlation:version:{0}/{1}'.format(*pair)
+
+
+def versions(pairs):
+	"""
+	:return: Version of the data of the given pairs (all if None), it changes with the ingests of any of them only
+	"""
+	if pairs is None:
+		cache.add(VERSION_KEY, 0, timeout=None)
+		return cache.get(VERSION_KEY)
+	found = cache.get_many([version_key(pair) for pair in pairs])
+	return hashlib.md5(repr([found.get(version_key(pair), 0) for pair in pairs]).encode()).hexdigest()
+
+
+def correlation(window='30d', bucket='1h', pairs=None):
+	"""
+	:param window: Duration to look back from now, like 30d (see currency.aggregates.parse_duration())
+	:param bucket: Bucket width of the returns, like 1h
+	:param pairs: List of (from_currency_code, to_currency_code) to correlate, all the quoted ones if None
+	:return: {"window", "bucket", "start", "end", "pairs": ["BTC/USD", ...], "returns": [count per pair], "matrix":
+		[[...], ...]} the matrix being the Pearson correlation of each two pairs over the returns they both have (null
+		if fewer than MIN_OBSERVATIONS, or either does not move)
+	"""
+	window_seconds, bucket_seconds = duration_seconds(window), duration_seconds(bucket)
+	if window_seconds is None:
+		raise ValidationError(_t('invalid_window_{0}', window))
+	if bucket_seconds is None:
+		raise ValidationError(_t('invalid_bucket_{0}', bucket))
+	if window_seconds // bucket_seconds > MAX_BUCKETS:
+		raise ValidationError(_t('too_many_buckets_{0}', MAX_BUCKETS))
+
+	key = 'currency:correlation:{0}:{1}:{2}:{3}'.format(versions(pairs), window, bucket, hashlib.md5(
+		repr(pairs).encode()).hexdigest())
+	result = cache.get(key)
+	if result is None:
+		end = timezone.now()
+		result = {'window': window, 'bucket': bucket, 'start': end - datetime.timedelta(seconds=window_seconds),
+		          'end': end}
+		result.update(_correlate(*_bucket_prices(result['start'], end, bucket, pairs)))
+		cache.set(key, result, timeout=bucket_seconds)  # the window moves on by then
+	return result
+
+
+def _bucket_prices(start, end, bucket, pairs):
+	"""
+	:return: (pairs, prices) where 'prices' are the rows of the time buckets (oldest first) with the last rate of each
+		pair in it, or carried forward from its previous bucket (None before its first)
+	"""
+	queryset = Currency.objects.filter(last_refreshed__gte=start, last_refreshed__lte=end)
+	if pairs is not None:
+		pair_filters = [Q(from_currency_code=f, to_currency_code=t) for f, t in pairs]
+		queryset = queryset.filter(reduce(or_, pair_filters)) if pair_filters else queryset.none()
+	rows = list(aggregate_quotes(queryset, bucket, ['last']))
+
+	codes = sorted({(r['from_currency_code'], r['to_currency_code']) for r in rows})
+	buckets = sorted({r['bucket'] for r in rows})
+	columns, positions = {pair: i for i, pair in enumerate(codes)}, {b: i for i, b in enumerate(buckets)}
+	prices = [[None] * len(codes) for _ in buckets]
+	for r in rows:
+		pair = (r['from_currency_code'], r['to_currency_code'])
+		if r['last'] > 0:
+			prices[positions[r['bucket']]][columns[pair]] = float(r['last'])
+	for previous, row in zip(prices, prices[1:]):
+		for i, price in enumerate(row):
+			if price is None:
+				row[i] = previous[i]
+	return ['{0}/{1}'.format(*pair) for pair in codes], prices
+
+
+def _correlate(pairs, prices):
+	matrix, counts = (_matrix_arrays if np is not None else _matrix_lists)(prices, len(pairs))
+	return {'pairs': pairs, 'returns': counts, 'matrix': matrix}
+
+
+def _matrix_arrays(prices, count):
+	"""
+	Pairwise complete correlation with matrix products: with X the returns (0 where missing) and M their mask, the
+	sums over the returns two pairs both have are M'M (count), X'M (of one pair's), (X*X)'M and X'X
+	"""
+	if not prices:
+		return [], [0] * count
+	prices = np.array(prices, dtype=np.float64).reshape(len(prices), count)
+	with np.errstate(divide='ignore', invalid='ignore'):
+		returns = np.log(prices[1:] / prices[:-1])
+		mask = np.isfinite(returns)
+		x, m = np.where(mask, returns, 0.0), mask.astype(np.float64)
+
+		n = m.T @ m
+		sums, squares = x.T @ m, (x * x).T @ m
+		covariance = x.T @ x - sums * sums.T / n
+		variance = squares - sums * sums / n
+		correlation = np.clip(covariance / np.sqrt(variance * variance.T), -1.0, 1.0)
+	defined = (n >= MIN_OBSERVATIONS) & (variance > 1e-18) & (variance.T > 1e-18)
+	matrix = np.where(defined, np.round(correlation, 6), np.nan).tolist()
+	return [[None if math.isnan(v) else v for v in row] for row in matrix], mask.sum(axis=0).tolist()
+
+
+def _matrix_lists(prices, count):
+	returns = [[math.log(b[i] / a[i]) if a[i] and b[i] else None for i in range(count)]
+	           for a, b in zip(prices, prices[1:])]
+	columns = [[row[i] for row in returns] for i in range(count)]
+
+	matrix = [[None] * count for _ in range(count)]
+	for i in range(count):
+		for j in range(i, count):
+			both = [(a, b) for a, b in zip(columns[i], columns[j]) if a is not None and b is not None]
+			if len(both) < MIN_OBSERVATIONS:
+				continue
+			mean_a, mean_b = sum(a for a, _ in both) / len(both), sum(b for _, b in both) / len(both)
+			covariance = sum((a - mean_a) * (b - mean_b) for a, b in both)
+			variance_a, variance_b = sum((a - mean_a) ** 2 for a, _ in both), sum((b - mean_b) ** 2 for _, b in both)
+			if variance_a > 1e-18 and variance_b > 1e-18:
+				value = max(-1.0, min(1.0, covariance / math.sqrt(variance_a * variance_b)))
+				matrix[i][j] = matrix[j][i] = round(value, 6)
+	return matrix, [sum(1 for r in column if r is not None) for column in columns]
+
+
+def invalidate_correlation(sender, quote, **kwargs):
+	"""
+	quote_ingested receiver, once committed so that the next computation reads the quote. Bumps the version of the
+	quote's pair (and of all the pairs), the results of other pairs stay cached
+	"""
+	keys = (VERSION_KEY, version_key((quote.from_currency_code, quote.to_currency_code)))
+	transaction.on_commit(lambda: bump_versions(*keys))
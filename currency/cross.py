@@ -0,0 +1,170 @@
+import threading
+import uuid
+from decimal import ROUND_DOWN, ROUND_HALF_EVEN, ROUND_UP, Decimal
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Q
+
+from currency.models import Currency, latest_quotes
+from labs.versions import bump_versions
+
+__author__ = 'chandanojha'
+
+# ---
+# Cross rates triangulated through a pivot currency: only the latest rate of each currency against the pivot is
+# kept (in memory, per process), any pair A/B is then A/pivot over B/pivot. So fetching N currencies against the
+# pivot (N upstream calls) prices all the N² pairs
+#
+
+PIVOT = getattr(settings, 'QUOTE_PIVOT_CURRENCY', 'USD')
+VERSION_KEY = 'currency:cross:version'  # changes with every ingested pivot quote, processes reload when it does
+EXPONENT = Decimal(1).scaleb(-10)  # as stored, see Currency.exchange_rate
+
+
+class Leg:
+	"""
+	Rate of a currency against the pivot, as pivot units per one unit of it (i.e. CODE/PIVOT), from a stored quote
+	of either direction. A PIVOT/CODE quote is inverted, its bid becoming 1/ask and ask 1/bid
+	"""
+	__slots__ = ('code', 'name', 'mid', 'bid', 'ask', 'last_refreshed', 'quote_id', 'inverted')
+
+	def __init__(self, code, name, mid, bid, ask, last_refreshed=None, quote_id=None, inverted=False):
+		self.code, self.name = code, name
+		self.mid, self.bid, self.ask = mid, bid, ask
+		self.last_refreshed, self.quote_id, self.inverted = last_refreshed, quote_id, inverted
+
+	@classmethod
+	def pivot(cls, code):
+		return cls(code, code, Decimal(1), Decimal(1), Decimal(1))
+
+	@classmethod
+	def from_quote(cls, quote, pivot):
+		bid, ask = _positive(quote.bid_price), _positive(quote.ask_price)
+		if quote.to_currency_code == pivot:
+			return cls(quote.from_currency_code, quote.from_currency_name, quote.exchange_rate, bid, ask,
+			           quote.last_refreshed, quote.pk)
+		return cls(quote.to_currency_code, quote.to_currency_name, 1 / quote.exchange_rate,
+		           1 / ask if ask else None, 1 / bid if bid else None, quote.last_refreshed, quote.pk, inverted=True)
+
+
+def _positive(value):
+	return value if value is not None and value > 0 else None
+
+
+class PivotRates:
+	"""
+	Latest leg of every currency quoted against the pivot, the cross rate of any two of them is derived on demand:
+
+		mid(A/B) = mid(A/P) / mid(B/P)
+		bid(A/B) = bid(A/P) / ask(B/P)  i.e. selling A for P at the bid and buying B with it at the ask
+		ask(A/B) = ask(A/P) / bid(B/P)
+
+	so the spread of a cross is the (wider) combined spread of its legs. Derived bid is rounded down and ask up, to
+	never quote a tighter spread than the legs give
+	"""
+	def __init__(self, pivot, quotes):
+		self.pivot = pivot
+		self.legs = {pivot: Leg.pivot(pivot)}
+		for quote in quotes:
+			if quote.exchange_rate <= 0:
+				continue
+			leg = Leg.from_quote(quote, pivot)
+			current = self.legs.get(leg.code)
+			if current is None or (leg.last_refreshed, leg.quote_id) > (current.last_refreshed, current.quote_id):
+				self.legs[leg.code] = leg  # quoted both ways, the newer one wins
+
+	@classmethod
+	def load(cls, pivot=PIVOT):
+		"""
+		:return: PivotRates of the latest quotes against 'pivot', read in one query
+		"""
+		queryset = Currency.objects.filter(Q(from_currency_code=pivot) | Q(to_currency_code=pivot)).exclude(
+			from_currency_code=pivot, to_currency_code=pivot)
+		return cls(pivot, latest_quotes(queryset=queryset))
+
+	def currencies(self):
+		return sorted(self.legs)
+
+	def all_pairs(self, codes=None):
+		"""
+		:param codes: Currency codes, all the known ones if None
+		:return: Every (from, to) pair of the known 'codes', i.e. the full cross matrix less its diagonal
+		"""
+		codes = self.currencies() if codes is None else [c for c in codes if c in self.legs]
+		return [(a, b) for a in codes for b in codes if a != b]
+
+	def cross_rate(self, from_code, to_code):
+		"""
+		:return: Cross rate as a dict like a serialized quote (decimals as strings) plus 'derived' (not a stored quote
+			as is), 'via' (the pivot, for rates triangulated from two legs) and 'quote_ids' (of the legs), None if either
+			currency has no rate against the pivot
+		"""
+		base, quote = self.legs.get(from_code), self.legs.get(to_code)
+		if base is None or quote is None:
+			return None
+
+		legs = [leg for leg in (base, quote) if leg.quote_id is not None]
+		direct = len(legs) == 1 and legs[0].inverted == (base.code == self.pivot)
+		return {
+			'from_currency_code': base.code,
+			'from_currency_name': base.name,
+			'to_currency_code': quote.code,
+			'to_currency_name': quote.name,
+			'exchange_rate': _divide(base.mid, quote.mid, ROUND_HALF_EVEN),
+			'bid_price': _divide(base.bid, quote.ask, ROUND_DOWN),
+			'ask_price': _divide(base.ask, quote.bid, ROUND_UP),
+			'last_refreshed': min(leg.last_refreshed for leg in legs) if legs else None,
+			'derived': not direct,
+			'via': self.pivot if len(legs) == 2 else None,
+			'quote_ids': [leg.quote_id for leg in legs],
+		}
+
+	def cross_rates(self, pairs):
+		"""
+		:return: List of cross_rate() of the 'pairs' in the same order, the ones without a rate are skipped
+		"""
+		rates = (self.cross_rate(*pair) for pair in pairs)
+		return [rate for rate in rates if rate is not None]
+
+
+def _divide(numerator, denominator, rounding):
+	if numerator is None or denominator is None:
+		return None
+	return format((numerator / denominator).quantize(EXPONENT, rounding=rounding), 'f')
+
+
+_lock = threading.Lock()
+_loaded = None  # (version, PivotRates) of this process
+
+
+def pivot_rates():
+	"""
+	:return: PivotRates of this process, reloaded (one query) only if a pivot quote was ingested since the last load
+		by any process
+	"""
+	global _loaded
+
+	version = cache.get(VERSION_KEY)
+	if version is None:
+		# a random start, so that versions loaded before a cache reset don't match the new ones
+		cache.add(VERSION_KEY, uuid.uuid4().int >> 80, timeout=None)
+		version = cache.get(VERSION_KEY)
+
+	loaded = _loaded
+	if loaded is not None and loaded[0] == version:
+		return loaded[1]
+	with _lock:
+		if _loaded is None or _loaded[0] != version:
+			_loaded = (version, PivotRates.load())
+		return _loaded[1]
+
+
+def invalidate_pivot_rates(sender, quote, **kwargs):
+	"""
+	quote_ingested receiver, bumps the version (once committed, so that the reloads see the quote) if the quote is a
+	leg i.e. of a currency against the pivot
+	"""
+	if PIVOT in (quote.from_currency_code, quote.to_currency_code):
+		transaction.on_commit(lambda: bump_versions(VERSION_KEY))
@@ -0,0 +1,95 @@
+import itertools
+
+from django.db.models import Count, Max
+
+from currency.texts import get_app_text as _t
+from labs.exceptions import ValidationError
+
+__author__ = 'chandanojha'
+
+# ---
+# Display resolution downsampling of long histories with Largest-Triangle-Three-Buckets: the points between the first
+# and the last are split into max_points - 2 buckets and from each the one making the largest triangle with the point
+# picked before it and the average of the next bucket is kept, which keeps the peaks and the shape of the line. It is
+# a single pass over the ordered rows holding just two buckets, the rows of every pair being counted first
+#
+
+MIN_POINTS = 3
+MAX_POINTS = 10000  # per pair
+PAIR = ('from_currency_code', 'to_currency_code')
+
+
+def lttb(points, count, max_points):
+	"""
+	:param points: Iterable of (x, y, item) ordered by x, 'count' of them
+	:return: Generator of the items of the points picked (all if there are no more than 'max_points'), in order
+	"""
+	points = iter(points)
+	if count <= max_points or max_points < MIN_POINTS:
+		yield from (item for _, _, item in points)
+		return
+
+	buckets, every = max_points - 2, (count - 2) / (max_points - 2)
+	bounds = [int(i * every) + 1 for i in range(buckets + 1)]
+
+	a = next(points, None)
+	if a is None:
+		return
+	yield a[2]
+	bucket = list(itertools.islice(points, bounds[1] - bounds[0]))
+	for i in range(buckets):
+		if i + 1 < buckets:
+			following = list(itertools.islice(points, bounds[i + 2] - bounds[i + 1]))
+		else:
+			following = list(points)[-1:]  # the last point (rows added since the count are left out)
+		if not following:
+			following = [a]  # fewer rows than counted
+		avg_x = sum(p[0] for p in following) / len(following)
+		avg_y = sum(p[1] for p in following) / len(following)
+
+		if bucket:
+			ax, ay = a[0], a[1]
+			a = max(bucket, key=lambda p: abs((ax - avg_x) * (p[1] - ay) - (ax - p[0]) * (avg_y - ay)))
+			yield a[2]
+		bucket = following
+	if bucket and bucket[-1] is not a:
+		yield bucket[-1][2]
+
+
+def parse_max_points(max_points):
+	"""
+	:return: The max_points query param as an int, None if not given
+	"""
+	if max_points is None:
+		return None
+	try:
+		points = int(max_points)
+	except ValueError:
+		points = 0
+	if not MIN_POINTS <= points <= MAX_POINTS:
+		raise ValidationError(_t('invalid_max_points_{0}_{1}', max_points, MAX_POINTS))
+	return points
+
+
+def downsampled(queryset, max_points, field_name='exchange_rate'):
+	"""
+	Picks at most 'max_points' quotes of each pair in the queryset by LTTB over (last_refreshed, 'field_name'), the
+	rows are read once as lightweight tuples in (pair, last_refreshed, id) order through a server-side cursor
+
+	:return: Queryset of the quotes picked, ordered by pair and last_refreshed
+	"""
+	counts, last_id = {}, None
+	for c in queryset.order_by().values(*PAIR).annotate(count=Count('id'), last_id=Max('id')):
+		counts[(c['from_currency_code'], c['to_currency_code'])] = c['count']
+		last_id = max(last_id or 0, c['last_id'])
+	if not counts:
+		return queryset.none()
+
+	rows = queryset.filter(pk__lte=last_id).order_by(
+		*PAIR, 'last_refreshed', 'id').values_list(*PAIR, 'last_refreshed', field_name, 'id').iterator()
+
+	ids = []
+	for pair, pair_rows in itertools.groupby(rows, key=lambda r: (r[0], r[1])):
+		points = ((r[2].timestamp(), float(r[3]), r[4]) for r in pair_rows)
+		ids.extend(lttb(points, counts.get(pair, 0), max_points))
+	return queryset.model.objects.filter(pk__in=ids).order_by(*PAIR, 'last_refreshed', 'id')
@@ -0,0 +1,177 @@
+import csv
+import datetime
+import itertools
+from decimal import Decimal, InvalidOperation
+
+from currency.asof import asof_rates
+from currency.convert import CurrencyCodes, convert_amounts
+from currency.texts import get_app_text as _t
+from currency.utils import naive_time, parse_time
+from labs.exceptions import ValidationError
+
+__author__ = 'chandanojha'
+
+try:
+	import pyarrow
+	import pyarrow.parquet
+except ImportError:
+	pyarrow = None
+
+# ---
+# Ledger revaluation: every row (a transaction) is joined to the quote of its currency pair in effect at its time,
+# like a merge-asof join. The ledger is read, joined and written a chunk at a time, the rates come from the per-pair
+# sorted arrays of currency.asof, so memory stays bounded by the chunk size and QUOTE_ASOF_CACHE_ROWS
+#
+
+CHUNK_SIZE = 100000
+RESULT_COLUMNS = ('rate', 'rate_quote_id', 'rate_time', 'converted', 'error')
+
+
+def is_parquet(path):
+	return path.lower().endswith(('.parquet', '.pq'))
+
+
+def _require_pyarrow():
+	if pyarrow is None:
+		raise ValidationError(_t('parquet_unavailable'))
+
+
+def read_chunks(path, chunk_size=CHUNK_SIZE):
+	"""
+	:param path: CSV (with a header line) or Parquet file
+	:return: Generator of (column names, list of columns) chunks of at most 'chunk_size' rows, CSV values are strings
+	"""
+	if is_parquet(path):
+		_require_pyarrow()
+		for batch in pyarrow.parquet.ParquetFile(path).iter_batches(batch_size=chunk_size):
+			yield batch.schema.names, [column.to_pylist() for column in batch.columns]
+		return
+
+	with open(path, newline='') as f:
+		reader = csv.reader(f)
+		header = next(reader, None)
+		while header is not None:
+			rows = [row for row in itertools.islice(reader, chunk_size) if row]
+			if not rows:
+				break
+			if any(len(row) != len(header) for row in rows):
+				raise ValidationError(_t('ledger_ragged_rows'))
+			yield header, [list(column) for column in zip(*rows)]
+
+
+class LedgerWriter:
+	"""
+	Writes the chunks to a CSV or Parquet (by the extension) file as they come, use as a context manager
+	"""
+	def __init__(self, path):
+		self.path = path
+		self.parquet = is_parquet(path)
+		if self.parquet:
+			_require_pyarrow()
+		self._file = self._writer = None
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *exc_info):
+		if self._writer is not None and self.parquet:
+			self._writer.close()
+		if self._file is not None:
+			self._file.close()
+
+	def write(self, names, columns):
+		if self.parquet:
+			table = pyarrow.Table.from_arrays([pyarrow.array(c) for c in columns], names=names)
+			if self._writer is None:
+				self._writer = pyarrow.parquet.ParquetWriter(self.path, table.schema)
+			self._writer.write_table(table.cast(self._writer.schema))  # e.g. a column that was all null in the first
+			return
+
+		if self._writer is None:
+			self._file = open(self.path, 'w', newline='')
+			self._writer = csv.writer(self._file)
+			self._writer.writerow(names)
+		self._writer.writerows(zip(*columns))
+
+
+def revalue(names, columns, time_column, currency_column, to_currency=None, to_column=None, amount_column=None,
+            places=2, rounding='half_even'):
+	"""
+	Joins a chunk of ledger rows to their rates
+
+	:param names: Column names of the chunk
+	:param columns: Columns of the chunk (lists), see read_chunks()
+	:param time_column: Column of the transaction times (ISO strings or datetimes)
+	:param currency_column: Column of the transaction currencies
+	:param to_currency: Currency to revalue into, or 'to_column' for a per row one
+	:param amount_column: Column of the amounts to convert, if any
+	:return: Dict of the RESULT_COLUMNS ('converted' only with an 'amount_column'): rate (as a string), its quote's id
+		and refresh time (ISO), and the error of the rows which could not be revalued (no rate, bad time or amount)
+	"""
+	named = dict(zip(names, columns))
+	for column in (time_column, currency_column, to_column, amount_column):
+		if column is not None and column not in named:
+			raise ValidationError(_t('ledger_missing_column_{0}', column))
+
+	count = len(named[time_column])
+	codes = CurrencyCodes()
+	from_codes = list(map(codes.__getitem__, named[currency_column]))
+	to_codes = list(map(codes.__getitem__, named[to_column])) if to_column else [codes[to_currency]] * count
+	times = [naive_time(t) if isinstance(t, datetime.datetime) else parse_time(t) for t in named[time_column]]
+
+	errors, index, rates = [None] * count, [-1] * count, [Decimal(1)]
+	lookups = []
+	for i, (from_code, to_code, t) in enumerate(zip(from_codes, to_codes, times)):
+		if t is None:
+			errors[i] = _t('invalid_at_{0}', named[time_column][i])
+		elif from_code == to_code:
+			index[i] = 0
+		else:
+			lookups.append(i)
+
+	quote_ids, rate_times = [None] * count, [None] * count
+	found = asof_rates.lookup([(from_codes[i], to_codes[i]) for i in lookups], [times[i] for i in lookups])
+	no_rate = {}
+	for i, row in zip(lookups, found):
+		if row is None:
+			pair = (from_codes[i], to_codes[i])
+			errors[i] = no_rate.get(pair) or no_rate.setdefault(pair, _t('no_rate_{0}_{1}', *pair))
+			continue
+		index[i], quote_ids[i], rate_times[i] = len(rates), row[0], row[1].isoformat()
+		rates.append(row[2])
+
+	rate_strings = [format(r, 'f') for r in rates]
+	result = {
+		'rate': [rate_strings[r] if r >= 0 else None for r in index],
+		'rate_quote_id': quote_ids,
+		'rate_time': rate_times,
+		'error': errors,
+	}
+	if amount_column is not None:
+		amounts, amount_index = [], list(index)
+		for i, amount in enumerate(named[amount_column]):
+			try:
+				valid = Decimal(str(amount).strip()).is_finite()
+			except InvalidOperation:
+				valid = False
+			if not valid:
+				errors[i] = errors[i] or _t('invalid_amount_{0}', amount)
+				amount, amount_index[i] = 0, -1
+			amounts.append(amount)  # as is, converted from the string (or number) again, exactly
+		result['converted'] = convert_amounts(amounts, rates, amount_index, places, rounding)
+	return result
+
+
+def revalue_file(input_path, output_path, chunk_size=CHUNK_SIZE, **options):
+	"""
+	Revalues a ledger file chunk by chunk into 'output_path', the input columns followed by the result ones (see
+	revalue() for the options)
+
+	:return: Generator of (rows, rows without a rate or with a bad value) per chunk, as they are written
+	"""
+	with LedgerWriter(output_path) as writer:
+		for names, columns in read_chunks(input_path, chunk_size):
+			result = revalue(names, columns, **options)
+			result_names = [c for c in RESULT_COLUMNS if c in result]
+			writer.write(list(names) + result_names, columns + [result[c] for c in result_names])
+			yield len(columns[0]), sum(1 for e in result['error'] if e is not None)
@@ -1,17 +1,33 @@
+import logging
+
 import requests
+from django.db import transaction
 from currency.celery import app
-from currency.models import Currency
+from currency.cross import PIVOT, pivot_rates
+from currency.models import Currency, take_txid
+from currency.signals import quote_ingested
+from currency.texts import get_app_text as _t
+from labs import asgi
 from labs.exceptions import ValidationError
 from settings import API_KEY
 
+logger = logging.getLogger(__name__)
 
-def get_price(from_currency=None, to_currency=None):
-	url = "https://www.alphavantage.co/query?function=CURRENCY_EXCHANGE_RATE&from_currency={0}&to_currency={1}&apikey={2}".format(
-																	from_currency or 'BTC', to_currency or 'USD', API_KEY)
-	r = requests.get(url)
+PRICE_URL = "https://www.alphavantage.co/query?function=CURRENCY_EXCHANGE_RATE&from_currency={0}&to_currency={1}&apikey={2}"
+
+
+def price_url(from_currency=None, to_currency=None):
+	return PRICE_URL.format(from_currency or 'BTC', to_currency or 'USD', API_KEY)
+
+
+def price_data(response_json):
+	"""
+	:param response_json: Upstream's (decoded) response
+	:return: Currency fields as strings, as given by upstream
+	"""
 	try:
-		response_data = r.json()['Realtime Currency Exchange Rate']
-		data = {'from_currency_code': response_data['1. From_Currency Code'],
+		response_data = response_json['Realtime Currency Exchange Rate']
+		return {'from_currency_code': response_data['1. From_Currency Code'],
 		        'from_currency_name': response_data['2. From_Currency Name'],
 		        'to_currency_code': response_data['3. To_Currency Code'],
 		        'to_currency_name': response_data['4. To_Currency Name'],
@@ -20,12 +36,61 @@ def get_price(from_currency=None, to_currency=None):
 		        'timezone': response_data['7. Time Zone'],
 		        'bid_price': response_data['8. Bid Price'],
 		        'ask_price': response_data['9. Ask Price']}
-		return Currency.objects.create(**data)
 	except KeyError:
-		raise ValidationError('Enter valid currency codes.')
+		raise ValidationError(_t('invalid_currency_codes'))
+
+
+def save_quote(data):
+	quote = Currency(**data)
+	for field in Currency._meta.concrete_fields:
+		# typed values (Decimal, datetime) instead of the raw upstream strings, for the receivers of quote_ingested
+		setattr(quote, field.attname, field.to_python(getattr(quote, field.attname)))
+	with transaction.atomic():
+		take_txid()  # before the quote id, see quote_changes()
+		quote.save(force_insert=True)
+	quote_ingested.send(sender=Currency, quote=quote)
+	return quote
+
+
+def get_price(from_currency=None, to_currency=None):
+	r = requests.get(price_url(from_currency, to_currency))
+	return save_quote(price_data(r.json()))
+
+
+async def get_price_async(from_currency=None, to_currency=None):
+	"""
+	get_price() for the async views, the upstream call is awaited over the shared (pooled) async http client instead
+	of holding a thread. Without 'httpx' it falls back to get_price() in the thread pool
+	"""
+	if asgi.httpx is None:
+		return await asgi.database_sync_to_async(get_price)(from_currency, to_currency)
+
+	r = await asgi.http_client().get(price_url(from_currency, to_currency))
+	return await asgi.database_sync_to_async(save_quote)(price_data(r.json()))
 
 @app.task
 def get_price_every_hour():
 	get_price()
 
 
+@app.task
+def fetch_price(from_currency=None, to_currency=None):
+	"""
+	Same as get_price() but run by a worker, for async quote requests. Returns the id of the created quote
+	"""
+	return get_price(from_currency, to_currency).id
+
+
+@app.task
+def fetch_pivot_rates(currencies=None):
+	"""
+	Fetches each currency against the pivot, N upstream calls that keep all the N² cross rates current (see
+	currency.cross). Defaults to the currencies already quoted against the pivot
+	"""
+	for code in currencies or pivot_rates().currencies():
+		if code == PIVOT:
+			continue
+		try:
+			get_price(code, PIVOT)
+		except ValidationError:
+			logger.warning("Could not fetch {0}/{1}, skipped".format(code, PIVOT))
@@ -0,0 +1,68 @@
+import abc
+import itertools
+import time
+from datetime import datetime, timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from currency.models import Currency
+
+__author__ = 'chandanojha'
+
+
+class Rollback(Exception):
+	pass
+
+
+class BenchmarkCommand(BaseCommand, metaclass=abc.ABCMeta):
+	"""
+	Base for the benchmark commands, subclass implements run() which is called inside a transaction that is rolled
+	back afterwards, so that the synthetic quotes (see create_quotes()) never stick around
+	"""
+
+	def add_arguments(self, parser):
+		parser.add_argument('--repeat', type=int, default=5, help="Runs per measurement (best is reported), default=5")
+
+	def handle(self, *args, **options):
+		try:
+			with transaction.atomic():
+				self.run(**options)
+				raise Rollback()
+		except Rollback:
+			pass
+
+	@abc.abstractmethod
+	def run(self, **options):
+		"""
+		The benchmark itself, given the command's options. Whatever it writes to the database is rolled back
+		"""
+
+	@staticmethod
+	def measure(func, repeat):
+		"""
+		:return: Best of 'repeat' runs of func() in seconds
+		"""
+		best = None
+		for _ in range(repeat):
+			start = time.perf_counter()
+			func()
+			elapsed = time.perf_counter() - start
+			best = elapsed if best is None else min(best, elapsed)
+		return best
+
+	@staticmethod
+	def create_quotes(pair_count, rows_per_pair):
+		"""
+		:return: List of (from, to) pairs created, with 'rows_per_pair' hourly quotes each
+		"""
+		# 'Q000'..'Q999' style synthetic codes, so that we never clash with real data
+		codes = ('Q{0:03d}'.format(i) for i in itertools.count())
+		pairs = [(next(codes), 'QUSD') for _ in range(pair_count)]
+		start = datetime(2020, 1, 1)
+		for from_code, to_code in pairs:
+			Currency.objects.bulk_create(
+				Currency(from_currency_code=from_code, from_currency_name=from_code, to_currency_code=to_code,
+				         to_currency_name=to_code, exchange_rate=1, bid_price=1, ask_price=1, timezone='UTC',
+				         last_refreshed=start + timedelta(hours=i)) for i in range(rows_per_pair))
+		return pairs
@@ -0,0 +1,30 @@
+from currency.management.benchmark import BenchmarkCommand
+from currency.models import Currency, latest_quotes
+
+__author__ = 'chandanojha'
+
+
+class Command(BenchmarkCommand):
+	help = "Benchmarks the single query latest-quote lookup against one filtered query per pair. Runs on synthetic " \
+	       "quotes inside a transaction which is rolled back, so it is safe to run against any database"
+
+	def add_arguments(self, parser):
+		super().add_arguments(parser)
+		parser.add_argument('--pairs', default='10,100,1000', help="Comma separated pair counts, default=10,100,1000")
+		parser.add_argument('--rows-per-pair', type=int, default=100, help="Quote history per pair, default=100")
+
+	def run(self, **options):
+		counts = [int(n) for n in options['pairs'].split(',')]
+		pairs = self.create_quotes(max(counts), options['rows_per_pair'])
+
+		self.stdout.write("{0:>6} {1:>14} {2:>14} {3:>8}".format('pairs', 'single (ms)', 'per-pair (ms)', 'speedup'))
+		for n in counts:
+			single = self.measure(lambda: list(latest_quotes(pairs[:n])), options['repeat'])
+			per_pair = self.measure(lambda: [self.latest_one(p) for p in pairs[:n]], options['repeat'])
+			self.stdout.write("{0:>6} {1:>14.2f} {2:>14.2f} {3:>7.1f}x".format(
+				n, single * 1000, per_pair * 1000, per_pair / single))
+
+	@staticmethod
+	def latest_one(pair):
+		return Currency.objects.filter(from_currency_code=pair[0], to_currency_code=pair[1]) \
+			.order_by('-last_refreshed', '-id').first()
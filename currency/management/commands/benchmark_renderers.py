@@ -0,0 +1,43 @@
+from rest_framework import renderers
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from auth.staff import bot_staff
+from currency.management.benchmark import BenchmarkCommand
+from currency.views import CurrencyView
+from labs import renderers as labs_renderers
+
+__author__ = 'chandanojha'
+
+
+class Command(BenchmarkCommand):
+	help = "Benchmarks our JSON renderer against DRF's stock one on CurrencyView list pages. Runs on synthetic " \
+	       "quotes inside a transaction which is rolled back, so it is safe to run against any database"
+
+	def add_arguments(self, parser):
+		super().add_arguments(parser)
+		parser.add_argument('--page-sizes', default='20,200,2000', help="Comma separated page sizes, default=20,200,2000")
+
+	def run(self, **options):
+		page_sizes = [int(n) for n in options['page_sizes'].split(',')]
+		self.create_quotes(1, max(page_sizes))
+
+		stock, fast = renderers.JSONRenderer(), labs_renderers.JSONRenderer()
+		self.stdout.write("{0:>6} {1:>10} {2:>12} {3:>12} {4:>8}".format(
+			'rows', 'bytes', 'stock (ms)', 'labs (ms)', 'speedup'))
+		for page_size in page_sizes:
+			data = self.list_page(page_size)
+			assert stock.render(data) == fast.render(data), "Renderers differ in output"
+
+			stock_time = self.measure(lambda: stock.render(data), options['repeat'])
+			fast_time = self.measure(lambda: fast.render(data), options['repeat'])
+			self.stdout.write("{0:>6} {1:>10} {2:>12.3f} {3:>12.3f} {4:>7.1f}x".format(
+				len(data), len(fast.render(data)), stock_time * 1000, fast_time * 1000, stock_time / fast_time))
+
+	@staticmethod
+	def list_page(page_size):
+		""" Serialized (not yet rendered) data of the first CurrencyView list page """
+		request = APIRequestFactory().get('/api/v1/quotes/', {'page_size': page_size})
+		force_authenticate(request, user=bot_staff().user)
+		response = CurrencyView.as_view()(request)
+		assert response.status_code == 200, response.data
+		return response.data
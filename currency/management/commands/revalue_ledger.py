@@ -0,0 +1,57 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from currency.convert import MAX_PLACES, ROUNDING
+from currency.ledger import CHUNK_SIZE, revalue_file
+from labs.exceptions import ValidationError
+
+__author__ = 'chandanojha'
+
+
+class Command(BaseCommand):
+	help = "Revalues a ledger (CSV or Parquet) at historical rates: joins each row to the quote of its currency pair " \
+	       "in effect at its time, and writes the ledger along with rate, rate_quote_id, rate_time, converted (with " \
+	       "--amount-column) and error columns. Streams the files in chunks, so memory stays flat whatever the size"
+
+	def add_arguments(self, parser):
+		parser.add_argument('input', help="Ledger file, .csv (with a header line) or .parquet")
+		parser.add_argument('output', help="Revalued ledger file, .csv or .parquet")
+		parser.add_argument('--to', dest='to_currency', help="Currency to revalue into, e.g. USD")
+		parser.add_argument('--to-column', help="Column of the currency to revalue into, instead of --to")
+		parser.add_argument('--time-column', default='timestamp', help="Column of the transaction times, default=timestamp")
+		parser.add_argument('--currency-column', default='currency', help="Column of the transaction currencies, "
+		                                                                   "default=currency")
+		parser.add_argument('--amount-column', help="Column of the amounts to convert, if any")
+		parser.add_argument('--places', type=int, default=2, help="Decimal places of the converted amounts, default=2")
+		parser.add_argument('--rounding', default='half_even', choices=sorted(ROUNDING), help="default=half_even")
+		parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE, help="Rows per chunk, default=%d" % CHUNK_SIZE)
+
+	def handle(self, *args, **options):
+		if bool(options['to_currency']) == bool(options['to_column']):
+			raise CommandError("Give one of --to or --to-column")
+		if not 0 <= options['places'] <= MAX_PLACES:
+			raise CommandError("--places should be 0 to {0}".format(MAX_PLACES))
+
+		chunks = revalue_file(
+			options['input'], options['output'], chunk_size=options['chunk_size'],
+			time_column=options['time_column'], currency_column=options['currency_column'],
+			to_currency=options['to_currency'], to_column=options['to_column'], amount_column=options['amount_column'],
+			places=options['places'], rounding=options['rounding'])
+
+		start = last = time.perf_counter()
+		total = failed = 0
+		try:
+			for rows, errors in chunks:
+				now = time.perf_counter()
+				total, failed = total + rows, failed + errors
+				self.stdout.write("{0:>12,} rows {1:>10,.0f} rows/s {2:>10,} not revalued".format(
+					total, rows / (now - last), failed))
+				last = now
+		except ValidationError as e:
+			raise CommandError(e.message)
+
+		elapsed = time.perf_counter() - start
+		self.stdout.write(self.style.SUCCESS("Revalued {0:,} rows in {1:.1f}s ({2:,.0f} rows/s), {3:,} not revalued "
+		                                     "(see the error column), written to {4}".format(
+			total, elapsed, total / elapsed if elapsed else 0, failed, options['output'])))
@@ -0,0 +1,17 @@
+# Generated by Django 2.2.12 on 2026-10-19 14:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('currency', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='currency',
+            index=models.Index(fields=['from_currency_code', 'to_currency_code', '-last_refreshed', '-id'], name='currency_pair_latest_idx'),
+        ),
+    ]
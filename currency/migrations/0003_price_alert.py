@@ -0,0 +1,36 @@
+# Generated by Django 2.2.12 on 2026-10-19 14:54
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('currency', '0002_currency_pair_latest_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PriceAlert',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('from_currency_code', models.CharField(max_length=100)),
+                ('to_currency_code', models.CharField(max_length=100)),
+                ('threshold', models.DecimalField(decimal_places=10, max_digits=20)),
+                ('direction', models.CharField(choices=[('above', 'above'), ('below', 'below'), ('any', 'any')], default='any', max_length=5)),
+                ('repeat', models.BooleanField(default=False)),
+                ('is_active', models.BooleanField(default=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('triggered_at', models.DateTimeField(blank=True, null=True)),
+                ('triggered_rate', models.DecimalField(blank=True, decimal_places=10, max_digits=20, null=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='price_alerts', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='pricealert',
+            index=models.Index(fields=['from_currency_code', 'to_currency_code', 'is_active'], name='alert_pair_active_idx'),
+        ),
+    ]
@@ -1,4 +1,11 @@
-from django.db import models
+import datetime
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import models, connection
+from django.db.models import DateTimeField, Subquery, Value
+from django.db.models.functions import Coalesce
 
 
 class Currency(models.Model):
@@ -11,3 +18,196 @@ class Currency(models.Model):
 	timezone = models.CharField(max_length=100, null=False)
 	ask_price = models.DecimalField(max_digits=20, decimal_places=10)
 	bid_price = models.DecimalField(max_digits=20, decimal_places=10)
+
+	class Meta:
+		indexes = [
+			# latest quote per pair (see latest_quotes()) is an index-only walk on this
+			models.Index(fields=['from_currency_code', 'to_currency_code', '-last_refreshed', '-id'],
+			             name='currency_pair_latest_idx'),
+		]
+
+
+class PriceAlert(models.Model):
+	"""
+	Notifies its user when the rate of the pair crosses the threshold, upwards (above), downwards (below) or either
+	way (any). A one-off alert is deactivated once triggered, a repeating one triggers on every crossing
+	"""
+	ABOVE, BELOW, ANY = 'above', 'below', 'any'
+	DIRECTIONS = ((ABOVE, 'above'), (BELOW, 'below'), (ANY, 'any'))
+
+	user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='price_alerts')
+	from_currency_code = models.CharField(max_length=100, null=False)
+	to_currency_code = models.CharField(max_length=100, null=False)
+	threshold = models.DecimalField(max_digits=20, decimal_places=10)
+	direction = models.CharField(max_length=5, choices=DIRECTIONS, default=ANY)
+	repeat = models.BooleanField(default=False)
+	is_active = models.BooleanField(default=True)
+	created_at = models.DateTimeField(auto_now_add=True)
+	triggered_at = models.DateTimeField(null=True, blank=True)
+	triggered_rate = models.DecimalField(max_digits=20, decimal_places=10, null=True, blank=True)
+
+	class Meta:
+		indexes = [
+			# active alerts of a pair, for (re)building its threshold index (see currency.alerts)
+			models.Index(fields=['from_currency_code', 'to_currency_code', 'is_active'], name='alert_pair_active_idx'),
+		]
+
+
+class WebhookSubscription(models.Model):
+	"""
+	New quotes of the 'pairs' (comma separated like BTC/USD,EUR/USD, all if blank) are POSTed to the url in batches,
+	signed with the secret (see currency.webhooks)
+	"""
+	user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='webhooks')
+	url = models.URLField(max_length=500)
+	pairs = models.TextField(blank=True, default='')
+	secret = models.CharField(max_length=100, blank=True, default='')
+	is_active = models.BooleanField(default=True)
+	created_at = models.DateTimeField(auto_now_add=True)
+	last_delivered_at = models.DateTimeField(null=True, blank=True)
+	failures = models.PositiveIntegerField(default=0)  # consecutive failed deliveries, deactivated after too many
+
+
+_latest_for_pairs_sql = """
+	SELECT c.* FROM unnest(%s::varchar[], %s::varchar[]) WITH ORDINALITY AS p(from_code, to_code, n)
+	CROSS JOIN LATERAL (
+		SELECT * FROM {table} WHERE from_currency_code = p.from_code AND to_currency_code = p.to_code
+		ORDER BY last_refreshed DESC, id DESC LIMIT 1
+	) c
+	ORDER BY p.n
+"""
+
+
+def latest_quotes(pairs=None, queryset=None):
+	"""
+	Latest quote of each pair in a single query
+
+	:param pairs: List of (from_currency_code, to_currency_code), if given the quotes are looked up with an indexed
+		lateral join and returned in the same order (missing pairs are skipped)
+	:param queryset: Currency queryset to pick the latest quotes from when 'pairs' is not given (DISTINCT ON pair),
+		defaults to all quotes
+	:return: Iterable of Currency objects
+	"""
+	if pairs is not None:
+		from_codes, to_codes = zip(*pairs) if pairs else ((), ())
+		sql = _latest_for_pairs_sql.format(table=connection.ops.quote_name(Currency._meta.db_table))
+		return Currency.objects.raw(sql, [list(from_codes), list(to_codes)])
+
+	queryset = Currency.objects.all() if queryset is None else queryset
+	pair = ('from_currency_code', 'to_currency_code')
+	return queryset.order_by(*pair, '-last_refreshed', '-id').distinct(*pair)
+
+
+_recent_for_pairs_sql = """
+	SELECT p.from_code, p.to_code, c.* FROM unnest(%s::varchar[], %s::varchar[]) WITH ORDINALITY AS p(from_code, to_code, n)
+	CROSS JOIN LATERAL (
+		SELECT {fields} FROM {table} WHERE from_currency_code = p.from_code AND to_currency_code = p.to_code AND id <= %s
+		ORDER BY last_refreshed DESC, id DESC LIMIT %s
+	) c
+	ORDER BY p.n, c.last_refreshed, c.id
+"""
+
+
+def recent_quotes(pairs, count, until, fields=('id', 'last_refreshed', 'exchange_rate')):
+	"""
+	Latest 'count' quotes of each pair up to the 'until' quote id, in a single query (an indexed walk per pair)
+
+	:param pairs: List of (from_currency_code, to_currency_code)
+	:param fields: Columns to read, 'id' and 'last_refreshed' among them
+	:return: List of (from_currency_code, to_currency_code, *fields) tuples, by pair (in the given order) and oldest
+		first (ties by id)
+	"""
+	if not pairs:
+		return []
+	from_codes, to_codes = zip(*pairs)
+	sql = _recent_for_pairs_sql.format(table=connection.ops.quote_name(Currency._meta.db_table),
+	                                   fields=', '.join(map(connection.ops.quote_name, fields)))
+	with connection.cursor() as cursor:
+		cursor.execute(sql, [list(from_codes), list(to_codes), until, count])
+		return cursor.fetchall()
+
+
+# Rows whose inserting transaction is older than the oldest one still running i.e. no transaction in flight can
+# commit a smaller id any more. The horizon is the txid of that oldest transaction, see settled_horizon()
+_settled_sql = "age({table}.xmin) > age(mod(%s, 4294967296)::text::xid)"
+
+_in_flight_sql = "SELECT array(SELECT txid_snapshot_xip(s)), txid_snapshot_xmax(s) FROM txid_current_snapshot() s"
+
+MAX_HOLD_BACK = getattr(settings, 'QUOTE_CHANGES_MAX_HOLD_BACK', 60)  # seconds
+IN_FLIGHT_KEY = 'currency:changes:in_flight'
+
+
+def settled_horizon():
+	"""
+	Transactions in flight are cluster wide (any session of any database holding a transaction id), so a single
+	long-running or idle-in-transaction one would hold back every row after it for as long as it lasts. The ones seen
+	in flight for more than MAX_HOLD_BACK seconds (first-seen times kept in the shared cache) are left out, the rows
+	they commit later below the cursors handed out meanwhile are then missed
+
+	:return: Transaction id (64 bits) of the oldest transaction in flight, or the next one if there is none
+	"""
+	with connection.cursor() as cursor:
+		cursor.execute(_in_flight_sql)
+		in_flight, horizon = cursor.fetchone()
+
+	now, seen = time.time(), cache.get(IN_FLIGHT_KEY) or {}
+	seen = {txid: seen.get(txid, now) for txid in in_flight}
+	cache.set(IN_FLIGHT_KEY, seen, timeout=None)
+	return min((txid for txid in in_flight if now - seen[txid] <= MAX_HOLD_BACK), default=horizon)
+
+
+def take_txid():
+	"""
+	Has the current transaction take its transaction id right away. A transaction gets one at its first write, i.e.
+	an INSERT draws the quote id (nextval) before the transaction id: a transaction settling in between would pass the
+	quote's transaction as not in flight yet and settle the ids after it. Taken before the insert, the transaction is
+	in flight from before its quote id is drawn. Must be called in an atomic block, along with the inserts
+	"""
+	with connection.cursor() as cursor:
+		cursor.execute("SELECT txid_current()")
+
+
+def _settled(queryset):
+	table = connection.ops.quote_name(Currency._meta.db_table)
+	return queryset.extra(where=[_settled_sql.format(table=table)], params=[settled_horizon()])
+
+
+def quote_changes(since=0, limit=1000, queryset=None):
+	"""
+	Quotes inserted after the 'since' cursor (quote id), oldest first, walking the primary key index so a sync costs
+	O(new rows)
+
+	Ids are handed out at insert but become visible at commit, which may be out of order, so the quotes of (and after)
+	transactions still in flight are held back till they settle. That way no quote committed later gets an id below
+	the returned ones, and the last one is safe to be used as the next cursor. Transactions in flight for longer than
+	MAX_HOLD_BACK are not waited for, see settled_horizon(). Neither are the transactions that drew the quote id but
+	hold no transaction id yet: quotes inserted otherwise than by save_quote() (see take_txid()) may be missed too
+
+	:param queryset: Currency queryset to read from (e.g. filtered), defaults to all quotes
+	:return: List of at most 'limit' Currency objects
+	"""
+	queryset = Currency.objects.all() if queryset is None else queryset
+	return list(_settled(queryset.filter(pk__gt=since)).order_by('pk')[:limit])
+
+
+def settled_cursor():
+	"""
+	:return: Id of the latest settled quote (see quote_changes()), a cursor that no quote committed later goes below.
+		0 if there is none
+	"""
+	return _settled(Currency.objects.all()).order_by('-pk').values_list('pk', flat=True).first() or 0
+
+
+def rate_history(from_currency_code, to_currency_code, start, end, fields=('last_refreshed', 'exchange_rate')):
+	"""
+	Quotes of a pair that were in effect at some time within [start, end] i.e. the latest one as of 'start' and all
+	the ones after it till 'end', oldest first (ties by id), read backwards on the pair index
+
+	:return: values_list() queryset of 'fields'
+	"""
+	pair = Currency.objects.filter(from_currency_code=from_currency_code, to_currency_code=to_currency_code)
+	in_effect_at_start = pair.filter(last_refreshed__lte=start).order_by('-last_refreshed', '-id').values(
+		'last_refreshed')[:1]
+	since = Coalesce(Subquery(in_effect_at_start), Value(datetime.datetime.min), output_field=DateTimeField())
+	return pair.filter(last_refreshed__gte=since, last_refreshed__lte=end).order_by(
+		'last_refreshed', 'id').values_list(*fields)
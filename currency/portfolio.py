@@ -0,0 +1,102 @@
+from decimal import Decimal
+
+from currency.convert import CurrencyCodes, check_rounding, convert_amounts
+from currency.models import latest_quotes
+from currency.texts import get_app_text as _t
+from labs.exceptions import ValidationError
+
+__author__ = 'chandanojha'
+
+# ---
+# Portfolio valuation: holdings in many currencies valued in one, from the latest quote of each currency against it
+# (read for all the currencies in one query) and converted all at once, see currency.convert
+#
+
+MAX_HOLDINGS = 100000
+
+
+class PortfolioValue:
+	"""
+	Value of each holding (None if its currency has no rate) with the rate used, and their total
+	"""
+	def __init__(self, currency, currencies, values, rates, errors, total):
+		self.currency = currency
+		self.currencies = currencies  # of the holdings, normalized
+		self.values = values
+		self.rates = rates  # per holding: {"rate", "quote_id", "last_refreshed", "inverted"} or None
+		self.errors = errors  # (index, message)
+		self.total = total
+
+
+def holding_columns(data):
+	"""
+	:param data: Request data {"holdings": [{"currency": "EUR", "amount": "10.5"}, ...], "currency": "USD"}
+	:return: (currencies, amounts) of the holdings
+	"""
+	holdings = data.get('holdings') if isinstance(data, dict) else None
+	if not isinstance(holdings, list) or not all(isinstance(h, dict) for h in holdings):
+		raise ValidationError(_t('invalid_holdings'))
+	if len(holdings) > MAX_HOLDINGS:
+		raise ValidationError(_t('too_many_items_{0}', MAX_HOLDINGS))
+	try:
+		return [h['currency'] for h in holdings], [h['amount'] for h in holdings]
+	except KeyError:
+		raise ValidationError(_t('invalid_holdings'))
+
+
+def holding_rates(currencies, target):
+	"""
+	Latest rate of each currency into 'target', from a quote of either direction (the newer if both, inverting a
+	target/currency one), read in one query
+
+	:return: {currency: {"rate": Decimal, "quote_id", "last_refreshed", "inverted"}}, currencies without a quote left
+		out and 'target' itself at 1
+	"""
+	others = [c for c in currencies if c != target]
+	quotes = {}
+	for quote in latest_quotes([(c, target) for c in others] + [(target, c) for c in others]):
+		inverted = quote.from_currency_code == target
+		currency = quote.to_currency_code if inverted else quote.from_currency_code
+		current = quotes.get(currency)
+		if quote.exchange_rate > 0 and (current is None or quote.last_refreshed > current.last_refreshed):
+			quotes[currency] = quote
+
+	rates = {target: {'rate': Decimal(1), 'quote_id': None, 'last_refreshed': None, 'inverted': False}}
+	for currency, quote in quotes.items():
+		inverted = quote.from_currency_code == target
+		rates[currency] = {
+			'rate': 1 / quote.exchange_rate if inverted else quote.exchange_rate,
+			'quote_id': quote.pk,
+			'last_refreshed': quote.last_refreshed,
+			'inverted': inverted,
+		}
+	return rates
+
+
+def value_portfolio(currencies, amounts, target, places=2, rounding='half_even'):
+	"""
+	:param currencies: Currency code of each holding
+	:param amounts: Amount of each holding (str, int or float), strings are taken as exact decimals
+	:param target: Currency to value the holdings in
+	:param places: Decimal places of the values (and total)
+	:param rounding: One of currency.convert.ROUNDING keys, applied to each value
+	:return: PortfolioValue, the total being the sum of the (rounded) values
+	"""
+	if not target:
+		raise ValidationError(_t('portfolio_currency_required'))
+	check_rounding(places, rounding)
+	codes = CurrencyCodes()
+	try:
+		currencies, target = list(map(codes.__getitem__, currencies)), codes[target]
+	except TypeError:
+		raise ValidationError(_t('invalid_holdings'))
+
+	rates = holding_rates(set(currencies), target)
+	distinct = list(rates)
+	position = {currency: i for i, currency in enumerate(distinct)}
+	index = [position.get(currency, -1) for currency in currencies]
+	values = convert_amounts(amounts, [rates[c]['rate'] for c in distinct], index, places, rounding)
+
+	errors = [(i, _t('no_rate_{0}_{1}', currencies[i], target)) for i, r in enumerate(index) if r < 0]
+	total = sum((Decimal(v) for v in values if v is not None), Decimal(0)).quantize(Decimal(1).scaleb(-places))
+	return PortfolioValue(target, currencies, values, [rates.get(c) for c in currencies], errors, total)
@@ -1,5 +1,8 @@
 from labs.model_serializer import ModelSerializer
 from currency.models import *
+from currency.texts import get_app_text as _t
+from currency.utils import pair_list
+from labs.exceptions import ValidationError
 
 
 class CurrencySerializer(ModelSerializer):
@@ -8,3 +11,32 @@ class CurrencySerializer(ModelSerializer):
 		fields = '__all__'
 		read_only_fields = ('from_currency_name', 'to_currency_name', 'exchange_rate', 'last_refreshed', 'timezone', 'ask_price', 'bid_price')
 
+
+class PriceAlertSerializer(ModelSerializer):
+	class Meta:
+		model = PriceAlert
+		fields = '__all__'
+		read_only_fields = ('user', 'created_at', 'triggered_at', 'triggered_rate')
+
+	def validate_from_currency_code(self, value):
+		return value.strip().upper()
+
+	def validate_to_currency_code(self, value):
+		return value.strip().upper()
+
+	def validate_threshold(self, value):
+		if value <= 0:
+			raise ValidationError(_t('invalid_threshold_{0}', value))
+		return value
+
+
+class WebhookSubscriptionSerializer(ModelSerializer):
+	class Meta:
+		model = WebhookSubscription
+		fields = '__all__'
+		read_only_fields = ('user', 'created_at', 'last_delivered_at', 'failures')
+		extra_kwargs = {'secret': {'write_only': True}}
+
+	def validate_pairs(self, value):
+		pairs = pair_list(value or None)
+		return ','.join('{0}/{1}'.format(*pair) for pair in pairs) if pairs else ''
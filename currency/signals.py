@@ -0,0 +1,7 @@
+from django.dispatch import Signal
+
+__author__ = 'chandanojha'
+
+# Sent by the ingestion (currency.main.get_price) with every new quote once it is saved, keep receivers quick as
+# they run in the ingesting process (web request or celery worker)
+quote_ingested = Signal(providing_args=['quote'])
@@ -0,0 +1,159 @@
+import gzip
+import hashlib
+import logging
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+
+from currency.celery import app
+from currency.models import latest_quotes
+from currency.serializers import CurrencySerializer
+from labs.locks import CacheLock
+from labs.renderers import JSONRenderer
+
+__author__ = 'chandanojha'
+
+logger = logging.getLogger(__name__)
+
+# ---
+# Latest rate of every pair, serialized (and gzipped) once per ingest and kept in the shared cache so that reading it
+# is a cache get, no queries and no serialization. Ingests rebuild it from the rebuild_snapshot task, once committed
+#
+
+SNAPSHOT_KEY = 'currency:latest:snapshot'  # what is served: version, etag, json and gzip bytes
+STATE_KEY = 'currency:latest:state'  # for rebuilds and deltas: pairs, rendered quotes and their versions by id
+LOCK_KEY = 'currency:latest:lock'
+LOCK_TIMEOUT = 30  # seconds
+LOCK_WAIT = 1  # seconds a rebuild waits for its turn, before retrying later
+RETRY_DELAY = 1  # seconds
+GZIP_LEVEL = 6
+
+
+def render_row(quote):
+	return JSONRenderer().render(CurrencySerializer(quote).data)
+
+
+def build_snapshot(new_pair=None, wait=LOCK_WAIT):
+	"""
+	(Re)builds the snapshot and stores it in the cache
+
+	Latest quotes are read with the indexed per-pair lookup for the pairs already known (plus 'new_pair'), only a cold
+	build (empty cache) scans them all. Quotes rendered earlier are reused as is, so an ingest renders just the new one
+
+	Rebuilds (web and worker processes alike) take turns on a cache lock, each reads the database after its turn comes
+	so the last one always stores the latest
+
+	:param new_pair: (from_currency_code, to_currency_code) of the quote just ingested, if any
+	:param wait: Seconds to wait for the lock
+	:return: The snapshot dict (see SNAPSHOT_KEY), None if the lock was not had within 'wait'
+	"""
+	with CacheLock(LOCK_KEY, LOCK_TIMEOUT, wait) as acquired:
+		return _build_snapshot(new_pair) if acquired else None
+
+
+def _build_snapshot(new_pair, store=True):
+	state = cache.get(STATE_KEY)
+	if state is None:
+		quotes = list(latest_quotes())
+		state = {'epoch': int(time.time() * 1000), 'seq': 0, 'pairs': [], 'rows': {}, 'seqs': {}}
+	else:
+		pairs = set(state['pairs']) | ({tuple(new_pair)} if new_pair else set())
+		quotes = list(latest_quotes(sorted(pairs)))
+
+	quotes.sort(key=lambda q: (q.from_currency_code, q.to_currency_code))
+	ids = [q.pk for q in quotes]
+	snapshot = cache.get(SNAPSHOT_KEY)
+	if snapshot is not None and ids == state.get('ids'):
+		return snapshot  # nothing changed (e.g. an older quote was ingested)
+
+	seq = state['seq'] + 1
+	rows = {q.pk: state['rows'].get(q.pk) or render_row(q) for q in quotes}
+	body = b'[' + b','.join(rows[pk] for pk in ids) + b']'
+	state.update({
+		'seq': seq,
+		'pairs': [(q.from_currency_code, q.to_currency_code) for q in quotes],
+		'ids': ids,
+		'rows': rows,
+		'seqs': {pk: state['seqs'].get(pk, seq) for pk in ids},  # version a quote first appeared in, for deltas
+	})
+	snapshot = {
+		'version': '{0}.{1}'.format(state['epoch'], state['seq']),
+		'etag': '"{0}"'.format(hashlib.sha1(body).hexdigest()),
+		'json': body,
+		'gzip': gzip.compress(body, GZIP_LEVEL),
+	}
+	if store:
+		cache.set_many({STATE_KEY: state, SNAPSHOT_KEY: snapshot}, timeout=None)
+	return snapshot
+
+
+def get_snapshot():
+	"""
+	:return: The snapshot, built if not yet (waiting for a build under way), or built just for this call if the lock
+		can't be had
+	"""
+	snapshot = cache.get(SNAPSHOT_KEY) or build_snapshot(wait=LOCK_TIMEOUT)
+	return snapshot or cache.get(SNAPSHOT_KEY) or _build_snapshot(None, store=False)
+
+
+def parse_version(version):
+	"""
+	:return: (epoch, seq) tuple of a snapshot version, None if it is not one
+	"""
+	try:
+		epoch, seq = version.split('.')
+		return int(epoch), int(seq)
+	except (AttributeError, ValueError):
+		return None
+
+
+def snapshot_delta(since):
+	"""
+	Latest quotes changed after the 'since' version, pre-rendered like the snapshot
+
+	:param since: (epoch, seq) of the snapshot version the client has, see parse_version()
+	:return: JSON bytes of {"version": ..., "full": false, "quotes": [...changed ones...]}, or of all the quotes with
+		full=true when the version is not of the current epoch (the cache was reset since) or is ahead of the current
+		one, or if most of the pairs have changed anyway
+	"""
+	state = cache.get(STATE_KEY)
+	if state is None:
+		snapshot = get_snapshot()
+		return b'{"version":"%s","full":true,"quotes":%s}' % (snapshot['version'].encode(), snapshot['json'])
+
+	epoch, seq = since
+	full = epoch != state['epoch'] or seq > state['seq']
+	ids = state['ids'] if full else [pk for pk in state['ids'] if state['seqs'][pk] > seq]
+	if not full and ids and len(ids) * 2 >= len(state['ids']):
+		full, ids = True, state['ids']
+
+	version = '{0}.{1}'.format(state['epoch'], state['seq'])
+	return b'{"version":"%s","full":%s,"quotes":[%s]}' % (
+		version.encode(), b'true' if full else b'false', b','.join(state['rows'][pk] for pk in ids))
+
+
+@app.task(bind=True, max_retries=LOCK_TIMEOUT // RETRY_DELAY)
+def rebuild_snapshot(self, new_pair=None):
+	"""
+	build_snapshot() for an ingest, retried later while another rebuild holds the lock (it may have read the database
+	before the ingest was committed)
+	"""
+	if build_snapshot(new_pair) is None:
+		raise self.retry(countdown=RETRY_DELAY)
+	return True
+
+
+def refresh_snapshot(sender, quote, **kwargs):
+	"""
+	quote_ingested receiver, the rebuild is queued once committed so the ingest never waits on it
+	"""
+	pair = [quote.from_currency_code, quote.to_currency_code]
+
+	def rebuild():
+		try:
+			rebuild_snapshot.delay(pair)
+		except Exception as e:
+			# Never fail the ingestion for it, the snapshot catches up with the next ingest
+			logger.warning("Could not queue the latest rates snapshot rebuild on quote {0}: {1}".format(quote.pk, e))
+	transaction.on_commit(rebuild)
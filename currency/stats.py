@@ -0,0 +1,207 @@
+import logging
+import math
+import threading
+import time
+from array import array
+from collections import deque
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from currency.models import Currency, latest_quotes, quote_changes, recent_quotes, settled_cursor
+from labs.versions import bump_versions
+
+__author__ = 'chandanojha'
+
+logger = logging.getLogger(__name__)
+
+# ---
+# Rolling statistics of each pair over its last N quotes, for each N of WINDOWS: simple and exponential moving
+# averages of the rate, volatility (stdev of the log returns) and min/max. Every pair keeps its recent rates and
+# returns in ring buffers along with running sums, so a new quote updates them in O(1) (per window). The state is
+# built per process from the latest quotes of each pair (one query) on the first stats request, then follows the new
+# quotes with quote_changes(), only after an ingest bumped VERSION_KEY
+#
+
+WINDOWS = tuple(getattr(settings, 'QUOTE_STATS_WINDOWS', (20, 100, 500)))  # in quotes
+VERSION_KEY = 'currency:stats:version'
+FIELDS = ('id', 'last_refreshed', 'exchange_rate')
+HELD_BACK_RECHECK = 1.0  # seconds between the syncs while quotes are held back (see quote_changes()) and none ingested
+
+
+class PairStats:
+	"""
+	Rolling statistics of a pair, fed its quotes oldest first (older ones than the last are ignored)
+
+	The rate and the log return (from the previous rate) of quote n are kept at n % size of the ring buffers, a
+	window of w then spans the last w rates and returns. Running sums drift with float error, so they are summed
+	afresh each time the buffers wrap around, which keeps the cost O(1) amortized
+	"""
+	__slots__ = ('windows', 'size', 'rates', 'returns', 'count', 'rate_sums', 'return_sums', 'return_squares',
+	             'ewmas', 'lows', 'highs', 'quote_id', 'last_refreshed')
+
+	def __init__(self, windows=WINDOWS):
+		self.windows = windows
+		self.size = max(windows)
+		self.rates, self.returns = array('d', bytes(8 * self.size)), array('d', bytes(8 * self.size))
+		self.count = 0  # quotes pushed
+		self.rate_sums, self.return_sums, self.return_squares = ([0.0] * len(windows) for _ in range(3))
+		self.ewmas = [0.0] * len(windows)
+		# numbers of the quotes in the window by ascending (lows) / descending (highs) rate, the first is the min/max
+		self.lows, self.highs = [deque() for _ in windows], [deque() for _ in windows]
+		self.quote_id = self.last_refreshed = None
+
+	def push(self, quote_id, last_refreshed, rate):
+		if self.last_refreshed is not None and (last_refreshed, quote_id) <= (self.last_refreshed, self.quote_id):
+			return False
+		rate = float(rate)
+		if rate <= 0:
+			return False
+
+		n, size = self.count, self.size
+		slot = n % size
+		ret = math.log(rate / self.rates[(n - 1) % size]) if n else 0.0
+		for k, w in enumerate(self.windows):
+			if n >= w:
+				old_rate, old_return = self.rates[(n - w) % size], self.returns[(n - w) % size]
+			else:
+				old_rate = old_return = 0.0
+			self.rate_sums[k] += rate - old_rate
+			self.return_sums[k] += ret - old_return
+			self.return_squares[k] += ret * ret - old_return * old_return
+			self.ewmas[k] = self.ewmas[k] + 2.0 / (w + 1) * (rate - self.ewmas[k]) if n else rate
+
+			lows, highs = self.lows[k], self.highs[k]
+			while lows and self.rates[lows[-1] % size] >= rate:
+				lows.pop()
+			while highs and self.rates[highs[-1] % size] <= rate:
+				highs.pop()
+			lows.append(n)
+			highs.append(n)
+			for extremes in (lows, highs):
+				if extremes[0] <= n - w:
+					extremes.popleft()
+
+		self.rates[slot], self.returns[slot] = rate, ret
+		self.count = n + 1
+		self.quote_id, self.last_refreshed = quote_id, last_refreshed
+		if self.count % size == 0:
+			self._resum()
+		return True
+
+	def _resum(self):
+		n, size = self.count, self.size
+		for k, w in enumerate(self.windows):
+			positions = [i % size for i in range(max(0, n - w), n)]
+			self.rate_sums[k] = math.fsum(self.rates[i] for i in positions)
+			self.return_sums[k] = math.fsum(self.returns[i] for i in positions)
+			self.return_squares[k] = math.fsum(self.returns[i] ** 2 for i in positions)
+
+	def window(self, k):
+		"""
+		:return: Statistics over the window at 'k' of the windows, see RollingStats.get()
+		"""
+		w, n, size = self.windows[k], self.count, self.size
+		count = min(n, w)
+		returns = count - 1 if n <= w else count  # the first quote has none
+		if returns > 1:
+			mean = self.return_sums[k] / returns
+			variance = max(0.0, (self.return_squares[k] - mean * self.return_sums[k]) / (returns - 1))
+		else:
+			variance = None
+		return {
+			'window': w,
+			'count': count,
+			'sma': self.rate_sums[k] / count,
+			'ewma': self.ewmas[k],
+			'volatility': math.sqrt(variance) if variance is not None else None,
+			'min': self.rates[self.lows[k][0] % size],
+			'max': self.rates[self.highs[k][0] % size],
+		}
+
+
+class RollingStats:
+	"""
+	PairStats of every pair, built from history on first use and kept up to date with the new quotes
+	"""
+	def __init__(self, windows=WINDOWS):
+		self.windows = windows
+		self.pairs = {}
+		self.cursor = None  # quotes up to this id are in, None until built
+		self.version = None  # of VERSION_KEY as of the last sync
+		self.recheck_at = None  # time.monotonic() of the next sync while quotes are held back
+		self._lock = threading.Lock()
+
+	def build(self):
+		"""
+		(Re)builds the state from the latest max(windows) + 1 quotes of each pair (the first for its return only)
+		"""
+		with self._lock:
+			cursor = settled_cursor()
+			pairs = sorted(latest_quotes().values_list('from_currency_code', 'to_currency_code'))
+			states = {}
+			for from_code, to_code, *row in recent_quotes(pairs, max(self.windows) + 1, cursor, FIELDS):
+				stats = states.get((from_code, to_code))
+				if stats is None:
+					stats = states[(from_code, to_code)] = PairStats(self.windows)
+				stats.push(*row)
+			self.pairs, self.cursor, self.version = states, cursor, None
+
+	def sync(self):
+		"""
+		Pushes the quotes added since the last sync (if any was ingested since), the state is built first if not yet
+		"""
+		if self.cursor is None:
+			self.build()
+		cache.add(VERSION_KEY, 0, timeout=None)
+		version = cache.get(VERSION_KEY)
+		if version == self.version and (self.recheck_at is None or time.monotonic() < self.recheck_at):
+			return
+
+		with self._lock:
+			rows = quote_changes(self.cursor, limit=None, queryset=Currency.objects.values_list(
+				'from_currency_code', 'to_currency_code', *FIELDS))
+			for from_code, to_code, *row in rows:
+				stats = self.pairs.get((from_code, to_code))
+				if stats is None:
+					stats = self.pairs[(from_code, to_code)] = PairStats(self.windows)
+				stats.push(*row)
+			if rows:
+				self.cursor = rows[-1][2]
+			held_back = Currency.objects.filter(pk__gt=self.cursor).exists()
+			self.version = version
+			self.recheck_at = time.monotonic() + HELD_BACK_RECHECK if held_back else None
+
+	def get(self, pairs=None):
+		"""
+		:param pairs: List of (from_currency_code, to_currency_code), all if None
+		:return: List of {"pair": "EUR/USD", "quote_id", "last_refreshed", "rate", "windows": [{"window": n, "count",
+			"sma", "ewma", "volatility", "min", "max"}, ...]} of the pairs that have quotes, 'volatility' being the
+			(sample) stdev of the log returns, per quote, None if less than 2 returns
+		"""
+		self.sync()
+		with self._lock:
+			pairs = sorted(self.pairs) if pairs is None else pairs
+			pairs = [p for p in pairs if p in self.pairs and self.pairs[p].count]
+			ret = []
+			for pair in pairs:
+				stats = self.pairs[pair]
+				ret.append({
+					'pair': '{0}/{1}'.format(*pair),
+					'quote_id': stats.quote_id,
+					'last_refreshed': stats.last_refreshed,
+					'rate': stats.rates[(stats.count - 1) % stats.size],
+					'windows': [stats.window(k) for k in range(len(self.windows))],
+				})
+			return ret
+
+
+rolling_stats = RollingStats()
+
+
+def bump_version(sender, quote, **kwargs):
+	"""
+	quote_ingested receiver, once committed so that the syncs see the quote
+	"""
+	transaction.on_commit(lambda: bump_versions(VERSION_KEY))
@@ -0,0 +1,131 @@
+import logging
+from functools import reduce
+from operator import or_
+
+from django.conf import settings
+from django.db.models import Q
+
+from currency.models import Currency, quote_changes
+from currency.serializers import CurrencySerializer
+from labs.asgi import database_sync_to_async
+from labs.pubsub import AsyncSubscription, Broker, SubscriptionOverflow
+from labs.renderers import JSONRenderer
+
+__author__ = 'chandanojha'
+
+logger = logging.getLogger(__name__)
+
+HEARTBEAT_INTERVAL = 15  # seconds, keeps proxies from timing out idle streams and lets us notice gone clients
+RECONNECT_DELAY = 1000  # ms, 'retry' hint for the clients
+REPLAY_LIMIT = 1000  # quotes replayed per connection on resume, client reconnects for the rest
+MAX_PENDING = 1000  # quotes waiting for a slow client before it is disconnected (to resume from where it was)
+
+# One subscription per process, fanned out to all the live streams of that process
+quote_broker = Broker('currency:quotes', url=getattr(settings, 'QUOTE_PUBSUB_URL', None))
+
+
+def pair_topic(from_currency_code, to_currency_code):
+	return '{0}/{1}'.format(from_currency_code, to_currency_code)
+
+
+def render_quote(quote):
+	return JSONRenderer().render(CurrencySerializer(quote).data).decode()
+
+
+def publish_quote(sender, quote, **kwargs):
+	"""
+	quote_ingested receiver, quote is rendered once here and not per client
+	"""
+	try:
+		quote_broker.publish(pair_topic(quote.from_currency_code, quote.to_currency_code),
+		                     {'id': quote.pk, 'json': render_quote(quote)})
+	except Exception as e:
+		# Streams are best effort, never fail the ingestion for them. Clients catch up on reconnect anyway
+		logger.warning("Could not publish quote {0}: {1}".format(quote.pk, e))
+
+
+def sse_event(event_id, data, event='quote'):
+	return 'id: {0}\nevent: {1}\ndata: {2}\n\n'.format(event_id, event, data)
+
+
+def replay_quotes(pairs, last_event_id, limit=REPLAY_LIMIT):
+	"""
+	Quotes of the pairs after the 'last_event_id' one, the settled ones only (see quote_changes()) so that a replay
+	does not pass over a quote still being committed: that one comes live once committed
+	"""
+	queryset = Currency.objects.all()
+	if pairs is not None:
+		pair_filters = [Q(from_currency_code=f, to_currency_code=t) for f, t in pairs]
+		queryset = queryset.filter(reduce(or_, pair_filters)) if pair_filters else queryset.none()
+	return quote_changes(since=last_event_id, limit=limit, queryset=queryset)
+
+
+def rendered_replay(pairs, last_event_id):
+	return [(quote.pk, render_quote(quote)) for quote in replay_quotes(pairs, last_event_id)]
+
+
+def quote_events(pairs=None, last_event_id=None, heartbeat=HEARTBEAT_INTERVAL, max_pending=MAX_PENDING):
+	"""
+	Server-Sent Events stream of new quotes
+
+	:param pairs: List of (from, to) pairs to stream, all if None
+	:param last_event_id: If given, quotes after this id (quote's pk) are replayed first, at most REPLAY_LIMIT of them
+		per connection
+	:return: generator of SSE frames (text), ends when the client can't keep up (or replay is cut short) so that it
+		reconnects and resumes from its last event id
+	"""
+	topics = [pair_topic(*pair) for pair in pairs] if pairs is not None else None
+
+	# Subscribe before the replay so that nothing ingested meanwhile is missed, the replayed ones are skipped. Live
+	# quotes come in commit order, not id order, so only the replayed ids are skipped and not every id below them
+	with quote_broker.subscribe(topics, max_pending=max_pending) as subscription:
+		yield 'retry: {0}\n\n'.format(RECONNECT_DELAY)
+
+		replayed = set()
+		if last_event_id is not None:
+			for quote in replay_quotes(pairs, last_event_id):
+				replayed.add(quote.pk)
+				yield sse_event(quote.pk, render_quote(quote))
+			if len(replayed) >= REPLAY_LIMIT:
+				return
+
+		while True:
+			try:
+				item = subscription.get(timeout=heartbeat)
+			except SubscriptionOverflow:
+				return
+
+			if item is None:
+				yield ': keepalive\n\n'
+			elif item[1]['id'] not in replayed:
+				yield sse_event(item[1]['id'], item[1]['json'])
+
+
+async def quote_events_async(pairs=None, last_event_id=None, heartbeat=HEARTBEAT_INTERVAL, max_pending=MAX_PENDING):
+	"""
+	quote_events() for the async stream view, the stream waits on the event loop instead of holding a thread
+	"""
+	topics = [pair_topic(*pair) for pair in pairs] if pairs is not None else None
+
+	with quote_broker.subscribe(topics, subscription_class=AsyncSubscription, max_pending=max_pending) as subscription:
+		yield 'retry: {0}\n\n'.format(RECONNECT_DELAY)
+
+		replayed = set()
+		if last_event_id is not None:
+			rendered = await database_sync_to_async(rendered_replay)(pairs, last_event_id)
+			for quote_id, data in rendered:
+				replayed.add(quote_id)
+				yield sse_event(quote_id, data)
+			if len(replayed) >= REPLAY_LIMIT:
+				return
+
+		while True:
+			try:
+				item = await subscription.get(timeout=heartbeat)
+			except SubscriptionOverflow:
+				return
+
+			if item is None:
+				yield ': keepalive\n\n'
+			elif item[1]['id'] not in replayed:
+				yield sse_event(item[1]['id'], item[1]['json'])
@@ -0,0 +1,51 @@
+import asyncio
+
+from asgiref.sync import async_to_sync
+from django.test import SimpleTestCase, override_settings
+
+from labs import asgi
+from urls import async_urlpatterns
+
+__author__ = 'chandanojha'
+
+
+class AsyncRouterTest(SimpleTestCase):
+	def setUp(self):
+		self.fallback_scopes = []
+
+		async def fallback(scope, receive, send):
+			self.fallback_scopes.append(scope)
+
+		self.application = asgi.AsyncRouter(async_urlpatterns, fallback)
+
+	def request(self, method, path, headers=()):
+		"""
+		:return: (status, headers) of the response, by header name
+		"""
+		scope = {'type': 'http', 'method': method, 'path': path, 'query_string': b'', 'server': ('testserver', 80),
+		         'headers': [(k.encode(), v.encode()) for k, v in headers]}
+		messages = asyncio.Queue()
+		messages.put_nowait({'type': 'http.request', 'body': b''})
+		sent = []
+
+		async def send(message):
+			sent.append(message)
+
+		async_to_sync(self.application.__call__)(scope, messages.get, send)
+		start = sent[0]
+		return start['status'], {k.decode(): v.decode() for k, v in start['headers']}
+
+	def test_cross_origin_get(self):
+		status, headers = self.request('GET', '/api/v1/quotes/latest/', [('origin', 'https://example.com')])
+		self.assertEqual(status, 401)  # served by the async view, after the middleware
+		self.assertEqual(headers['access-control-allow-origin'], 'https://example.com')
+		self.assertEqual(headers['content-type'], 'application/json')
+		self.assertIn('x-frame-options', headers)
+		self.assertEqual(self.fallback_scopes, [])
+
+	@override_settings(SECURE_SSL_REDIRECT=True)
+	def test_middleware_response(self):
+		self.application = asgi.AsyncRouter(async_urlpatterns, self.application.fallback)  # with the settings
+		status, headers = self.request('GET', '/api/v1/quotes/latest/')
+		self.assertEqual((status, headers['location']), (301, 'https://testserver/api/v1/quotes/latest/'))
+		self.assertEqual(self.fallback_scopes, [])
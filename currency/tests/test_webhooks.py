@@ -0,0 +1,210 @@
+import datetime
+import hashlib
+import hmac
+import json
+import threading
+import time
+from decimal import Decimal
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+
+from django.test import TestCase
+
+from auth.user.models import CustomUser
+from currency import webhooks
+from currency.celery import app
+from currency.models import Currency, WebhookSubscription
+
+__author__ = 'chandanojha'
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+	"""
+	Local webhook receiver: /fast answers right away, /slow after SLOW_DELAY seconds, /failing with a 500. Every
+	request is recorded in the server's 'received' as (path, body, headers), and the client's address (one per
+	connection) in 'connections'
+	"""
+	SLOW_DELAY = 2  # seconds
+	protocol_version = 'HTTP/1.1'  # kept-alive connections
+
+	def do_POST(self):
+		body = self.rfile.read(int(self.headers['Content-Length']))
+		self.server.received.append((self.path, body, dict(self.headers)))
+		self.server.connections.add(self.client_address)
+		if self.path == '/slow':
+			time.sleep(self.SLOW_DELAY)
+		response = b'{"ok":true}'
+		try:
+			self.send_response(500 if self.path == '/failing' else 200)
+			self.send_header('Content-Length', str(len(response)))
+			self.end_headers()
+			self.wfile.write(response)
+		except ConnectionError:
+			pass  # the client gave up (past its deadline)
+
+	def log_message(self, *args):
+		pass
+
+
+class WebhookTestCase(TestCase):
+	@classmethod
+	def setUpClass(cls):
+		super().setUpClass()
+		cls.server = ThreadingHTTPServer(('127.0.0.1', 0), StandInHandler)
+		cls.server.daemon_threads = True
+		threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+		cls.base_url = 'http://127.0.0.1:{0}'.format(cls.server.server_address[1])
+		cls.always_eager, app.conf.task_always_eager = app.conf.task_always_eager, True
+
+	@classmethod
+	def tearDownClass(cls):
+		app.conf.task_always_eager = cls.always_eager
+		cls.server.shutdown()
+		cls.server.server_close()
+		super().tearDownClass()
+
+	def setUp(self):
+		self.server.received, self.server.connections = [], set()
+		self.user = CustomUser.objects.create(username='partner', email='partner@example.com')
+		self.fast = self.subscribe('/fast', pairs='BTC/USD, eur/usd', secret='s3cret')
+		self.slow = self.subscribe('/slow')
+		self.failing = self.subscribe('/failing', pairs='BTC/USD')
+		# the dispatcher's thread is not started, so that drain() flushes all the quotes queued by the test
+		patcher = mock.patch.object(webhooks.dispatcher, '_start')
+		patcher.start()
+		self.addCleanup(patcher.stop)
+
+	def subscribe(self, path, **kwargs):
+		subscription = WebhookSubscription.objects.create(user=self.user, url=self.base_url + path, **kwargs)
+		webhooks.bump_version()  # on commit otherwise, which a TestCase never does
+		return subscription
+
+	def ingest(self, from_code, to_code, rate, minute=0):
+		quote = Currency.objects.create(
+			from_currency_code=from_code, from_currency_name=from_code, to_currency_code=to_code,
+			to_currency_name=to_code, exchange_rate=Decimal(rate), bid_price=Decimal(rate), ask_price=Decimal(rate),
+			last_refreshed=datetime.datetime(2025, 6, 1) + datetime.timedelta(minutes=minute), timezone='UTC')
+		webhooks.queue_quote(sender=Currency, quote=quote)
+		return quote
+
+	def received(self, path):
+		return [(body, headers) for p, body, headers in self.server.received if p == path]
+
+
+class SubscriberTest(WebhookTestCase):
+	def test_wants(self):
+		fast, slow = webhooks.Subscriber(self.fast), webhooks.Subscriber(self.slow)
+		self.assertTrue(fast.wants('BTC/USD'))
+		self.assertTrue(fast.wants('EUR/USD'))
+		self.assertFalse(fast.wants('GBP/USD'))
+		self.assertFalse(fast.wants('USD/BTC'))
+		self.assertTrue(slow.wants('GBP/USD'))
+
+	def test_current_reloads_on_change(self):
+		self.assertEqual({s.id for s in webhooks.subscribers.current()}, {self.fast.pk, self.slow.pk, self.failing.pk})
+		self.slow.is_active = False
+		self.slow.save()
+		webhooks.bump_version()
+		self.assertIsNone(webhooks.subscribers.get(self.slow.pk))
+		self.assertEqual(webhooks.subscribers.get(self.fast.pk).url, self.base_url + '/fast')
+
+	def test_signature(self):
+		body = b'{"quotes":[]}'
+		expected = 'sha256=' + hmac.new(b's3cret', body, hashlib.sha256).hexdigest()
+		self.assertEqual(webhooks.signature('s3cret', body), expected)
+
+
+class DeliveryTest(WebhookTestCase):
+	def test_one_post_per_subscriber_per_flush(self):
+		quotes = [self.ingest('BTC', 'USD', 60000 + i, minute=i) for i in range(5)]
+		quotes.append(self.ingest('EUR', 'USD', '1.1'))
+		quotes.append(self.ingest('GBP', 'USD', '1.3'))
+		with mock.patch.object(webhooks, 'BACKOFF', 0):
+			webhooks.dispatcher.drain()
+
+		ids = lambda body: [q['id'] for q in json.loads(body.decode())['quotes']]
+		(fast_body, fast_headers), = self.received('/fast')
+		self.assertEqual(ids(fast_body), [q.pk for q in quotes[:6]])
+		(slow_body, slow_headers), = self.received('/slow')
+		self.assertEqual(ids(slow_body), [q.pk for q in quotes])
+		self.assertEqual(fast_headers['X-Webhook-Id'], str(self.fast.pk))
+		self.assertEqual(fast_headers['X-Webhook-Signature'], webhooks.signature('s3cret', fast_body))
+		self.assertNotIn('X-Webhook-Signature', slow_headers)
+
+		failing = self.received('/failing')
+		self.assertEqual(len(failing), webhooks.MAX_ATTEMPTS)
+		self.assertEqual(ids(failing[0][0]), [q.pk for q in quotes[:5]])
+
+		self.fast.refresh_from_db()
+		self.failing.refresh_from_db()
+		self.assertIsNotNone(self.fast.last_delivered_at)
+		self.assertEqual((self.failing.failures, self.failing.last_delivered_at), (1, None))
+
+	def test_unsubscribed_quotes_are_not_queued(self):
+		self.slow.delete()
+		webhooks.bump_version()
+		self.ingest('GBP', 'USD', '1.3')
+		with mock.patch.object(webhooks, 'deliver_quotes') as deliver_quotes:
+			webhooks.dispatcher.drain()
+		deliver_quotes.delay.assert_not_called()
+
+	def test_drain_flushes_in_batches(self):
+		for i in range(5):
+			self.ingest('BTC', 'USD', 60000 + i, minute=i)
+		with mock.patch.object(webhooks.dispatcher, 'max_batch', 2), \
+				mock.patch.object(webhooks, 'deliver_quotes') as deliver_quotes:
+			webhooks.dispatcher.drain()
+		self.assertEqual([len(c[0][0]) for c in deliver_quotes.delay.call_args_list], [2, 2, 1])
+		self.assertTrue(webhooks.dispatcher._queue.empty())
+
+	def test_slow_subscriber_does_not_hold_up_the_flush(self):
+		self.ingest('BTC', 'USD', 60000)
+		with mock.patch.object(webhooks, 'post_batch') as post_batch:
+			started = time.monotonic()
+			webhooks.dispatcher.drain()
+		self.assertLess(time.monotonic() - started, 1)
+		self.assertEqual(self.server.received, [])
+		self.assertEqual({c[0][0] for c in post_batch.delay.call_args_list},
+		                 {self.fast.pk, self.slow.pk, self.failing.pk})
+
+	def test_connection_reused(self):
+		for _ in range(3):
+			self.assertTrue(webhooks.post(self.fast.pk, self.fast.url, '', b'{"quotes":[]}'))
+			self.assertFalse(webhooks.post(self.failing.pk, self.failing.url, '', b'{"quotes":[]}'))
+		self.assertEqual(len(self.server.received), 6)
+		self.assertEqual(len(self.server.connections), 1)
+
+	def test_deadline(self):
+		with mock.patch.object(webhooks, 'DEADLINE', 0.5):
+			started = time.monotonic()
+			self.assertFalse(webhooks.post(self.slow.pk, self.slow.url, '', b'{"quotes":[]}'))
+		self.assertLess(time.monotonic() - started, StandInHandler.SLOW_DELAY)
+
+
+class RetryTest(WebhookTestCase):
+	def test_backoff(self):
+		with mock.patch.object(webhooks.retry_delivery, 'apply_async') as apply_async:
+			for attempt in range(1, webhooks.MAX_ATTEMPTS):
+				self.assertFalse(webhooks.retry_delivery(self.failing.pk, '{"quotes":[]}', attempt))
+		self.assertEqual([c[1]['countdown'] for c in apply_async.call_args_list],
+		                 [webhooks.BACKOFF * 2 ** i for i in range(webhooks.MAX_ATTEMPTS - 1)])
+		self.assertEqual([c[0][0][2] for c in apply_async.call_args_list], list(range(2, webhooks.MAX_ATTEMPTS + 1)))
+
+	def test_retry_succeeds(self):
+		WebhookSubscription.objects.filter(pk=self.fast.pk).update(failures=3)
+		self.assertTrue(webhooks.retry_delivery(self.fast.pk, '{"quotes":[]}', 3))
+		self.fast.refresh_from_db()
+		self.assertEqual(self.fast.failures, 0)
+
+	def test_deactivated_after_max_failures(self):
+		WebhookSubscription.objects.filter(pk=self.failing.pk).update(failures=webhooks.MAX_FAILURES - 2)
+		for _ in range(2):
+			self.assertFalse(webhooks.retry_delivery(self.failing.pk, '{"quotes":[]}', webhooks.MAX_ATTEMPTS))
+		self.failing.refresh_from_db()
+		self.assertEqual(self.failing.failures, webhooks.MAX_FAILURES)
+		self.assertFalse(self.failing.is_active)
+		self.assertIsNone(webhooks.subscribers.get(self.failing.pk))
+
+		received = len(self.server.received)
+		self.assertFalse(webhooks.retry_delivery(self.failing.pk, '{"quotes":[]}', 2))
+		self.assertEqual(len(self.server.received), received)
@@ -0,0 +1,60 @@
+from django.utils.translation import ugettext_lazy as _
+
+
+
+# -------------------------------------
+# Easy accessor methods for this app (group=app_label)
+#
+from labs import texts
+
+
+def register_app_texts(txt_dict):
+	return texts.register_texts('currency', txt_dict)
+
+
+def get_app_text(key, *args, **kwargs):
+	return texts.get_text('currency', key, *args, **kwargs)
+
+
+# -------------------------------------
+# app-wide texts, see auth/staff/texts.py for the usage notes
+#
+register_app_texts({
+	'invalid_currency_codes': _("Enter valid currency codes."),
+	'invalid_output_{0}': _("Invalid output format `{0}`, should be one of: ndjson, csv"),
+	'invalid_bucket_{0}': _("Invalid bucket `{0}`, should be like 15m, 1h, 1d or 1w"),
+	'invalid_aggregate_field_{0}': _("Can not aggregate on `{0}`, should be one of: exchange_rate, bid_price, ask_price"),
+	'invalid_aggregates_{0}': _("Invalid aggregates `{0}`, should be one or more of: avg, min, max, sum, first, last, count"),
+	'invalid_pair_{0}': _("Invalid currency pair `{0}`, should be like BTC/USD"),
+	'too_many_pairs_{0}': _("Too many pairs, at most {0} are allowed"),
+	'quote_job_failed': _("Could not fetch the quote, please try again."),
+	'invalid_async_{0}': _("Invalid async `{0}`, should be true or false"),
+	'invalid_cursor_{0}': _("Invalid cursor `{0}`, should be the cursor returned by the previous call"),
+	'invalid_snapshot_version_{0}': _("Invalid snapshot version `{0}`, should be the X-Snapshot-Version returned earlier"),
+	'invalid_conversion_items': _("Items should be a list of {amount, from, to, as_of} objects"),
+	'missing_column_{0}': _("Missing `{0}` of the items"),
+	'conversion_columns_mismatch': _("All the item columns should be of the same length"),
+	'too_many_items_{0}': _("Too many items, at most {0} are allowed"),
+	'invalid_amount_{0}_{1}': _("Invalid amount `{1}` of item {0}"),
+	'invalid_as_of_{0}_{1}': _("Invalid as_of `{1}` of item {0}, should be an ISO date-time"),
+	'invalid_rounding_{0}': _("Invalid rounding `{0}`, should be one of: half_even, half_up, down, up"),
+	'invalid_places_{0}': _("Invalid places `{0}`, should be 0 to 10"),
+	'no_rate_{0}_{1}': _("No rate for {0}/{1}"),
+	'invalid_min_profit_{0}': _("Invalid min_profit `{0}`, should be a number like 0.001 (for 0.1%)"),
+	'invalid_at_{0}': _("Invalid time `{0}`, should be an ISO date-time"),
+	'asof_pair_and_at_required': _("Both `pair` and `at` are required"),
+	'invalid_asof_queries': _("Queries should be a list of {pair, at} objects, or a pair with a list of times as {pair, at: [...]}"),
+	'invalid_amount_{0}': _("Invalid amount `{0}`"),
+	'ledger_missing_column_{0}': _("Ledger has no `{0}` column"),
+	'ledger_ragged_rows': _("Ledger rows do not match its header"),
+	'parquet_unavailable': _("Parquet files need pyarrow, which is not installed"),
+	'invalid_holdings': _("Holdings should be a list of {currency, amount} objects"),
+	'portfolio_currency_required': _("The `currency` to value the holdings in is required"),
+	'invalid_window_{0}': _("Invalid window `{0}`, should be like 12h, 30d or 8w"),
+	'too_many_buckets_{0}': _("Too many buckets in the window, at most {0} are allowed, use a larger bucket"),
+	'invalid_max_points_{0}_{1}': _("Invalid max_points `{0}`, should be 3 to {1}"),
+	'invalid_threshold_{0}': _("Invalid threshold `{0}`, should be a positive rate"),
+	'alert_subject_{0}_{1}_{2}': _("{0} is {1} {2}"),
+	'alert_message_{0}_{1}_{2}_{3}_{4}': _("{0} crossed {1} your alert threshold of {2}, it is at {3} as of {4}."),
+	'invalid_last_event_id_{0}': _("Invalid last event id `{0}`, should be a quote id"),
+})
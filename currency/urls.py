@@ -1,8 +1,33 @@
 from django.conf.urls import url
-from currency import views
+from currency import async_views, views
 
 
 urlpatterns = [
     url(r'^quotes/$', views.CurrencyView.as_view(), name='currency-main'),
+    url(r'^quotes/export/$', views.CurrencyExportView.as_view(), name='currency-export'),
+    url(r'^quotes/aggregate/$', views.CurrencyAggregateView.as_view(), name='currency-aggregate'),
+    url(r'^quotes/latest/$', views.CurrencyLatestView.as_view(), name='currency-latest'),
+    url(r'^quotes/snapshot/$', views.CurrencySnapshotView.as_view(), name='currency-snapshot'),
+    url(r'^quotes/cross/$', views.CurrencyCrossView.as_view(), name='currency-cross'),
+    url(r'^quotes/arbitrage/$', views.CurrencyArbitrageView.as_view(), name='currency-arbitrage'),
+    url(r'^quotes/stats/$', views.CurrencyStatsView.as_view(), name='currency-stats'),
+    url(r'^quotes/asof/$', views.CurrencyAsOfView.as_view(), name='currency-asof'),
+    url(r'^quotes/changes/$', views.CurrencyChangesView.as_view(), name='currency-changes'),
+    url(r'^quotes/jobs/(?P<job_id>[0-9a-f-]+)/$', views.CurrencyJobView.as_view(), name='currency-job'),
+    url(r'^quotes/stream/$', views.CurrencyStreamView.as_view(), name='currency-stream'),
+    url(r'^convert/batch/$', views.ConvertBatchView.as_view(), name='convert-batch'),
+    url(r'^analytics/correlation/$', views.CorrelationView.as_view(), name='analytics-correlation'),
+    url(r'^alerts/$', views.PriceAlertListView.as_view(), name='price-alert-list'),
+    url(r'^alerts/(?P<pk>[0-9]+)/$', views.PriceAlertView.as_view(), name='price-alert'),
+    url(r'^webhooks/$', views.WebhookListView.as_view(), name='webhook-list'),
+    url(r'^webhooks/(?P<pk>[0-9]+)/$', views.WebhookView.as_view(), name='webhook'),
+    url(r'^portfolio/value/$', views.PortfolioValueView.as_view(), name='portfolio-value'),
 
 ]
+
+# Served by asgi.py, ahead of the (sync) views above for the http methods they implement
+async_urlpatterns = [
+    (r'^quotes/$', async_views.AsyncCurrencyView.as_asgi()),
+    (r'^quotes/latest/$', async_views.AsyncCurrencyLatestView.as_asgi()),
+    (r'^quotes/stream/$', async_views.AsyncCurrencyStreamView.as_asgi()),
+]
@@ -0,0 +1,63 @@
+import datetime
+
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from currency.texts import get_app_text as _t
+from labs import utils
+from labs.exceptions import ValidationError
+
+__author__ = 'chandanojha'
+
+
+def pair_list(pairs):
+	"""
+	:param pairs: Comma separated currency pairs like 'BTC/USD,EUR/USD' (or a list of such strings)
+	:return: List of upper-cased (from_currency_code, to_currency_code) tuples in the given order without duplicates,
+		None if 'pairs' is None
+	"""
+	pairs = utils.str_list(pairs)
+	if pairs is None:
+		return None
+
+	ret, seen = [], set()
+	for pair in pairs:
+		codes = parse_pair(pair)
+		if codes not in seen:
+			seen.add(codes)
+			ret.append(codes)
+	return ret
+
+
+def parse_pair(pair):
+	"""
+	:param pair: Currency pair like 'BTC/USD'
+	:return: Upper-cased (from_currency_code, to_currency_code) tuple
+	"""
+	codes = tuple(c.strip().upper() for c in pair.split('/')) if isinstance(pair, str) else ()
+	if len(codes) != 2 or not all(codes):
+		raise ValidationError(_t('invalid_pair_{0}', pair))
+	return codes
+
+
+def parse_time(value):
+	"""
+	:param value: ISO date-time string
+	:return: Naive datetime (quote times are naive, see Currency.last_refreshed), None if 'value' is not one
+	"""
+	if not isinstance(value, str):
+		return None
+	try:
+		parsed = datetime.datetime.fromisoformat(value)  # fast path, most of the times are in this form
+	except ValueError:
+		parsed = parse_datetime(value)
+	return naive_time(parsed) if parsed is not None else None
+
+
+def naive_time(value):
+	"""
+	:return: The datetime as naive in settings.TIME_ZONE (like the quote times), converted to it first if aware
+	"""
+	if timezone.is_aware(value):
+		return timezone.make_naive(value, timezone.get_default_timezone())
+	return value
@@ -1,11 +1,42 @@
+from itertools import repeat
+
+from celery.result import AsyncResult
+from django.db import transaction
+from django.http import HttpResponse, HttpResponseNotModified, StreamingHttpResponse
+from django.urls import reverse
 from django_filters import FilterSet
+from rest_framework import status
+from rest_framework.exceptions import ParseError
 from rest_framework.response import Response
+from rest_framework.settings import api_settings
 
 from auth.staff.permissions import StaffViewMixin
-from currency.main import get_price
+from currency import arbitrage
+from currency.alerts import bump_pair_versions
+from currency.aggregates import aggregate_quotes
+from currency.asof import asof_rates
+from currency.convert import convert_batch, item_columns, parse_places
+from currency.correlation import correlation
+from currency.cross import PIVOT, pivot_rates
+from currency.downsample import downsampled, parse_max_points
+from currency.celery import app
+from currency.main import get_price, fetch_price
+from currency.models import latest_quotes, quote_changes
+from currency.portfolio import holding_columns, value_portfolio
+from currency.stream import quote_events
+from currency.texts import get_app_text as _t
+from currency.utils import pair_list, parse_pair, parse_time
+from labs import utils
+from labs.exceptions import NotFound, ValidationError
+from labs.generics import EmptySerializer
 from labs.ordering import OrderingMixin
+from labs.parsers import CSVParser
+from labs.renderers import EventStreamRenderer
 from currency.serializers import *
-from labs.views import ListCreateAPIView
+from currency.snapshot import get_snapshot, parse_version, snapshot_delta
+from currency.stats import rolling_stats
+from labs.streaming import STREAM_CHUNK_SIZE, STREAM_FORMATS, streaming_response
+from labs.views import CreateAPIView, ListCreateAPIView, ListAPIView, RetrieveAPIView, RetrieveUpdateDestroyAPIView
 
 
 class CurrencyFilter(FilterSet):
@@ -31,11 +62,646 @@ class CurrencyView(StaffViewMixin, OrderingMixin, ListCreateAPIView):
 	filter_class = CurrencyFilter
 	ordering = '-id'
 	
+	def list_or_raise(self, request, *args, **kwargs):
+		"""
+		Paginated quote history. With `max_points=N` (3 to 10000) it is downsampled instead to at most N quotes per
+		pair (LTTB over the exchange rates, keeping the shape of the chart) and returned unpaginated, ordered by pair
+		and last_refreshed.
+		"""
+		max_points = parse_max_points(utils.query_param(request, 'max_points'))
+		if max_points is None:
+			return super().list_or_raise(request, *args, **kwargs)
+		
+		queryset = downsampled(self.filter_queryset(self.get_queryset()), max_points)
+		return Response(self.get_serializer(queryset, many=True).data)
+	
+	def post(self, request, *args, **kwargs):
+		"""
+		Fetches a new quote for the given pair from upstream and returns it.
+
+		With `async=true` (or `Prefer: respond-async` header) the fetch is queued instead and 202 is returned right
+		away with the job id, poll quotes/jobs/{job_id}/ for the result.
+		"""
+		return super().post(request, *args, **kwargs)
+	
+	def is_async_request(self):
+		return is_async_request(self.request)
+	
 	def perform_create(self, serializer):
 		from_currency = serializer.validated_data['from_currency_code']
 		to_currency = serializer.validated_data['to_currency_code']
 
+		if self.is_async_request():
+			return queue_quote_job(from_currency, to_currency, self.request)
+
 		data = get_price(from_currency, to_currency)
 		
 		return Response(data=CurrencySerializer(data).data)
+
+
+def is_async_request(request):
+	prefer = request.META.get('HTTP_PREFER', '')
+	value = utils.query_param(request, 'async', False)
+	try:
+		return utils.as_bool(value) or 'respond-async' in prefer
+	except ValueError:
+		raise ValidationError(_t('invalid_async_{0}', value))
+
+
+def queue_quote_job(from_currency, to_currency, request):
+	""" Queues fetch_price() for the pair, :return: 202 response with the job status """
+	job = fetch_price.delay(from_currency, to_currency)
+	return Response(data=quote_job_data(job, request), status=status.HTTP_202_ACCEPTED,
+	                headers={'Location': reverse('currency-job', kwargs={'job_id': job.id})})
+
+
+def quote_job_data(job, request):
+	"""
+	:param job: AsyncResult of a fetch_price task
+	:return: Job status (pending, running, done or failed) along with the quote if done or the error if failed
+	"""
+	data = {'job_id': job.id, 'url': request.build_absolute_uri(reverse('currency-job', kwargs={'job_id': job.id}))}
+	if job.state == 'SUCCESS':
+		data['status'] = 'done'
+		data['quote'] = CurrencySerializer(Currency.objects.get(pk=job.result)).data
+	elif job.state == 'FAILURE':
+		data['status'] = 'failed'
+		data['message'] = getattr(job.result, 'message', None) or _t('quote_job_failed')
+	else:
+		data['status'] = 'running' if job.state == 'STARTED' else 'pending'
+	return data
+
+
+class CurrencyExportView(StaffViewMixin, OrderingMixin, ListAPIView):
+	"""
+	Streams the complete (filtered) quote history as NDJSON (default) or CSV, no pagination.
+
+	Takes all the CurrencyFilter filters plus `ordering`, `ids` and `fields` like the list view, use `output=csv`
+	for CSV. Rows are read through a server-side cursor in chunks so the memory stays flat whatever the size.
+	`max_points=N` downsamples it to at most N quotes per pair, like the list view.
+	"""
+	model_class = Currency
+	serializer_class = CurrencySerializer
+	filter_class = CurrencyFilter
+	ordering = '-id'
+	chunk_size = STREAM_CHUNK_SIZE
+	
+	def get_export_fields(self):
+		field_names = [f.attname for f in self.model_class._meta.concrete_fields]
+		requested = utils.str_list(utils.query_param(self.request, 'fields'))
+		if requested:
+			field_names = [f for f in field_names if f in requested] or field_names
+		return field_names
+	
+	def list_or_raise(self, request, *args, **kwargs):
+		output_format = utils.query_param(request, 'output', 'ndjson')
+		if output_format not in STREAM_FORMATS:
+			raise ValidationError(_t('invalid_output_{0}', output_format))
+		
+		field_names = self.get_export_fields()
+		queryset = self.filter_queryset(self.get_queryset())
+		max_points = parse_max_points(utils.query_param(request, 'max_points'))
+		if max_points is not None:
+			queryset = downsampled(queryset, max_points)
+		queryset = queryset.values_list(*field_names)
+		return streaming_response(field_names, queryset.iterator(chunk_size=self.chunk_size),
+		                          output_format=output_format, filename='quotes')
+
+
+class CurrencyAggregateView(StaffViewMixin, ListAPIView):
+	"""
+	Time bucketed aggregates of quotes, one row per pair and bucket, grouped in database.
+
+	Takes all the CurrencyFilter filters plus:
+		bucket: bucket width like 15m, 1h, 1d or 1w, default=1h
+		agg: comma separated aggregates out of avg, min, max, sum, first, last, count, default=avg,min,max,last
+		field: field to aggregate out of exchange_rate, bid_price, ask_price, default=exchange_rate
+	"""
+	model_class = Currency
+	serializer_class = EmptySerializer
+	filter_class = CurrencyFilter
+	
+	def list_or_raise(self, request, *args, **kwargs):
+		# No serializing, rows are already plain dicts (like IdListModelMixin)
+		queryset = aggregate_quotes(
+			self.filter_queryset(self.get_queryset()),
+			bucket=utils.query_param(request, 'bucket', '1h'),
+			aggs=utils.str_list(utils.query_param(request, 'agg', 'avg,min,max,last')),
+			field_name=utils.query_param(request, 'field', 'exchange_rate'))
+		
+		page = self.paginate_queryset(queryset)
+		if page is not None:
+			return self.get_paginated_response(page)
+		
+		return Response(list(queryset))
+
+
+class CurrencyLatestView(StaffViewMixin, ListAPIView):
+	"""
+	Latest quote for each of the requested pairs in one query, no pagination.
+
+		pairs: comma separated pairs like BTC/USD,EUR/USD, quotes are returned in the same order. If not given then
+			latest quote of every pair matching the CurrencyFilter filters is returned
+	"""
+	model_class = Currency
+	serializer_class = CurrencySerializer
+	filter_class = CurrencyFilter
+	max_pairs = 1000
+	
+	def list_or_raise(self, request, *args, **kwargs):
+		quotes = requested_latest_quotes(request, self.filter_queryset(self.get_queryset()), self.max_pairs)
+		serializer = self.get_serializer(quotes, many=True)
+		return Response(serializer.data)
+
+
+def requested_latest_quotes(request, queryset, max_pairs):
+	"""
+	:param queryset: Filtered queryset, used if the request has no 'pairs'
+	:return: Latest quotes of the requested pairs (see CurrencyLatestView)
+	"""
+	pairs = pair_list(utils.query_param(request, 'pairs'))
+	if pairs is None:
+		return latest_quotes(queryset=queryset)
+	elif len(pairs) > max_pairs:
+		raise ValidationError(_t('too_many_pairs_{0}', max_pairs))
+	return latest_quotes(pairs)
+
+
+class CurrencySnapshotView(StaffViewMixin, ListAPIView):
+	"""
+	Latest quote of every pair, as rendered on the last ingest (no queries, no serialization). Same as
+	quotes/latest/ without any parameters, in pair order.
+
+	Sent gzipped to the clients which accept it. Has a strong ETag, send it back in `If-None-Match` to get a 304 if
+	nothing was ingested since.
+
+		since: snapshot version (X-Snapshot-Version header) the client already has, to get only the pairs that changed
+			since then as {"version": ..., "full": false, "quotes": [...]}. All the pairs are returned, with full=true,
+			if the version is too old
+	"""
+	model_class = Currency
+	serializer_class = EmptySerializer
+	
+	def list_or_raise(self, request, *args, **kwargs):
+		since = utils.query_param(request, 'since')
+		if since is None:
+			return snapshot_response(request, get_snapshot())
+		
+		version = parse_version(since)
+		if version is None:
+			raise ValidationError(_t('invalid_snapshot_version_{0}', since))
+		return HttpResponse(snapshot_delta(version), content_type='application/json')
+
+
+def snapshot_response(request, snapshot):
+	gzipped = 'gzip' in request.META.get('HTTP_ACCEPT_ENCODING', '')
+	# each content-coding is a different representation, so a different (strong) etag
+	etag = snapshot['etag'][:-1] + '-gzip"' if gzipped else snapshot['etag']
 	
+	if_none_match = [t.strip() for t in request.META.get('HTTP_IF_NONE_MATCH', '').split(',')]
+	if etag in if_none_match or '*' in if_none_match:
+		response = HttpResponseNotModified()
+	else:
+		response = HttpResponse(snapshot['gzip' if gzipped else 'json'], content_type='application/json')
+		if gzipped:
+			response['Content-Encoding'] = 'gzip'
+	
+	response['ETag'] = etag
+	response['Vary'] = 'Accept-Encoding'
+	response['Cache-Control'] = 'no-cache'  # may be cached, but revalidated every time
+	response['X-Snapshot-Version'] = snapshot['version']
+	return response
+
+
+class CurrencyCrossView(StaffViewMixin, ListAPIView):
+	"""
+	Cross rates of any pairs, triangulated from the latest quote of each currency against the pivot currency (USD by
+	default): EUR/JPY is EUR/USD over JPY/USD, bid and ask propagated from the legs. Served from memory, no pagination.
+
+		pairs: comma separated pairs like EUR/JPY,GBP/EUR, returned in the same order (pairs of currencies without a
+			quote against the pivot are skipped)
+		currencies: comma separated currencies, every pair among them is returned. If neither is given, every pair of
+			the currencies quoted against the pivot
+
+	Each rate has `derived` false only if it is a stored quote as is, `via` the pivot if triangulated and `quote_ids`
+	of its legs. Quoting N currencies against the pivot (N upstream calls) covers all the N² pairs
+	"""
+	model_class = Currency
+	serializer_class = EmptySerializer
+	max_pairs = 1000
+	
+	def list_or_raise(self, request, *args, **kwargs):
+		rates = pivot_rates()
+		pairs = pair_list(utils.query_param(request, 'pairs'))
+		if pairs is None:
+			currencies = utils.str_list(utils.query_param(request, 'currencies'))
+			pairs = rates.all_pairs([c.upper() for c in currencies] if currencies is not None else None)
+		elif len(pairs) > self.max_pairs:
+			raise ValidationError(_t('too_many_pairs_{0}', self.max_pairs))
+		
+		# No serializing, rates are already plain dicts (like CurrencyAggregateView)
+		return Response(rates.cross_rates(pairs), headers={'X-Pivot-Currency': PIVOT})
+
+
+class CurrencyArbitrageView(StaffViewMixin, ListAPIView):
+	"""
+	Inconsistent cycles among the latest quotes, i.e. rates (mid) which multiply round a cycle of currencies to more
+	than 1 + QUOTE_INCONSISTENCY_THRESHOLD, e.g. EUR/USD x USD/JPY x JPY/EUR. Mostly a stale or bad quote, look for
+	the odd one out of its `quote_ids`. Kept up to date on every ingest, no queries.
+
+		min_profit: report only the cycles off by more than this (relative, e.g. 0.01 for 1%)
+		scan: true to rescan all the latest quotes first (one query) instead of the state kept on ingest
+
+	Returns {"checked_at": ..., "cycles": [{"currencies": [...], "profit": ..., "quote_ids": [...]}]}, most off first
+	"""
+	model_class = Currency
+	serializer_class = EmptySerializer
+	
+	def list_or_raise(self, request, *args, **kwargs):
+		min_profit = utils.query_param(request, 'min_profit', arbitrage.MIN_PROFIT)
+		try:
+			min_profit = float(min_profit)
+		except ValueError:
+			raise ValidationError(_t('invalid_min_profit_{0}', min_profit))
+		
+		state = arbitrage.scan() if utils.as_bool(utils.query_param(request, 'scan', False)) else arbitrage.get_state()
+		cycles = sorted((c for c in state['cycles'].values() if c['profit'] > min_profit), key=lambda c: -c['profit'])
+		return Response({'checked_at': state['checked_at'], 'cycles': cycles})
+
+
+class CurrencyStatsView(StaffViewMixin, ListAPIView):
+	"""
+	Rolling statistics of each pair over its last N quotes, for each N of QUOTE_STATS_WINDOWS: sma, ewma (span N),
+	volatility (sample stdev of the log returns, per quote) and min/max of the rate. Kept in memory and updated on
+	every new quote, the history table is not read.
+
+		pairs: comma separated list of pairs like BTC/USD,EUR/USD, all if not given
+
+	Returns [{"pair": "BTC/USD", "quote_id": ..., "last_refreshed": ..., "rate": ..., "windows": [{"window": 20,
+	"count": ..., "sma": ..., "ewma": ..., "volatility": ..., "min": ..., "max": ...}, ...]}, ...]
+	"""
+	model_class = Currency
+	serializer_class = EmptySerializer
+	max_pairs = 1000
+	
+	def list_or_raise(self, request, *args, **kwargs):
+		pairs = pair_list(utils.query_param(request, 'pairs'))
+		if pairs is not None and len(pairs) > self.max_pairs:
+			raise ValidationError(_t('too_many_pairs_{0}', self.max_pairs))
+		return Response(rolling_stats.get(pairs))
+
+
+class CorrelationView(StaffViewMixin, ListAPIView):
+	"""
+	Correlation matrix of the pairs' log returns over the last `window`, sampled per `bucket` (the last rate of each
+	pair in a bucket, carried forward when it has none). Computed from one grouped query, and cached till the next
+	ingest.
+
+		window: like 30d (default), 12h or 8w
+		bucket: like 1h (default), 15m or 1d
+		pairs: comma separated list of pairs like BTC/USD,EUR/USD, all the ones quoted in the window if not given
+
+	Returns {"window", "bucket", "start", "end", "pairs": [...], "returns": [...], "matrix": [[...], ...]}, 'returns'
+	being the number of returns of each pair and the matrix null where two pairs have too few returns in common
+	"""
+	model_class = Currency
+	serializer_class = EmptySerializer
+	max_pairs = 1000
+	
+	def list_or_raise(self, request, *args, **kwargs):
+		pairs = pair_list(utils.query_param(request, 'pairs'))
+		if pairs is not None and len(pairs) > self.max_pairs:
+			raise ValidationError(_t('too_many_pairs_{0}', self.max_pairs))
+		return Response(correlation(utils.query_param(request, 'window', '30d'),
+		                            utils.query_param(request, 'bucket', '1h'), pairs))
+
+
+class CurrencyAsOfView(StaffViewMixin, ListCreateAPIView):
+	"""
+	Rate of a pair in effect at a given time, i.e. the pair's latest quote refreshed at or before it.
+
+	GET for one, with `pair` like EUR/USD and `at` an ISO date-time. 404 if the pair has no quote by then.
+
+	POST for many in one call, as {"queries": [{"pair": "EUR/USD", "at": "2024-03-31T16:00:00"}, ...]} or, for one
+	pair, {"pair": "EUR/USD", "at": [...]}. Returns {"count": n, "results": [...]} in the same order, with null rates
+	for the queries without one.
+
+	Results are {"pair", "at", "quote_id", "exchange_rate", "bid_price", "ask_price", "last_refreshed"}, looked up
+	in the pair histories kept in memory (see currency.asof) i.e. no query per lookup
+	"""
+	model_class = Currency
+	serializer_class = EmptySerializer
+	max_queries = 100000
+	
+	def list_or_raise(self, request, *args, **kwargs):
+		pair, at = utils.query_param(request, 'pair'), utils.query_param(request, 'at')
+		if not pair or not at:
+			raise ValidationError(_t('asof_pair_and_at_required'))
+		
+		result = self.lookup([pair], [at])[0]
+		if result['quote_id'] is None:
+			raise NotFound(detail=_t('no_rate_{0}_{1}', *parse_pair(pair)))
+		return Response(result)
+	
+	def create_or_raise(self, request, *args, **kwargs):
+		data = request.data
+		if isinstance(data, dict) and isinstance(data.get('at'), list):
+			pairs, times = [data.get('pair')] * len(data['at']), data['at']
+		else:
+			queries = data.get('queries') if isinstance(data, dict) else data
+			if not isinstance(queries, list) or not all(isinstance(q, dict) for q in queries):
+				raise ValidationError(_t('invalid_asof_queries'))
+			pairs, times = [q.get('pair') for q in queries], [q.get('at') for q in queries]
+		
+		if len(times) > self.max_queries:
+			raise ValidationError(_t('too_many_items_{0}', self.max_queries))
+		results = self.lookup(pairs, times)
+		return Response({'count': len(results), 'results': results})
+	
+	@staticmethod
+	def lookup(pairs, times):
+		parsed = {}
+		for pair in set(map(str, pairs)):
+			parsed[pair] = parse_pair(pair)
+		pairs = [parsed[str(pair)] for pair in pairs]
+		
+		datetimes = list(map(parse_time, times))
+		for at, parsed_at in zip(times, datetimes):
+			if parsed_at is None:
+				raise ValidationError(_t('invalid_at_{0}', at))
+		
+		rows = asof_rates.lookup(pairs, datetimes)
+		return [{
+			'pair': '{0}/{1}'.format(*pair),
+			'at': at,
+			'quote_id': row and row[0],
+			'exchange_rate': row and format(row[2], 'f'),
+			'bid_price': row and format(row[3], 'f'),
+			'ask_price': row and format(row[4], 'f'),
+			'last_refreshed': row and row[1],
+		} for pair, at, row in zip(pairs, times, rows)]
+
+
+class CurrencyChangesView(StaffViewMixin, ListAPIView):
+	"""
+	Change feed for mirroring the quotes incrementally: quotes inserted after the given cursor, oldest first.
+
+		since: cursor returned by the previous call, 0 (or none) to start from the beginning
+		limit: max quotes per call, default=1000 (max 10000)
+
+	Takes the CurrencyFilter filters and `fields` too. Returns {"cursor": ..., "has_more": ..., "results": [...]},
+	call again with the returned cursor (right away while has_more, else on the next sync). Cursor moves only forward
+	and does not skip the quotes that commit late
+
+	Quotes after a transaction still in flight are held back till it ends, and that is any transaction of the database
+	server (any database) holding a transaction id, so one long-running or idle-in-transaction session stalls the feed.
+	Transactions in flight for more than QUOTE_CHANGES_MAX_HOLD_BACK seconds are not waited for, the quotes they
+	commit afterwards are missed (see currency.models.settled_horizon()), and so may be the quotes not inserted by the
+	ingestion (see currency.models.take_txid())
+	"""
+	model_class = Currency
+	serializer_class = CurrencySerializer
+	filter_class = CurrencyFilter
+	default_limit = 1000
+	max_limit = 10000
+	
+	def list_or_raise(self, request, *args, **kwargs):
+		since = utils.query_param(request, 'since') or 0
+		try:
+			since = int(since)
+		except ValueError:
+			raise ValidationError(_t('invalid_cursor_{0}', since))
+		
+		limit = utils.int_list(utils.query_param(request, 'limit')) or [self.default_limit]
+		limit = max(1, min(limit[0], self.max_limit))
+		
+		quotes = quote_changes(since, limit + 1, queryset=self.filter_queryset(self.get_queryset()))
+		has_more = len(quotes) > limit
+		quotes = quotes[:limit]
+		return Response({
+			'cursor': str(quotes[-1].pk if quotes else since),
+			'has_more': has_more,
+			'results': self.get_serializer(quotes, many=True).data,
+		})
+
+
+class CurrencyJobView(StaffViewMixin, RetrieveAPIView):
+	"""
+	Status of an async quote request (see CurrencyView.post), with the quote once done. Unknown (or expired) job ids
+	are reported as pending, as that is all the result backend can tell
+	"""
+	model_class = Currency
+	serializer_class = EmptySerializer
+	
+	def retrieve_or_raise(self, request, *args, **kwargs):
+		return Response(quote_job_data(AsyncResult(kwargs['job_id'], app=app), request))
+
+
+class CurrencyStreamView(StaffViewMixin, ListAPIView):
+	"""
+	Live stream of newly ingested quotes as Server-Sent Events, each event's id is the quote id.
+
+		pairs: comma separated pairs like BTC/USD,EUR/USD to stream, all if not given
+		last_event_id: resume after this quote id (also taken from `Last-Event-ID` header, as sent by EventSource on
+			reconnect), missed quotes are replayed first
+	"""
+	model_class = Currency
+	serializer_class = EmptySerializer
+	renderer_classes = api_settings.DEFAULT_RENDERER_CLASSES + [EventStreamRenderer]
+	
+	def list_or_raise(self, request, *args, **kwargs):
+		response = StreamingHttpResponse(quote_events(*stream_params(request)), content_type='text/event-stream')
+		for header, value in STREAM_HEADERS:
+			response[header] = value
+		return response
+
+
+STREAM_HEADERS = (
+	('Cache-Control', 'no-cache'),
+	('X-Accel-Buffering', 'no'),  # don't let nginx buffer the events
+)
+
+
+def stream_params(request):
+	""" :return: (pairs, last_event_id) of a stream request, see CurrencyStreamView """
+	pairs = pair_list(utils.query_param(request, 'pairs'))
+	last_event_id = request.META.get('HTTP_LAST_EVENT_ID') or utils.query_param(request, 'last_event_id')
+	if last_event_id is not None:
+		try:
+			last_event_id = int(last_event_id)
+		except ValueError:
+			raise ValidationError(_t('invalid_last_event_id_{0}', last_event_id))
+	return pairs, last_event_id
+
+
+class ConvertBatchView(StaffViewMixin, CreateAPIView):
+	"""
+	Converts a batch of up to 1M amounts in one call, results are in the same order.
+
+	Items are {"amount": "12.50", "from": "EUR", "to": "USD", "as_of": "2024-03-01T10:00:00"} (as_of is optional,
+	latest rate if not given) sent as {"items": [...]}, or column-wise as {"data": {"amount": [...], "from": [...],
+	...}}, or as CSV (Content-Type: text/csv) with a header line amount,from,to[,as_of] in which case the result is
+	CSV too.
+
+		places: decimal places of the converted amounts, default=2
+		rounding: half_even (default), half_up, down (towards zero) or up (away from zero), applied to the exact
+			amount * rate
+
+	Returns {"count": n, "converted": [...], "rates": [...], "errors": [{"index": i, "message": ...}]}, converted and
+	rate being null for the items that have no rate (listed in errors)
+	"""
+	model_class = Currency
+	serializer_class = EmptySerializer
+	parser_classes = api_settings.DEFAULT_PARSER_CLASSES + [CSVParser]
+	
+	def create_or_raise(self, request, *args, **kwargs):
+		try:
+			options = request.data if isinstance(request.data, dict) else {}
+		except ParseError as e:
+			raise ValidationError(detail=e)
+		places = parse_places(options.get('places', utils.query_param(request, 'places', 2)))
+		rounding = options.get('rounding') or utils.query_param(request, 'rounding', 'half_even')
+		
+		amounts, from_codes, to_codes, as_of = item_columns(request.data)
+		result = convert_batch(amounts, from_codes, to_codes, as_of, places=places, rounding=rounding)
+		
+		if request.content_type.startswith(CSVParser.media_type):
+			errors = dict(result.errors)
+			rows = zip(amounts, from_codes, to_codes, as_of or repeat(''), result.rates, result.converted,
+			           (errors.get(i, '') for i in range(len(amounts))))
+			return streaming_response(('amount', 'from', 'to', 'as_of', 'rate', 'converted', 'error'), rows,
+			                          output_format='csv', filename='converted')
+		
+		return Response({
+			'count': len(amounts),
+			'converted': result.converted,
+			'rates': result.rates,
+			'errors': [{'index': i, 'message': message} for i, message in result.errors],
+		})
+
+
+class PortfolioValueView(StaffViewMixin, CreateAPIView):
+	"""
+	Values holdings in many currencies in one, at the latest rates (a quote of either direction, the newer one).
+
+	Holdings are sent as {"holdings": [{"currency": "EUR", "amount": "1200"}, ...], "currency": "USD"}, with the
+	optional places (default=2) and rounding (see ConvertBatchView).
+
+	Returns {"currency": "USD", "total": ..., "holdings": [{"currency", "amount", "value", "rate", "quote_id",
+	"last_refreshed", "inverted"}, ...], "errors": [{"index": i, "message": ...}]} in the holdings' order, value
+	and rate being null for the holdings that have no rate (listed in errors, and left out of the total)
+	"""
+	model_class = Currency
+	serializer_class = EmptySerializer
+
+	def create_or_raise(self, request, *args, **kwargs):
+		try:
+			data = request.data
+		except ParseError as e:
+			raise ValidationError(detail=e)
+		currencies, amounts = holding_columns(data)
+		places = parse_places(data.get('places', 2))
+
+		result = value_portfolio(currencies, amounts, data.get('currency'), places=places,
+		                         rounding=data.get('rounding') or 'half_even')
+		holdings = []
+		for currency, amount, value, rate in zip(result.currencies, amounts, result.values, result.rates):
+			holdings.append({
+				'currency': currency,
+				'amount': amount,
+				'value': value,
+				'rate': format(rate['rate'], 'f') if rate else None,
+				'quote_id': rate and rate['quote_id'],
+				'last_refreshed': rate['last_refreshed'] if rate else None,
+				'inverted': rate['inverted'] if rate else None,
+			})
+		return Response({
+			'currency': result.currency,
+			'total': str(result.total),
+			'holdings': holdings,
+			'errors': [{'index': i, 'message': message} for i, message in result.errors],
+		})
+
+
+class PriceAlertFilter(FilterSet):
+	class Meta:
+		model = PriceAlert
+		fields = {
+			'from_currency_code': ['exact', 'in'],
+			'to_currency_code': ['exact', 'in'],
+			'direction': ['exact'],
+			'repeat': ['exact'],
+			'is_active': ['exact'],
+		}
+
+
+class PriceAlertViewMixin(StaffViewMixin):
+	""" Alerts of the requesting user only """
+	model_class = PriceAlert
+	serializer_class = PriceAlertSerializer
+	
+	def get_queryset(self):
+		return super().get_queryset().filter(user=self.request.user)
+
+
+class PriceAlertListView(PriceAlertViewMixin, ListCreateAPIView):
+	"""
+	Price alerts of the user, and POST to register one: {"from_currency_code": "BTC", "to_currency_code": "USD",
+	"threshold": "70000", "direction": "above|below|any", "repeat": false}.
+
+	Checked on every ingested quote of the pair, against the pair's previous rate: crossing the threshold (in the given
+	direction) mails the user. One-off alerts (repeat=false) are deactivated once triggered.
+	"""
+	filter_class = PriceAlertFilter
+	ordering = ('-id',)
+	
+	def perform_create(self, serializer):
+		return serializer.save(user=self.request.user)
+
+
+class PriceAlertView(PriceAlertViewMixin, RetrieveUpdateDestroyAPIView):
+	"""
+	A price alert of the user, PATCH to change it (e.g. is_active=true to re-arm a triggered one) or DELETE it.
+	"""
+	def perform_update(self, serializer):
+		old_pair = (serializer.instance.from_currency_code, serializer.instance.to_currency_code)
+		alert = serializer.save()
+		if old_pair != (alert.from_currency_code, alert.to_currency_code):
+			transaction.on_commit(lambda: bump_pair_versions([old_pair]))  # the new pair's is bumped on save
+		return alert
+
+
+class WebhookViewMixin(StaffViewMixin):
+	""" Webhook subscriptions of the requesting user only """
+	model_class = WebhookSubscription
+	serializer_class = WebhookSubscriptionSerializer
+	
+	def get_queryset(self):
+		return super().get_queryset().filter(user=self.request.user)
+
+
+class WebhookListView(WebhookViewMixin, ListCreateAPIView):
+	"""
+	Webhook subscriptions of the user, and POST to subscribe: {"url": "https://..", "pairs": "BTC/USD,EUR/USD" (all
+	if blank), "secret": ".."}.
+
+	New quotes of the pairs are POSTed to the url as {"quotes": [...]}, all the ones of a flush interval
+	(QUOTE_WEBHOOK_FLUSH_INTERVAL) in one request, with X-Webhook-Id and, given a secret, X-Webhook-Signature
+	(sha256=<hex HMAC-SHA256 of the body>). A non 2xx answer is retried with exponential backoff, so batches may arrive
+	out of order (quotes carry their id). Too many failed deliveries in a row deactivate the subscription.
+	"""
+	ordering = ('-id',)
+	
+	def perform_create(self, serializer):
+		return serializer.save(user=self.request.user)
+
+
+class WebhookView(WebhookViewMixin, RetrieveUpdateDestroyAPIView):
+	"""
+	A webhook subscription of the user, PATCH to change it (e.g. is_active=true to resume a deactivated one) or
+	DELETE it.
+	"""
+	def perform_update(self, serializer):
+		if serializer.validated_data.get('is_active'):
+			return serializer.save(failures=0)
+		return serializer.save()
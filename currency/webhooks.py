@@ -0,0 +1,222 @@
+import hashlib
+import hmac
+import logging
+import os
+import threading
+
+import requests
+from urllib3.util import Timeout
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from currency.celery import app
+from currency.models import WebhookSubscription
+from currency.stream import pair_topic, render_quote
+from currency.utils import pair_list
+from labs.batching import BatchQueue
+from labs.versions import bump_versions
+
+__author__ = 'chandanojha'
+
+logger = logging.getLogger(__name__)
+
+# ---
+# Webhooks: new quotes are queued by the ingesting process and flushed every FLUSH_INTERVAL into one deliver_quotes
+# task, which groups them per subscriber (each quote rendered once) and queues a post_batch task per subscriber with
+# all its quotes of the interval in one body ({"quotes": [...]}). So a slow subscriber only holds up its own task, and
+# for no longer than DEADLINE; failed ones are retried by retry_delivery with exponential backoff
+#
+
+FLUSH_INTERVAL = getattr(settings, 'QUOTE_WEBHOOK_FLUSH_INTERVAL', 1.0)  # seconds
+MAX_BATCH = 5000  # quotes per flush
+POOL_SIZE = 20  # kept-alive connections per process
+DEADLINE = 5  # seconds per POST, in all: connecting, sending and getting the response
+MAX_RESPONSE_BYTES = 64 * 1024  # of a subscriber's response body read, it is not used
+MAX_ATTEMPTS = 5  # per delivery, the retries waiting BACKOFF, 2 x BACKOFF, 4 x BACKOFF...
+BACKOFF = 2  # seconds
+MAX_FAILURES = 50  # consecutive failed deliveries (after all the attempts) before a subscription is deactivated
+
+VERSION_KEY = 'currency:webhooks:version'
+
+
+class Subscriber:
+	__slots__ = ('id', 'url', 'secret', 'pairs')
+
+	def __init__(self, subscription):
+		self.id, self.url, self.secret = subscription.pk, subscription.url, subscription.secret
+		pairs = pair_list(subscription.pairs or None)
+		self.pairs = frozenset(pair_topic(*pair) for pair in pairs) if pairs else None
+
+	def wants(self, topic):
+		return self.pairs is None or topic in self.pairs
+
+
+class Subscribers:
+	"""
+	Active subscriptions, kept per process and reloaded when they change (see VERSION_KEY)
+	"""
+	def __init__(self):
+		self.version, self.subscribers, self.by_id = None, [], {}
+		self._lock = threading.Lock()
+
+	def current(self):
+		"""
+		:return: List of the Subscriber of each active subscription, reloaded first if they changed. Checks the version
+			(a cache round trip), so call it once per batch and match the quotes against the list
+		"""
+		cache.add(VERSION_KEY, 0, timeout=None)
+		version = cache.get(VERSION_KEY)
+		with self._lock:
+			if version is None or version != self.version:
+				self.subscribers = [Subscriber(s) for s in WebhookSubscription.objects.filter(is_active=True)]
+				self.by_id = {s.id: s for s in self.subscribers}
+				self.version = version
+			return self.subscribers
+
+	def get(self, subscription_id):
+		"""
+		:return: Subscriber of the subscription, None if it is not active (any more)
+		"""
+		self.current()
+		return self.by_id.get(subscription_id)
+
+
+subscribers = Subscribers()
+
+_session, _session_pid = None, None
+
+
+def session():
+	""" :return: The process' pooled http session, kept-alive connections are reused across the deliveries """
+	global _session, _session_pid
+	if _session is None or _session_pid != os.getpid():
+		_session, _session_pid = requests.Session(), os.getpid()
+		adapter = requests.adapters.HTTPAdapter(pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE)
+		_session.mount('http://', adapter)
+		_session.mount('https://', adapter)
+	return _session
+
+
+def signature(secret, body):
+	return 'sha256=' + hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+
+
+def post(subscription_id, url, secret, body):
+	"""
+	:return: True if the subscriber took it (2xx)
+	"""
+	headers = {'Content-Type': 'application/json', 'X-Webhook-Id': str(subscription_id)}
+	if secret:
+		headers['X-Webhook-Signature'] = signature(secret, body)
+	try:
+		# a total timeout, not per socket read. The response body is read (up to MAX_RESPONSE_BYTES, longer ones close
+		# the connection) so that the connection goes back to the pool
+		with session().post(url, data=body, headers=headers, timeout=Timeout(total=DEADLINE), stream=True) as response:
+			response.raw.read(MAX_RESPONSE_BYTES)
+			return 200 <= response.status_code < 300
+	except requests.RequestException as e:
+		logger.info("Webhook {0} delivery failed: {1}".format(subscription_id, e))
+		return False
+
+
+def batch_body(quotes):
+	""" :return: {"quotes": [...]} of the rendered quotes, as bytes """
+	return ('{"quotes":[' + ','.join(quotes) + ']}').encode()
+
+
+@app.task
+def deliver_quotes(quotes):
+	"""
+	Delivers a flush of quotes, each subscriber gets its matching ones in one POST, from a post_batch task of its own
+
+	:param quotes: List of {"topic": "BTC/USD", "json": rendered quote}
+	"""
+	active = subscribers.current()
+	batches = {}
+	for quote in quotes:
+		for subscriber in active:
+			if subscriber.wants(quote['topic']):
+				batches.setdefault(subscriber.id, []).append(quote['json'])
+
+	for subscription_id, jsons in batches.items():
+		post_batch.delay(subscription_id, batch_body(jsons).decode())
+	return len(batches)
+
+
+@app.task
+def post_batch(subscription_id, body):
+	"""
+	A subscriber's quotes of a flush, retried by retry_delivery if it fails
+	"""
+	return attempt_delivery(subscription_id, body, 1)
+
+
+@app.task
+def retry_delivery(subscription_id, body, attempt):
+	"""
+	Another attempt of a failed delivery, rescheduled with twice the wait till MAX_ATTEMPTS
+	"""
+	return attempt_delivery(subscription_id, body, attempt)
+
+
+def attempt_delivery(subscription_id, body, attempt):
+	"""
+	:return: True if delivered, False if it failed (and is retried unless that was the last attempt) or the
+		subscription is not active any more
+	"""
+	subscriber = subscribers.get(subscription_id)
+	if subscriber is None:
+		return False
+	if post(subscriber.id, subscriber.url, subscriber.secret, body.encode()):
+		record_deliveries([subscription_id])
+		return True
+	if attempt < MAX_ATTEMPTS:
+		retry_delivery.apply_async((subscription_id, body, attempt + 1), countdown=BACKOFF * 2 ** (attempt - 1))
+	else:
+		record_failure(subscription_id)
+	return False
+
+
+def record_deliveries(subscription_ids):
+	if subscription_ids:
+		WebhookSubscription.objects.filter(pk__in=subscription_ids).update(last_delivered_at=timezone.now(), failures=0)
+
+
+def record_failure(subscription_id):
+	logger.warning("Webhook {0} delivery dropped after {1} attempts".format(subscription_id, MAX_ATTEMPTS))
+	subscriptions = WebhookSubscription.objects.filter(pk=subscription_id)
+	subscriptions.update(failures=F('failures') + 1)
+	if subscriptions.filter(failures__gte=MAX_FAILURES).update(is_active=False):
+		logger.warning("Webhook {0} deactivated after {1} failed deliveries".format(subscription_id, MAX_FAILURES))
+		bump_version()
+
+
+dispatcher = BatchQueue(lambda batch: deliver_quotes.delay(batch), max_batch=MAX_BATCH, interval=FLUSH_INTERVAL,
+                        name='currency-webhooks')
+
+
+def bump_version():
+	bump_versions(VERSION_KEY)
+
+
+def subscription_changed(sender, **kwargs):
+	"""
+	post_save/post_delete receiver of WebhookSubscription, the processes reload the subscribers once committed
+	"""
+	transaction.on_commit(bump_version)
+
+
+def queue_quote(sender, quote, **kwargs):
+	"""
+	quote_ingested receiver, quotes nobody subscribed to are not queued
+	"""
+	try:
+		topic = pair_topic(quote.from_currency_code, quote.to_currency_code)
+		if any(subscriber.wants(topic) for subscriber in subscribers.current()):
+			dispatcher.put({'topic': topic, 'json': render_quote(quote)})
+	except Exception as e:
+		# Never fail the ingestion for it
+		logger.warning("Could not queue quote {0} for the webhooks: {1}".format(quote.pk, e))
@@ -0,0 +1,458 @@
+import asyncio
+import re
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import suppress
+from io import BytesIO
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.core.files import uploadhandler
+from django.core.handlers.base import BaseHandler
+from django.core.handlers.wsgi import WSGIRequest
+from django.db import close_old_connections
+from django.http import HttpResponse, QueryDict
+from rest_framework import exceptions
+from rest_framework.settings import api_settings
+
+from labs.exceptions import ValidationError, view_exception_handler
+from labs.renderers import JSONRenderer
+
+__author__ = 'chandanojha'
+
+try:
+	import httpx
+except ImportError:
+	httpx = None
+
+
+# ---
+# Async (ASGI) counterparts of labs views, for the few hot endpoints that mostly wait on something else (an upstream
+# API, a pub/sub channel) and so should not hold a worker thread each. Everything else stays on the regular
+# (sync) views, see AsyncRouter
+#
+
+def database_sync_to_async(func):
+	"""
+	sync_to_async for code that touches the database, run in the thread pool with stale connections closed around the
+	call the way Django does it around each request
+	"""
+	def wrapper(*args, **kwargs):
+		close_old_connections()
+		try:
+			return func(*args, **kwargs)
+		finally:
+			close_old_connections()
+
+	return sync_to_async(wrapper, thread_sensitive=False)
+
+
+HTTP_CLIENT_TIMEOUT = 30  # seconds
+
+_http_clients = {}
+
+
+def http_client():
+	"""
+	:return: Shared httpx.AsyncClient (i.e. pooled keep-alive connections) of the running event loop
+	"""
+	assert httpx is not None, "http_client() requires 'httpx' package to be installed"
+	loop = asyncio.get_event_loop()
+	client = _http_clients.get(loop)
+	if client is None:
+		client = _http_clients[loop] = httpx.AsyncClient(timeout=HTTP_CLIENT_TIMEOUT)
+	return client
+
+
+def scope_meta(scope):
+	"""
+	:return: The request's WSGI environ like (CGI) variables out of the ASGI scope: method, path, query string, client
+		address and the headers as HTTP_*
+	"""
+	meta = {'REQUEST_METHOD': scope['method'], 'PATH_INFO': scope['path'].encode('utf8').decode('latin1'),
+	        'SCRIPT_NAME': scope.get('root_path', '').encode('utf8').decode('latin1'),
+	        'QUERY_STRING': scope.get('query_string', b'').decode('latin1')}
+	if scope.get('client'):
+		meta['REMOTE_ADDR'] = scope['client'][0]
+	for name, value in scope.get('headers', []):
+		name = name.decode('latin1').upper().replace('-', '_')
+		if name not in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+			name = 'HTTP_' + name
+		value = value.decode('latin1')
+		meta[name] = meta[name] + ',' + value if name in meta else value
+	return meta
+
+
+class AsyncRequest:
+	"""
+	Just enough of a request, built from the ASGI scope, for the DRF authentication/permission classes, serializers
+	and labs.utils helpers (META, query_params, data, user)
+	"""
+	def __init__(self, scope, body=b''):
+		self.scope = scope
+		self.method = scope['method']
+		self.path = scope['path']
+		self.body = body
+		self.user = AnonymousUser()
+		self.auth = None
+
+		self.META = scope_meta(scope)
+		self.META.setdefault('CONTENT_LENGTH', str(len(body)))
+
+		self.query_params = self.GET = QueryDict(self.META['QUERY_STRING'])
+		self._data = None
+
+	@property
+	def content_type(self):
+		return self.META.get('CONTENT_TYPE', '')
+
+	@property
+	def upload_handlers(self):
+		""" For the multipart parser, same as Django's request """
+		return [uploadhandler.load_handler(handler, self) for handler in settings.FILE_UPLOAD_HANDLERS]
+
+	@property
+	def data(self):
+		"""
+		Body parsed like request.data of the sync views: by the parser of its content type among DRF's
+		DEFAULT_PARSER_CLASSES (JSON, form, multipart...), the files merged in the data
+		"""
+		if self._data is None:
+			self._data = self._parse() if self.body else {}
+		return self._data
+
+	def _parse(self):
+		parsers = [parser() for parser in api_settings.DEFAULT_PARSER_CLASSES]
+		parser = api_settings.DEFAULT_CONTENT_NEGOTIATION_CLASS().select_parser(self, parsers)
+		if parser is None:
+			raise exceptions.UnsupportedMediaType(self.content_type)
+
+		parsed = parser.parse(BytesIO(self.body), self.content_type, {'request': self, 'encoding': settings.DEFAULT_CHARSET})
+		if not hasattr(parsed, 'files'):
+			return parsed
+		data = parsed.data.copy()
+		data.update(parsed.files)
+		return data
+
+	def get_host(self):
+		return self.META.get('HTTP_HOST') or settings.ALLOWED_HOSTS[0]
+
+	def build_absolute_uri(self, location):
+		return '{0}://{1}{2}'.format(self.scope.get('scheme', 'http'), self.get_host(), location)
+
+
+class AsyncAPIView:
+	"""
+	Async version of labs' API views, an ASGI application per request (see as_asgi()).
+
+	Handlers are coroutines named after the http method, getting the AsyncRequest and the url kwargs and returning a
+	DRF Response (rendered here as JSON) or None if they have already streamed the response out (see stream()).
+	Authentication and permissions are the same classes as on the sync views (so the staff mixins work as is), run in
+	the thread pool as they read the database. Errors are reported the same way as labs views do.
+
+	The ORM is sync only, wrap the database work in database_sync_to_async()
+	"""
+	authentication_classes = api_settings.DEFAULT_AUTHENTICATION_CLASSES
+	permission_classes = api_settings.DEFAULT_PERMISSION_CLASSES
+	renderer_class = JSONRenderer
+	http_method_names = ('get', 'post', 'put', 'patch', 'delete')
+	model_class = None  # for the DoesNotExist => 404 conversion, like labs views
+
+	def __init__(self, **kwargs):
+		for key, value in kwargs.items():
+			setattr(self, key, value)
+
+	@classmethod
+	def as_asgi(cls, **initkwargs):
+		async def view(scope, receive, send, **kwargs):
+			await cls(**initkwargs).dispatch(scope, receive, send, **kwargs)
+
+		view.view_class = cls
+		return view
+
+	@classmethod
+	def handles(cls, method):
+		method = method.lower()
+		return method in cls.http_method_names and hasattr(cls, method)
+
+	async def dispatch(self, scope, receive, send, **kwargs):
+		self.scope, self.receive, self.send = scope, receive, send
+		self.kwargs = kwargs
+		self.request = None
+		try:
+			request = self.request = AsyncRequest(scope, await self.read_body())
+			await database_sync_to_async(self.initial)(request)
+		except Exception as e:
+			response = self.handle_exception(e)
+		else:
+			response = await self.handle(request, **kwargs)
+
+		if response is not None:
+			await self.send_response(response)
+
+	async def handle(self, request, **kwargs):
+		try:
+			return await getattr(self, request.method.lower())(request, **kwargs)
+		except Exception as e:
+			if isinstance(e, exceptions.ParseError):
+				e = ValidationError(detail=e)
+
+			def reraise(view, request):
+				raise e
+
+			# labs views' error reporting (see labs.views), as is
+			return view_exception_handler(reraise)(self, request)
+
+	async def read_body(self):
+		body = []
+		while True:
+			message = await self.receive()
+			if message['type'] == 'http.disconnect':
+				raise exceptions.APIException('Client disconnected')
+			body.append(message.get('body', b''))
+			if not message.get('more_body'):
+				return b''.join(body)
+
+	# --- same hooks as DRF's APIView, so that the view mixins (e.g. StaffViewMixin) apply as they are
+	def get_authenticators(self):
+		return [auth() for auth in self.authentication_classes]
+
+	def get_permissions(self):
+		return [permission() for permission in self.permission_classes]
+
+	def initial(self, request):
+		self.perform_authentication(request)
+		self.check_permissions(request)
+
+	def perform_authentication(self, request):
+		for authenticator in self.get_authenticators():
+			user_auth_tuple = authenticator.authenticate(request)
+			if user_auth_tuple is not None:
+				request.user, request.auth = user_auth_tuple
+				return
+
+	def check_permissions(self, request):
+		for permission in self.get_permissions():
+			if not permission.has_permission(request, self):
+				if request.auth is None:
+					raise exceptions.NotAuthenticated()
+				raise exceptions.PermissionDenied(detail=getattr(permission, 'message', None))
+
+	def handle_exception(self, exc):
+		""" Errors out of the request setup (authentication, permissions), same as DRF's APIView """
+		response = api_settings.EXCEPTION_HANDLER(exc, {'view': self, 'request': self.request})
+		if response is None:
+			raise exc
+		return response
+
+	# --- response
+	async def send_response(self, response):
+		body = self.renderer_class().render(response.data)
+		headers = [(k, v) for k, v in response.items() if k.lower() != 'content-type']
+		await self.start_response(response.status_code, self.renderer_class.media_type, headers)
+		await self.send({'type': 'http.response.body', 'body': body})
+
+	async def start_response(self, status, content_type, headers=()):
+		await self.send({
+			'type': 'http.response.start',
+			'status': status,
+			'headers': [(b'content-type', content_type.encode('latin1'))] +
+			           [(str(k).lower().encode('latin1'), str(v).encode('latin1')) for k, v in headers],
+		})
+
+	async def stream(self, chunks, content_type, headers=(), status=200):
+		"""
+		Streams an async iterable of str/bytes chunks out as they come, stops (and closes the iterator) as soon as the
+		client goes away instead of on the next write
+		"""
+		await self.start_response(status, content_type, headers)
+
+		iterator = chunks.__aiter__()
+		disconnected = asyncio.ensure_future(self._wait_disconnect())
+		try:
+			while True:
+				next_chunk = asyncio.ensure_future(iterator.__anext__())
+				await asyncio.wait({next_chunk, disconnected}, return_when=asyncio.FIRST_COMPLETED)
+				if not next_chunk.done():
+					next_chunk.cancel()
+					with suppress(asyncio.CancelledError):
+						await next_chunk
+					return
+
+				try:
+					chunk = next_chunk.result()
+				except StopAsyncIteration:
+					break
+				await self.send({'type': 'http.response.body', 'body': chunk.encode() if isinstance(chunk, str) else chunk,
+				                 'more_body': True})
+
+			await self.send({'type': 'http.response.body'})
+		finally:
+			disconnected.cancel()
+			with suppress(RuntimeError):
+				await iterator.aclose()
+
+	async def _wait_disconnect(self):
+		while (await self.receive())['type'] != 'http.disconnect':
+			pass
+
+
+def scope_environ(scope, body=b''):
+	"""
+	:return: WSGI environ of the ASGI (http) scope and the request body
+	"""
+	server = scope.get('server') or ('localhost', 80)
+	return dict(scope_meta(scope), **{
+		'SERVER_NAME': server[0],
+		'SERVER_PORT': str(server[1]),
+		'SERVER_PROTOCOL': 'HTTP/{0}'.format(scope.get('http_version', '1.1')),
+		'wsgi.version': (1, 0),
+		'wsgi.url_scheme': scope.get('scheme', 'http'),
+		'wsgi.input': BytesIO(body),
+		'wsgi.errors': BytesIO(),
+		'wsgi.multithread': True,
+		'wsgi.multiprocess': True,
+		'wsgi.run_once': False,
+	})
+
+
+def response_headers(response, exclude=()):
+	"""
+	:return: ASGI headers of a Django response, its cookies included, but the 'exclude' ones (lower case names)
+	"""
+	headers = list(response.items()) + [('Set-Cookie', c.output(header='')) for c in response.cookies.values()]
+	return [(name.lower().encode('latin1'), str(value).encode('latin1')) for name, value in headers
+	        if name.lower() not in exclude]
+
+
+async def send_django_response(send, response):
+	body = b''.join(response.streaming_content) if response.streaming else response.content
+	await send({'type': 'http.response.start', 'status': response.status_code, 'headers': response_headers(response)})
+	await send({'type': 'http.response.body', 'body': body})
+
+
+WSGI_THREADS = getattr(settings, 'ASGI_WSGI_THREADS', 32)  # WSGI requests run at once, see wsgi_to_asgi()
+
+# Threads of the WSGI app apart from the default pool (database_sync_to_async), so that slow sync requests do not
+# starve the async views of their database threads (and the other way around)
+_wsgi_executor = ThreadPoolExecutor(max_workers=WSGI_THREADS, thread_name_prefix='asgi-wsgi')
+
+
+class _WsgiResponse:
+	"""
+	One WSGI request, run (in a worker thread) with the responses sent out through the ASGI 'send' on the event loop
+	as they come
+	"""
+	def __init__(self, send, loop):
+		self._send, self.loop = send, loop
+		self.status, self.headers, self.started = None, [], False
+
+	def send(self, message):
+		asyncio.run_coroutine_threadsafe(self._send(message), self.loop).result()
+
+	def start_response(self, status, headers, exc_info=None):
+		if exc_info and self.started:
+			raise exc_info[1].with_traceback(exc_info[2])
+		self.status = int(status.split(' ', 1)[0])
+		self.headers = [(name.lower().encode('latin1'), value.encode('latin1')) for name, value in headers]
+
+	def write(self, body, more_body=True):
+		if not self.started:
+			self.started = True
+			self.send({'type': 'http.response.start', 'status': self.status, 'headers': self.headers})
+		self.send({'type': 'http.response.body', 'body': body, 'more_body': more_body})
+
+	def run(self, wsgi_application, environ):
+		result = wsgi_application(environ, self.start_response)
+		try:
+			for chunk in result:
+				if chunk:
+					self.write(chunk)
+		finally:
+			if hasattr(result, 'close'):
+				result.close()
+		self.write(b'', more_body=False)
+
+
+def wsgi_to_asgi(wsgi_application):
+	"""
+	ASGI app running the given WSGI app in a thread pool of its own (WSGI_THREADS), one thread per request (asgiref's
+	WsgiToAsgi runs every WSGI request in the one main sync thread, that would serialize the whole sync app)
+	"""
+	async def application(scope, receive, send):
+		if scope['type'] != 'http':
+			raise ValueError("WSGI app received a non-http scope: {0}".format(scope['type']))
+		body = []
+		while True:
+			message = await receive()
+			if message['type'] == 'http.disconnect':
+				return
+			body.append(message.get('body', b''))
+			if not message.get('more_body'):
+				break
+
+		loop = asyncio.get_event_loop()
+		environ = scope_environ(scope, b''.join(body))
+		await loop.run_in_executor(_wsgi_executor, _WsgiResponse(send, loop).run, wsgi_application, environ)
+
+	return application
+
+
+class MiddlewareHandler(BaseHandler):
+	"""
+	settings.MIDDLEWARE for the async views (see AsyncRouter). The middleware is sync, so it is run (in the thread
+	pool) around a stand-in response instead of the view: a response of its own (e.g. a redirect, a CORS preflight
+	answer) is sent as is, otherwise the headers it set on the stand-in (CORS, security, X-Frame-Options...) are added
+	to the view's response. Request side only, the view does not get Django's request
+	"""
+	def __init__(self):
+		super().__init__()
+		self.load_middleware()
+
+	def _get_response(self, request):
+		response = HttpResponse()
+		response.stand_in = True
+		return response
+
+
+def include(prefix, routes):
+	""" Prefixes the patterns of 'routes' (list of (pattern, view) tuples) with 'prefix' pattern """
+	return [(prefix.rstrip('$') + pattern.lstrip('^'), view) for pattern, view in routes]
+
+
+class AsyncRouter:
+	"""
+	ASGI application that serves the given (pattern, async view) routes for the http methods those views implement,
+	through settings.MIDDLEWARE (see MiddlewareHandler) unless 'middleware' is False, and hands everything else (other
+	paths, other methods, websocket, lifespan etc.) to 'fallback' i.e. the Django app
+	"""
+	def __init__(self, routes, fallback, middleware=True):
+		self.routes = [(re.compile(pattern), view) for pattern, view in routes]
+		self.fallback = fallback
+		self.middleware = MiddlewareHandler() if middleware else None
+
+	async def __call__(self, scope, receive, send):
+		if scope['type'] == 'http':
+			for regex, view in self.routes:
+				match = regex.match(scope['path'])
+				if match and view.view_class.handles(scope['method']):
+					if self.middleware is not None:
+						response = await database_sync_to_async(self.middleware.get_response)(
+							WSGIRequest(scope_environ(scope)))
+						if not getattr(response, 'stand_in', False):
+							return await send_django_response(send, response)
+						send = self.with_headers(send, response_headers(response, ('content-type', 'content-length')))
+					return await view(scope, receive, send, **match.groupdict())
+
+		return await self.fallback(scope, receive, send)
+
+	@staticmethod
+	def with_headers(send, headers):
+		""" :return: 'send' adding the headers the response does not have already """
+		async def wrapper(message):
+			if message['type'] == 'http.response.start':
+				names = {name for name, _ in message['headers']}
+				message = dict(message, headers=message['headers'] + [h for h in headers if h[0] not in names])
+			await send(message)
+
+		return wrapper
@@ -0,0 +1,85 @@
+import logging
+import os
+import queue
+import threading
+import time
+
+__author__ = 'chandanojha'
+
+logger = logging.getLogger(__name__)
+
+
+class BatchQueue:
+	"""
+	Collects the items put from any thread and hands them over to 'flush' in batches, from a background thread, once
+	'max_batch' items are waiting or 'interval' seconds after the first of them. So the callers never wait on the
+	flush, e.g. queuing a celery task per batch instead of per item
+
+	At most 'max_pending' items wait, more are dropped (and logged) so that a stuck flush can't eat up the memory. The
+	thread is started on the first put() in each process, forked workers (e.g. celery prefork) get their own
+	"""
+	def __init__(self, flush, max_batch=1000, interval=1.0, max_pending=100000, name='batch-queue'):
+		self.flush = flush
+		self.max_batch, self.interval, self.name = max_batch, interval, name
+		self._queue = queue.Queue(maxsize=max_pending)
+		self._lock = threading.Lock()
+		self._pid = self._thread = None
+
+	def put(self, item):
+		"""
+		:return: False if the item was dropped, the queue being full
+		"""
+		self._start()
+		try:
+			self._queue.put_nowait(item)
+			return True
+		except queue.Full:
+			logger.warning("{0}: queue full, item dropped".format(self.name))
+			return False
+
+	def drain(self):
+		"""
+		Flushes the waiting items right away, in the calling thread, e.g. on shutdown or in tests
+		"""
+		batch = self._take(block=False)
+		while batch:
+			self._flush(batch)
+			batch = self._take(block=False)
+
+	def _start(self):
+		if self._pid == os.getpid() and self._thread.is_alive():
+			return
+		with self._lock:
+			if self._pid != os.getpid() or not self._thread.is_alive():
+				if self._pid != os.getpid():
+					self._queue = queue.Queue(maxsize=self._queue.maxsize)  # a forked copy, the items are the parent's
+				self._pid = os.getpid()
+				self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+				self._thread.start()
+
+	def _take(self, block=True):
+		"""
+		:return: Next batch, waiting for its first item (if 'block') then up to 'interval' for the rest
+		"""
+		try:
+			batch = [self._queue.get(block=block)]
+		except queue.Empty:
+			return []
+		deadline = time.monotonic() + self.interval
+		while len(batch) < self.max_batch:
+			timeout = deadline - time.monotonic() if block else 0
+			try:
+				batch.append(self._queue.get(timeout=timeout) if timeout > 0 else self._queue.get_nowait())
+			except queue.Empty:
+				break
+		return batch
+
+	def _run(self):
+		while True:
+			self._flush(self._take())
+
+	def _flush(self, batch):
+		try:
+			self.flush(batch)
+		except Exception as e:
+			logger.exception("{0}: could not flush {1} items: {2}".format(self.name, len(batch), e))
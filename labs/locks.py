@@ -0,0 +1,77 @@
+import time
+import uuid
+
+from django.core.cache import cache
+
+__author__ = 'chandanojha'
+
+try:
+	from django_redis import get_redis_connection
+except ImportError:
+	get_redis_connection = None
+
+# Deletes the lock only if it still holds our token, atomically (the holder may have timed out and someone else got it)
+RELEASE_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+	return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+
+class CacheLock:
+	"""
+	Lock shared by the processes through the cache: taken with an atomic add of a token unique to the holder, expiring
+	after 'timeout' seconds (should the holder die), released only by its holder. With django-redis the lock is kept
+	as a plain redis key and released by a compare-and-delete script, other backends compare and delete in two steps
+
+		with CacheLock('app:lock', timeout=30, wait=1) as acquired:
+			if not acquired:
+				...  # someone else holds it, try later
+
+	:param wait: Seconds to wait for the lock, 0 to try once
+	"""
+	POLL_INTERVAL = 0.01  # seconds
+
+	def __init__(self, key, timeout=30, wait=0):
+		self.key, self.timeout, self.wait = key, timeout, wait
+		self.token = None
+
+	def _redis(self):
+		if get_redis_connection is None or not hasattr(cache, 'client'):
+			return None
+		return get_redis_connection()
+
+	def _add(self, token):
+		client = self._redis()
+		if client is None:
+			return cache.add(self.key, token, self.timeout)
+		return bool(client.set(cache.make_key(self.key), token, nx=True, ex=self.timeout))
+
+	def acquire(self):
+		"""
+		:return: True if acquired (within 'wait')
+		"""
+		token, deadline = uuid.uuid4().hex, time.monotonic() + self.wait
+		while not self._add(token):
+			if time.monotonic() >= deadline:
+				return False
+			time.sleep(self.POLL_INTERVAL)
+		self.token = token
+		return True
+
+	def release(self):
+		token, self.token = self.token, None
+		if token is None:
+			return
+		client = self._redis()
+		if client is not None:
+			client.eval(RELEASE_SCRIPT, 1, cache.make_key(self.key), token)
+		elif cache.get(self.key) == token:
+			cache.delete(self.key)
+
+	def __enter__(self):
+		return self.acquire()
+
+	def __exit__(self, *exc_info):
+		self.release()
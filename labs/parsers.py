@@ -0,0 +1,55 @@
+import codecs
+import csv
+
+from django.conf import settings
+from rest_framework import parsers
+from rest_framework.exceptions import ParseError
+
+__author__ = 'chandanojha'
+
+try:
+	import orjson
+except ImportError:
+	orjson = None
+
+
+class JSONParser(parsers.JSONParser):
+	"""
+	Drop-in for DRF's JSONParser on top of orjson (see labs.renderers.JSONRenderer), falls back to DRF's if orjson
+	is not installed. Like the strict DRF parser, NaN/Infinity are rejected
+	"""
+	def parse(self, stream, media_type=None, parser_context=None):
+		if orjson is None:
+			return super().parse(stream, media_type, parser_context)
+
+		encoding = (parser_context or {}).get('encoding', settings.DEFAULT_CHARSET)
+		try:
+			data = stream.read()
+			if encoding.lower().replace('-', '') != 'utf8':
+				data = data.decode(encoding)
+			return orjson.loads(data)
+		except ValueError as exc:
+			raise ParseError('JSON parse error - %s' % str(exc))
+
+
+class CSVParser(parsers.BaseParser):
+	"""
+	text/csv body, with a header line, to the columnar layout of labs.renderers.to_columns() i.e.
+	{"columns": [...], "data": {"column": [...values as strings...]}}
+	"""
+	media_type = 'text/csv'
+
+	def parse(self, stream, media_type=None, parser_context=None):
+		encoding = (parser_context or {}).get('encoding', settings.DEFAULT_CHARSET)
+		if stream is None:
+			return {'columns': [], 'data': {}}
+		try:
+			reader = csv.reader(codecs.iterdecode(stream, encoding))
+			columns = [c.strip() for c in next(reader, [])]
+			values = list(zip(*(row for row in reader if row))) or [()] * len(columns)
+		except (csv.Error, UnicodeDecodeError) as exc:
+			raise ParseError('CSV parse error - %s' % str(exc))
+
+		if len(values) != len(columns):
+			raise ParseError('CSV parse error - rows do not match the header')
+		return {'columns': columns, 'data': {c: list(v) for c, v in zip(columns, values)}}
@@ -0,0 +1,166 @@
+import asyncio
+import json
+import logging
+import queue
+import threading
+import time
+
+__author__ = 'chandanojha'
+
+logger = logging.getLogger(__name__)
+
+try:
+	import redis
+except ImportError:
+	redis = None
+
+
+class SubscriptionOverflow(Exception):
+	""" Subscriber could not keep up and messages were dropped, it should re-sync from the source and subscribe again """
+	pass
+
+
+class Subscription:
+	"""
+	One subscriber's bounded mailbox. Messages are dropped (and the subscription marked overflowed) once 'max_pending'
+	messages are waiting, so that a slow subscriber never holds up the publisher or the other subscribers
+	"""
+	def __init__(self, broker, topics=None, max_pending=1000):
+		self.broker = broker
+		self.topics = set(topics) if topics is not None else None
+		self.overflowed = False
+		self._queue = queue.Queue(maxsize=max_pending)
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *args):
+		self.close()
+
+	def matches(self, topic):
+		return self.topics is None or topic in self.topics
+
+	def put(self, topic, message):
+		""" Called by the broker (from publisher's or listener's thread), must never block """
+		try:
+			self._queue.put_nowait((topic, message))
+		except queue.Full:
+			self.overflowed = True
+
+	def get(self, timeout=None):
+		"""
+		:return: (topic, message) tuple, None if nothing arrived within 'timeout' seconds
+		:raises SubscriptionOverflow: if messages were dropped, once the pending ones are consumed
+		"""
+		try:
+			return self._queue.get(timeout=timeout)
+		except queue.Empty:
+			if self.overflowed:
+				raise SubscriptionOverflow()
+			return None
+
+	def close(self):
+		self.broker.unsubscribe(self)
+
+
+class AsyncSubscription(Subscription):
+	"""
+	Subscription for asyncio consumers, get() is awaited on the event loop instead of blocking a thread. Must be
+	created from within the (running) loop, messages are handed over to it thread-safely
+	"""
+	def __init__(self, broker, topics=None, max_pending=1000):
+		super().__init__(broker, topics=topics, max_pending=max_pending)
+		self._loop = asyncio.get_event_loop()
+		self._queue = asyncio.Queue(maxsize=max_pending)
+
+	def put(self, topic, message):
+		try:
+			self._loop.call_soon_threadsafe(self._put, topic, message)
+		except RuntimeError:
+			pass  # loop is closed, the subscriber is gone
+
+	def _put(self, topic, message):
+		try:
+			self._queue.put_nowait((topic, message))
+		except asyncio.QueueFull:
+			self.overflowed = True
+
+	async def get(self, timeout=None):
+		try:
+			return await asyncio.wait_for(self._queue.get(), timeout)
+		except asyncio.TimeoutError:
+			if self.overflowed:
+				raise SubscriptionOverflow()
+			return None
+
+
+class Broker:
+	"""
+	Topic based publish/subscribe fan-out
+
+	With a redis 'url', messages are published on a redis channel and each process keeps exactly one redis
+	subscription (a daemon listener thread, started with the first subscriber) which fans them out to the local
+	subscribers, so the redis load does not grow with the number of subscribers. Without it (or without the redis
+	package) the fan-out is in-process only i.e. subscribers see what is published from the same process
+
+	Messages must be JSON serializable
+	"""
+	subscription_class = Subscription
+	reconnect_delay = 5  # seconds
+
+	def __init__(self, channel, url=None):
+		self.channel = channel
+		self.url = url if redis else None
+		self._subscribers = set()
+		self._lock = threading.Lock()
+		self._listener = None
+
+	def publish(self, topic, message):
+		if self.url:
+			self._redis().publish(self.channel, json.dumps([topic, message]))
+		else:
+			self.dispatch(topic, message)
+
+	def subscribe(self, topics=None, subscription_class=None, **kwargs):
+		"""
+		:param subscription_class: Defaults to 'subscription_class' i.e. Subscription, use AsyncSubscription for asyncio
+		"""
+		subscription = (subscription_class or self.subscription_class)(self, topics=topics, **kwargs)
+		with self._lock:
+			self._subscribers.add(subscription)
+			if self.url and not (self._listener and self._listener.is_alive()):
+				self._listener = threading.Thread(target=self._listen, name='pubsub-' + self.channel, daemon=True)
+				self._listener.start()
+		return subscription
+
+	def unsubscribe(self, subscription):
+		with self._lock:
+			self._subscribers.discard(subscription)
+
+	def dispatch(self, topic, message):
+		with self._lock:
+			subscribers = [s for s in self._subscribers if s.matches(topic)]
+		for subscriber in subscribers:
+			subscriber.put(topic, message)
+
+	def _redis(self):
+		client = getattr(self, '_client', None)
+		if client is None:
+			client = self._client = redis.Redis.from_url(self.url)
+		return client
+
+	def _listen(self):
+		while True:
+			try:
+				pubsub = self._redis().pubsub(ignore_subscribe_messages=True)
+				pubsub.subscribe(self.channel)
+				for item in pubsub.listen():
+					if item.get('type') == 'message':
+						self.dispatch(*json.loads(item['data']))
+			except Exception as e:
+				logger.warning("Pub/sub listener on '{0}' failed, reconnecting: {1}".format(self.channel, e))
+				# whatever was published meanwhile is lost, let the subscribers know so that they can re-sync
+				with self._lock:
+					for subscriber in self._subscribers:
+						subscriber.overflowed = True
+				time.sleep(self.reconnect_delay)
@@ -0,0 +1,106 @@
+from django.core.exceptions import FieldDoesNotExist
+from rest_framework import relations, serializers
+
+__author__ = 'chandanojha'
+
+
+# ---
+# Helpers for shaping a queryset after the serializer which is going to consume it, so that we read only what is
+# going to be rendered
+#
+
+def _serializer_fields(serializer):
+	if isinstance(serializer, serializers.ListSerializer):
+		serializer = serializer.child
+	return [f for f in serializer.fields.values() if not f.write_only]
+
+
+def _ordering_fields(queryset):
+	ordering = queryset.query.order_by or queryset.model._meta.ordering or ()
+	return [o.lstrip('-') for o in ordering if isinstance(o, str) and '__' not in o and o != '?']
+
+
+def projected_fields(serializer, queryset):
+	"""
+	Model fields the serializer is going to read from each instance, along with the pk and ordering keys
+
+	:param serializer: (list) Serializer with 'fields' restricted to what the client has requested
+	:param queryset: queryset to be serialized
+	:return: List of field names to be passed to queryset.only(), None if it can not be worked out reliably (a field
+		sourced from the whole object, a property or a method) in which case all columns should be selected
+	"""
+	opts = queryset.model._meta
+	names = [opts.pk.name]
+
+	for field in _serializer_fields(serializer):
+		if field.source == '*' or isinstance(field, serializers.SerializerMethodField):
+			return None
+		try:
+			model_field = opts.get_field(field.source_attrs[0])
+		except FieldDoesNotExist:
+			return None   # property or a method, no idea what it reads
+
+		if model_field.concrete and not model_field.many_to_many:
+			names.append(model_field.name)
+		# many-to-many and reverse relations are not our columns, they are read by separate queries anyway
+
+	for name in _ordering_fields(queryset):
+		try:
+			names.append(opts.get_field(name).name)
+		except FieldDoesNotExist:
+			pass   # an annotation
+
+	return list(dict.fromkeys(names))
+
+
+def _needs_fetch(field):
+	""" Whether rendering 'field' would load the related object its source points to (and not just its pk) """
+	if isinstance(field, relations.ManyRelatedField):
+		return True
+	if isinstance(field, relations.RelatedField):
+		return not field.use_pk_only_optimization()
+	return True
+
+
+def _walk_related(serializer, model, prefix, in_prefetch, select, prefetch):
+	for field in _serializer_fields(serializer):
+		if field.source == '*':
+			if isinstance(field, serializers.BaseSerializer):
+				_walk_related(field, model, prefix, in_prefetch, select, prefetch)
+			continue
+
+		# Follow the relations on the source path, e.g. 'user.email' => 'user' but 'user' itself is followed only if
+		# the field is going to read the related object
+		source_attrs = field.source_attrs if _needs_fetch(field) else field.source_attrs[:-1]
+		related_model, lookup, many = model, prefix, in_prefetch
+		for attr in source_attrs:
+			try:
+				model_field = related_model._meta.get_field(attr)
+			except FieldDoesNotExist:
+				break
+			if not model_field.is_relation or model_field.related_model is None:
+				break
+
+			lookup += attr
+			many = many or model_field.many_to_many or model_field.one_to_many
+			(prefetch if many else select).append(lookup)
+			lookup += '__'
+			related_model = model_field.related_model
+		else:
+			if source_attrs and isinstance(field, serializers.BaseSerializer):
+				_walk_related(field, related_model, lookup, many, select, prefetch)
+
+
+def related_lookups(serializer, model):
+	"""
+	Relations the serializer is going to walk while rendering, worked out from its (nested) fields i.e. at the depth
+	the serializer was built for
+
+	:param serializer: (list) Serializer to be used for rendering the queryset
+	:param model: Model class of the queryset
+	:return: (select_related lookups, prefetch_related lookups) tuple, so that the whole tree can be read with a
+		fixed number of queries instead of a query (or more) per row
+	"""
+	select, prefetch = [], []
+	_walk_related(serializer, model, '', False, select, prefetch)
+	return list(dict.fromkeys(select)), list(dict.fromkeys(prefetch))
@@ -0,0 +1,65 @@
+import csv
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+
+__author__ = 'chandanojha'
+
+# Rows pulled per round trip from the server-side cursor while streaming, small enough to keep the worker memory
+# flat and big enough to not pay the network latency on every row
+STREAM_CHUNK_SIZE = 2000
+
+STREAM_FORMATS = {
+	'ndjson': 'application/x-ndjson',
+	'csv': 'text/csv',
+}
+
+
+class _Echo:
+	"""
+	File-like object that just hands back what is written to it, lets csv.writer produce lines for a generator
+	instead of buffering them in a file
+	"""
+	def write(self, value):
+		return value
+
+
+def ndjson_lines(field_names, rows):
+	"""
+	:param field_names: Keys for each of the row values
+	:param rows: Iterable of value tuples (e.g. from queryset.values_list())
+	:return: generator of newline terminated JSON objects, one per row
+	"""
+	encoder = DjangoJSONEncoder(separators=(',', ':'))
+	for row in rows:
+		yield encoder.encode(dict(zip(field_names, row))) + '\n'
+
+
+def csv_lines(field_names, rows):
+	"""
+	:param field_names: Column names, written as the header line
+	:param rows: Iterable of value tuples (e.g. from queryset.values_list())
+	:return: generator of CSV lines, header first
+	"""
+	writer = csv.writer(_Echo())
+	yield writer.writerow(field_names)
+	for row in rows:
+		yield writer.writerow(row)
+
+
+def streaming_response(field_names, rows, output_format='ndjson', filename=None):
+	"""
+	Wraps the rows in a StreamingHttpResponse so that nothing but the current chunk is ever held in memory
+
+	:param field_names: Names of the values in each row
+	:param rows: Iterable of value tuples, preferably lazy (queryset.values_list().iterator())
+	:param output_format: One of STREAM_FORMATS keys
+	:param filename: If given, response is marked as an attachment with this name (extension is added)
+	"""
+	assert output_format in STREAM_FORMATS, "Unknown stream format: {0}".format(output_format)
+
+	lines = csv_lines(field_names, rows) if output_format == 'csv' else ndjson_lines(field_names, rows)
+	response = StreamingHttpResponse(lines, content_type=STREAM_FORMATS[output_format])
+	if filename:
+		response['Content-Disposition'] = 'attachment; filename="{0}.{1}"'.format(filename, output_format)
+	return response
@@ -0,0 +1,23 @@
+import logging
+
+from django.core.cache import cache
+
+__author__ = 'chandanojha'
+
+logger = logging.getLogger(__name__)
+
+
+def bump_versions(*keys):
+	"""
+	Increments the version counters at 'keys' in the cache, set to 1 if missing, so that the processes holding data
+	of an older version reload it. Cache errors are logged and not raised: the callers are mostly on_commit hooks of
+	the ingests, which must not fail once the quote is committed (the data is reloaded on a later bump)
+	"""
+	for key in keys:
+		try:
+			try:
+				cache.incr(key)
+			except ValueError:
+				cache.set(key, 1, timeout=None)
+		except Exception as e:
+			logger.warning("Could not bump the version {0}: {1}".format(key, e))
@@ -0,0 +1,159 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.core.handlers.wsgi import WSGIRequest
+from django.db import connections
+from django.http import StreamingHttpResponse
+from django.urls import Resolver404, resolve
+from django.utils.translation import ugettext_lazy as _
+from rest_framework import serializers
+from rest_framework.response import Response
+
+from .. import texts
+from ..exceptions import NotFound, ValidationError, bot_error
+from ..parsers import JSONParser
+from ..renderers import JSONRenderer
+from .generics import CreateAPIView
+
+__author__ = 'chandanojha'
+
+logger = logging.getLogger(__name__)
+
+texts.register_global_texts({
+	'batch_too_many_{0}': _("Too many requests in the batch, at most {0} are allowed"),
+	'batch_not_allowed_{0}': _("`{0}` can not be called in a batch"),
+})
+
+READ_ONLY_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+# shared by all the batches of the process, so the parallel sub-requests are bounded process wide
+_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix='batch')
+
+
+class BatchItemSerializer(serializers.Serializer):
+	method = serializers.ChoiceField(choices=('GET', 'HEAD', 'OPTIONS', 'POST', 'PUT', 'PATCH', 'DELETE'), default='GET')
+	path = serializers.RegexField(r'^/', help_text="Absolute path along with the query string, e.g. /api/v1/quotes/?page=2")
+	body = serializers.JSONField(required=False)
+	headers = serializers.DictField(child=serializers.CharField(), required=False)
+
+
+class BatchSerializer(serializers.Serializer):
+	requests = BatchItemSerializer(many=True, allow_empty=False)
+	parallel = serializers.BooleanField(default=False)
+
+
+class BatchAPIView(CreateAPIView):
+	"""
+	Runs a list of API calls in one round trip, in-process through the url resolver (middleware is not run again)
+
+		{"requests": [{"method": "GET", "path": "/api/v1/quotes/?page_size=5"},
+		              {"method": "POST", "path": "/api/v1/quotes/", "body": {...}, "headers": {...}}],
+		 "parallel": false}
+
+	The caller is authenticated once, for the batch, and the sub-requests run as the same (already resolved) user,
+	each view still checks its own permissions. Returns {"responses": [{"status", "headers", "body"}, ...]} in the
+	request order, a failing sub-request does not fail the batch.
+
+	With parallel=true the consecutive read-only (GET/HEAD/OPTIONS) sub-requests are run together in a thread pool,
+	writes always run alone in the given order
+	"""
+	serializer_class = BatchSerializer
+	max_requests = 50
+
+	def perform_create(self, serializer):
+		items = serializer.validated_data['requests']
+		if len(items) > self.max_requests:
+			raise ValidationError(texts.get_global_text('batch_too_many_{0}', self.max_requests))
+
+		if not serializer.validated_data['parallel']:
+			return Response({'responses': [self.run(item) for item in items]})
+
+		responses, reads = [], []
+		for item in items:
+			if item['method'] in READ_ONLY_METHODS:
+				reads.append(item)
+				continue
+			responses += self.run_parallel(reads)
+			responses.append(self.run(item))
+			reads = []
+		responses += self.run_parallel(reads)
+		return Response({'responses': responses})
+
+	def run_parallel(self, items):
+		if len(items) < 2:
+			return [self.run(item) for item in items]
+		return list(_executor.map(self._run_in_thread, items))
+
+	def _run_in_thread(self, item):
+		try:
+			return self.run(item)
+		finally:
+			connections.close_all()  # the thread's own connections, like at the end of a request
+
+	def run(self, item):
+		try:
+			return self.call(self.sub_request(item), item)
+		except (ValidationError, NotFound) as e:
+			return self.to_result(e.response())
+		except Exception as e:
+			logger.exception("Batch sub-request {0} {1} failed".format(item['method'], item['path']))
+			return self.to_result(bot_error(e).response())
+
+	def sub_request(self, item):
+		"""
+		:return: HttpRequest for the sub-request, with the batch request's environment, user and auth
+		"""
+		path, _, query_string = item['path'].partition('?')
+		body = JSONRenderer().render(item['body']) if 'body' in item else b''
+
+		environ = {k: v for k, v in self.request.META.items() if not k.startswith(('HTTP_', 'CONTENT_', 'wsgi.input'))}
+		environ.update({
+			'REQUEST_METHOD': item['method'],
+			'PATH_INFO': path,
+			'QUERY_STRING': query_string,
+			'CONTENT_TYPE': 'application/json',
+			'CONTENT_LENGTH': str(len(body)),
+			'wsgi.input': BytesIO(body),
+			'HTTP_HOST': self.request.get_host(),
+		})
+		environ.update({'HTTP_' + k.upper().replace('-', '_'): v for k, v in item.get('headers', {}).items()})
+		environ['HTTP_ACCEPT'] = 'application/json'  # results are embedded in our JSON
+
+		request = WSGIRequest(environ)
+		# DRF's forced authentication, the sub-request views take the user as is instead of authenticating again
+		request._force_auth_user = self.request.user
+		request._force_auth_token = self.request.auth
+		return request
+
+	def call(self, request, item):
+		try:
+			match = resolve(request.path_info)
+		except Resolver404:
+			raise NotFound(detail=item['path'])
+		if issubclass(getattr(match.func, 'view_class', object), BatchAPIView):
+			raise ValidationError(texts.get_global_text('batch_not_allowed_{0}', item['path']))
+
+		response = match.func(request, *match.args, **match.kwargs)
+		if isinstance(response, StreamingHttpResponse):
+			response.close()
+			raise ValidationError(texts.get_global_text('batch_not_allowed_{0}', item['path']))
+		if hasattr(response, 'render'):
+			response.render()
+		return self.to_result(response)
+
+	@staticmethod
+	def to_result(response):
+		if isinstance(response, Response) and not response.is_rendered:
+			response.accepted_renderer = JSONRenderer()
+			response.accepted_media_type = JSONRenderer.media_type
+			response.renderer_context = {}
+			response.render()
+
+		headers = {k: v for k, v in response.items() if k.lower() not in ('content-type', 'vary', 'allow')}
+		body = response.content
+		if body and response.get('Content-Type', '').startswith('application/json'):
+			body = JSONParser().parse(BytesIO(body))
+		elif body:
+			body = body.decode(response.charset)
+		return {'status': response.status_code, 'headers': headers, 'body': body or None}
@@ -7,13 +7,14 @@ from rest_framework import exceptions, status
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
-from .. import utils
+from .. import query_planner, utils
 from ..exceptions import (ValidationError, NotFound, Forbidden, AuthenticationError, ServiceUnavailable, ServerError,
 						  friendly_integrity_error, bot_error)
 
 __author__ = 'chandanojha'
 
 from ..generics import EmptySerializer
+from ..model_serializer import ModelSerializer
 
 from ..pagination import BOTPagination
 
@@ -103,17 +104,59 @@ class GetModelMixin(GetQuerySetMixin):
 			except ValueError:
 				pass
 	
+	def get_requested_fields(self, request=None):
+		fields = utils.query_param(request or self.request, 'fields')
+		return utils.str_list(fields) if fields else None
+	
 	def get_serializer(self, *args, **kwargs):
 		# See if client has requested only specific fields
-		fields = utils.query_param(self.request, 'fields')
+		fields = self.get_requested_fields()
 		if fields:
-			kwargs['fields'] = utils.str_list(fields)
+			kwargs['fields'] = fields
 		
 		# Set the depth for serializer if requested
 		depth = self.get_requested_depth()
 		if depth is not None:
 			kwargs['depth'] = depth
 		return super().get_serializer(*args, **kwargs)
+	
+	def project_queryset(self, queryset):
+		"""
+		Pushes the client requested 'fields' down to the SELECT, so that we don't read (and transfer) the columns
+		which are not going to be rendered anyway. Only for reads, we don't want to save a partially loaded instance
+		"""
+		if self.request.method not in ('GET', 'HEAD') or not self.get_requested_fields():
+			return queryset
+		
+		if not self._can_plan_queryset(queryset):
+			return queryset
+		
+		fields = query_planner.projected_fields(self.get_serializer(), queryset)
+		return queryset.only(*fields) if fields else queryset
+	
+	def plan_related(self, queryset):
+		"""
+		Applies select_related/prefetch_related for the relations the serializer is going to expand at the requested
+		'depth' (and 'fields'), so that nested lists are read with a fixed number of queries instead of one per row
+		"""
+		if not self._can_plan_queryset(queryset):
+			return queryset
+		
+		select, prefetch = query_planner.related_lookups(self.get_serializer(), queryset.model)
+		if select:
+			queryset = queryset.select_related(*select)
+		if prefetch:
+			queryset = queryset.prefetch_related(*prefetch)
+		return queryset
+	
+	def _can_plan_queryset(self, queryset):
+		# Only our ModelSerializer knows about requested 'fields' and 'depth', and values()/values_list() or union
+		# querysets have nothing to load or defer
+		return issubclass(self.get_serializer_class(), ModelSerializer) and isinstance(queryset, models.QuerySet) \
+			and not queryset.query.values_select and not queryset.query.combinator
+	
+	def filter_queryset(self, queryset):
+		return self.project_queryset(self.plan_related(super().filter_queryset(queryset)))
 
 
 class RetrieveModelMixin(GetModelMixin):
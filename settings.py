@@ -59,7 +59,21 @@ REST_FRAMEWORK = {
 
 }
 
-# REST_FRAMEWORK['DEFAULT_RENDERER_CLASSES'] = ['rest_framework.renderers.JSONRenderer']
+REST_FRAMEWORK['DEFAULT_RENDERER_CLASSES'] = [
+	'labs.renderers.JSONRenderer',  # orjson based, drop-in for rest_framework.renderers.JSONRenderer
+	'labs.renderers.ColumnarJSONRenderer',  # ?format=columnar
+	'labs.renderers.MessagePackRenderer',  # ?format=msgpack
+]
+if DEBUG:
+	# browsable api only for development, live clients never ask for text/html
+	REST_FRAMEWORK['DEFAULT_RENDERER_CLASSES'].insert(1, 'rest_framework.renderers.BrowsableAPIRenderer')
+
+REST_FRAMEWORK['DEFAULT_PARSER_CLASSES'] = [
+	'labs.parsers.JSONParser',
+	'rest_framework.parsers.FormParser',
+	'rest_framework.parsers.MultiPartParser',
+]
+
 SWAGGER_PATH = 'docs/'
 
 SWAGGER_SETTINGS = {
@@ -200,5 +214,37 @@ CELERY_ACCEPT_CONTENT = ['application/json']
 CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = 'Africa/Nairobi'
+CELERY_TRACK_STARTED = True  # so that async quote jobs can report 'running'
+
+# Redis pub/sub fan-out of newly ingested quotes (from celery workers) to the live quote streams of the web processes,
+# set it to None for in-process only fan-out
+QUOTE_PUBSUB_URL = BROKER_URL
+
+# Cross rates are triangulated through this currency (see currency.cross), quoting N currencies against it covers
+# all the N² pairs
+QUOTE_PIVOT_CURRENCY = 'USD'
+
+# Latest rates multiplying round a cycle of currencies to more than 1 + this are reported as inconsistent (see
+# currency.arbitrage), below it is taken as noise
+QUOTE_INCONSISTENCY_THRESHOLD = 0.001
+
+# Rolling statistics of each pair are kept over its last N quotes for each of these N (see currency.stats)
+QUOTE_STATS_WINDOWS = (20, 100, 500)
+
+# New quotes are POSTed to the webhook subscribers in one batch per subscriber every this many seconds (see
+# currency.webhooks)
+QUOTE_WEBHOOK_FLUSH_INTERVAL = 1.0
+
+# The change feed (quotes/changes/) and the stats sync hold the quotes back while transactions that may commit
+# smaller ids are in flight, but wait no longer than this many seconds for any one transaction (see currency.models)
+QUOTE_CHANGES_MAX_HOLD_BACK = 60
+
+# shared by the web and worker processes e.g. for the latest rates snapshot (see currency.snapshot)
+CACHES = {
+	'default': {
+		'BACKEND': 'django_redis.cache.RedisCache',
+		'LOCATION': 'redis://localhost:6379/1',
+	}
+}
 
 API_KEY = config('API_KEY')
\ No newline at end of file
@@ -15,7 +15,11 @@ Including another URLconf
 from django.conf.urls import url
 from django.urls import include
 
+from currency.urls import async_urlpatterns as currency_async_urlpatterns
+
 from auth.staff.urls import admin_staff_urlpatterns, staff_urlpatterns
+from auth.staff.views import StaffBatchView
+from labs import asgi
 from labs.views.swagger import get_swagger_view
 
 
@@ -25,5 +29,9 @@ urlpatterns = [
 
 	url(r'^docs/', schema_view),
 	url(r'^api/v1/', include('currency.urls')),
+	url(r'^api/v1/batch/$', StaffBatchView.as_view(), name='batch'),
 
 ]+admin_staff_urlpatterns+staff_urlpatterns
+
+# (pattern, async view) routes for asgi.py, matched against the full path
+async_urlpatterns = asgi.include(r'^/api/v1/', currency_async_urlpatterns)